@@ -1,12 +1,13 @@
 {
     'name': 'VAT Accounting Integration',
     'category': 'Accounting/Localizations/EDI',
-    'version': '1.0',
+    'version': '1.1',
     'depends': ['account', 'accountant', 'enovasions_vms_integration'],
     'summary': 'VAT Accouting Customisation',
     'data': [
         'security/ir.model.access.csv',
         'data/ir_cron.xml',
+        'data/ir_sequence.xml',
         'data/payment_type_data.xml',
         # 'data/tax_demo_data.xml', 
         'report/frcs_template.xml',
@@ -17,6 +18,8 @@
         'views/account_move_views.xml',
         'views/account_journal_views.xml',
         'views/account_payment_view.xml',
+        'views/frcs_fiscal_queue_views.xml',
+        'views/frcs_submission_ledger_views.xml',
         'report/report_frcs_invoice.xml',
         'data/paperformat.xml',
         'report/report_frcs_invoice_thermal.xml',
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from odoo import http
+from odoo.http import request
+import base64
+
+
+class FrcsQrController(http.Controller):
+
+    @http.route('/frcs/qr/<string:checksum>.png', type='http', auth='user', readonly=True)
+    def frcs_qr_code(self, checksum, **kwargs):
+        """Serve a stored VSDC QR; the URL is keyed by content so it never goes stale."""
+        if request.httprequest.headers.get('If-None-Match') == '"%s"' % checksum:
+            return request.make_response(b'', status=304)
+        qr = request.env['frcs.qr.code'].sudo().search([('checksum', '=', checksum)], limit=1)
+        if not qr:
+            raise request.not_found()
+        return request.make_response(base64.b64decode(qr.data), headers=[
+            ('Content-Type', 'image/png'),
+            ('Cache-Control', 'private, max-age=31536000, immutable'),
+            ('ETag', '"%s"' % checksum),
+        ])
+
+    @http.route('/frcs/receipt/<int:move_id>.<string:fmt>', type='http', auth='user', readonly=True)
+    def frcs_thermal_receipt(self, move_id, fmt, **kwargs):
+        """Lightweight thermal receipt, as printable HTML or raw ESC/POS."""
+        if fmt not in ('html', 'escpos'):
+            raise request.not_found()
+        move = request.env['account.move'].browse(move_id).exists()
+        if not move:
+            raise request.not_found()
+        move.check_access('read')
+        content = move.sudo()._render_thermal_receipt(fmt)
+        if fmt == 'html':
+            return request.make_response(content, headers=[('Content-Type', 'text/html; charset=utf-8')])
+        return request.make_response(content, headers=[
+            ('Content-Type', 'application/octet-stream'),
+            ('Content-Disposition', 'attachment; filename="FRCS-%s.bin"' % move.id),
+        ])
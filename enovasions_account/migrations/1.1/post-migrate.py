@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    # QR codes now live in frcs.qr.code: drop the attachments of the former Image fields
+    env['frcs.qr.code']._purge_legacy_attachments()
+
+    # the tax cron is noupdate: move existing databases off the daily full scan
+    cron = env.ref('enovasions_account.ir_cron_update_sales_taxes', raise_if_not_found=False)
+    if cron:
+        cron.write({
+            'code': 'model._cron_apply_tax_boundaries()',
+            'interval_number': 1,
+            'interval_type': 'weeks',
+        })
+        env['product.timeline.tax']._schedule_next_boundary()
@@ -1,6 +1,10 @@
 from . import product_template
 from . import res_partner
 from . import product_tax_timeline
+from . import frcs_qr_code
+from . import frcs_payload_builder
 from . import account_move
 from . import account_journal
 from . import account_payment
+from . import frcs_fiscal_queue
+from . import frcs_submission_ledger
@@ -1,11 +1,13 @@
 # -*- coding: utf-8 -*-
-from odoo import api, exceptions, fields, models, _
-from odoo.exceptions import ValidationError
+from odoo import api, exceptions, fields, models, tools, _
+from odoo.exceptions import UserError, ValidationError
+from odoo.addons.enovasions_vms_integration.tools import qr_image, receipt_render, vsdc_pool, vsdc_response
 from urllib3 import PoolManager
 from urllib3.contrib import pyopenssl
 from datetime import datetime, timezone
 import requests
 import base64
+import hashlib
 import json
 import ssl
 import os
@@ -14,41 +16,52 @@ from PIL import Image
 import pytz
 from dateutil import parser
 import sys
+import time
 from odoo.tools import float_is_zero
 
 import logging
 _logger = logging.getLogger(__name__)
 
+# attachment name of a pre-rendered thermal receipt: move id and thermal_pdf_key
+THERMAL_PDF_NAME = 'FRCS-%s-%s.pdf'
+# fields shown on the thermal receipt: changing them invalidates the cached PDF
+THERMAL_PDF_FIELDS = {'is_post_status', 'post_response', 'copy_post_response', 'is_copy_post_status'}
 
-class AccountPaymentRegister(models.TransientModel):
-    _inherit = 'account.payment.register'
-
-    def action_create_payments(self):
-        result = super().action_create_payments()
-        invoices = self.line_ids.mapped('move_id').filtered(lambda m: m.move_type == 'out_invoice')
-        if invoices:
-            payments = self.env['account.payment'].search([
-                ('invoice_ids', 'in', invoices.ids),
-                ('state', '=', 'in_process')
-            ])
-            for payment in payments:
-                payment.action_validate()
-        return result
+THERMAL_MODE_LABELS = {
+    'NS': 'NORMAL SALE',
+    'NR': 'NORMAL REFUND',
+    'AS': 'PROFORMA SALE',
+    'AR': 'PROFORMA REFUND',
+    'TS': 'TRAINING SALE',
+    'TR': 'TRAINING REFUND',
+}
 
 
 class AccountMoveInherit(models.Model):
     _inherit = 'account.move'
+    _rec_names_search = ['name', 'partner_id.name', 'ref', 'ref_doc_num', 'origin_doc_num']
 
     post_response = fields.Text("Post response",readonly=True,copy=False)
-    post_response_json = fields.Json(string="Post Response JSON", compute="_compute_post_response_json", store=False,copy=False)
-    qr_code =fields.Image(string="QR Code",attachment=True,store=True,copy=False,readonly=True)
+    post_response_json = fields.Json(string="Post Response JSON", compute="_compute_post_response_json", store=True,copy=False)
+    # ****** Hot keys of the parsed response
+    sdc_invoice_number = fields.Char("SDC Invoice Number", compute="_compute_post_response_json", store=True, index=True, copy=False)
+    sdc_date_time = fields.Datetime("SDC Date Time", compute="_compute_post_response_json", store=True, index=True, copy=False)
+    sdc_invoice_counter = fields.Char("SDC Invoice Counter", compute="_compute_post_response_json", store=True, copy=False)
+    sdc_total_amount = fields.Float("SDC Total Amount", compute="_compute_post_response_json", store=True, copy=False)
+    qr_code_id = fields.Many2one("frcs.qr.code", string="QR Code Record", copy=False, readonly=True)
+    qr_code = fields.Image(string="QR Code", compute="_compute_qr_code", inverse="_inverse_qr_code", copy=False, readonly=True)
     is_post_status = fields.Boolean(default=False,string="Post Status",copy=False)
+    fiscal_queue_ids = fields.One2many("frcs.fiscal.queue", "move_id", string="Fiscal Queue Jobs", copy=False)
     #******Copy fields
     copy_post_response = fields.Text("Post Copy Response",readonly=True,copy=False)
-    copy_post_response_json = fields.Json(string="Post Copy Response JSON", compute="_compute_post_copy_response_json", store=False,copy=False)
-    copy_qr_code =fields.Image(string="QR Code",attachment=True,store=True,copy=False,readonly=True)
+    copy_post_response_json = fields.Json(string="Post Copy Response JSON", compute="_compute_post_copy_response_json", store=True,copy=False)
+    copy_qr_code_id = fields.Many2one("frcs.qr.code", string="Copy QR Code Record", copy=False, readonly=True)
+    copy_qr_code = fields.Image(string="QR Code", compute="_compute_copy_qr_code", inverse="_inverse_copy_qr_code", copy=False, readonly=True)
     is_copy_post_status = fields.Boolean(default=False,string="Copy Post Status",copy=False)
     #******END Coy fields
+    #******Pre-rendered thermal receipt
+    thermal_pdf_key = fields.Char("Thermal Receipt Key", compute="_compute_thermal_pdf_key", store=True, copy=False)
+    thermal_pdf_pending = fields.Boolean("Thermal Receipt To Render", copy=False, index=True)
     system_id = fields.Many2one("branch.systems",string="System",required=True,copy=False)
     invoice_type = fields.Selection([
             ('normal', 'Normal'),
@@ -58,9 +71,9 @@ class AccountMoveInherit(models.Model):
             ('invoice', 'Invoice'),
             ('refund', 'Refund')], 
             default='invoice', string="Transaction Type")
-    ref_doc_num = fields.Text("Reference Doc No", copy=False, compute="_compute_ref_doc_fields", store=True)
+    ref_doc_num = fields.Char("Reference Doc No", copy=False, compute="_compute_ref_doc_fields", store=True, index='trigram')
     ref_doc_date= fields.Datetime("Reference Doc Date", copy=False, compute="_compute_ref_doc_fields", store=True)
-    origin_doc_num = fields.Text("SDC Invoice No", copy=False)
+    origin_doc_num = fields.Char("SDC Invoice No", copy=False, index='trigram')
     origin_doc_date= fields.Datetime("SDC Time", copy=False)
     copy_ref_doc_num = fields.Text("Copy Reference Doc No", copy=False)
     show_send_request_btn = fields.Boolean(compute='_compute_show_send_button', store=True)
@@ -88,27 +101,203 @@ class AccountMoveInherit(models.Model):
         self._onchange_show_send_button()
         return res
 
-    @api.depends('post_response')
+    @api.depends('sdc_invoice_number', 'sdc_date_time')
     def _compute_ref_doc_fields(self):
         for rec in self:
             if rec.post_response:
-                response_data = json.loads(rec.post_response)
-                sdc_datetime_str = response_data.get('sdcDateTime')
-
-                if sdc_datetime_str:
-                    sdc_datetime_obj = datetime.fromisoformat(sdc_datetime_str)
-                    sdc_datetime_utc = sdc_datetime_obj.astimezone(timezone.utc)
-                    rec.ref_doc_date = sdc_datetime_utc.replace(tzinfo=None) or False
-
-                rec.ref_doc_num = response_data.get('invoiceNumber', False)
+                rec.ref_doc_date = rec.sdc_date_time
+                rec.ref_doc_num = rec.sdc_invoice_number
 
     @api.depends('post_response')
     def _compute_post_response_json(self):
+        """Parse the response once, on receipt, into jsonb and the typed sdc_* columns."""
+        for record in self:
+            data = vsdc_response.parse(record.post_response)
+            record.post_response_json = data
+            record.update(vsdc_response.sdc_values(data))
+
+    # QR codes live in frcs.qr.code; documents fiscalized before that rebuild theirs from the response
+    @api.depends('qr_code_id', 'post_response')
+    def _compute_qr_code(self):
+        QrCode = self.env['frcs.qr.code']
+        for record in self:
+            record.qr_code = record.qr_code_id.sudo().data or QrCode._from_response(record.post_response)
+
+    def _inverse_qr_code(self):
+        for record in self:
+            record.qr_code_id = self.env['frcs.qr.code']._get_or_create(record.qr_code)
+
+    @api.depends('copy_qr_code_id', 'copy_post_response')
+    def _compute_copy_qr_code(self):
+        QrCode = self.env['frcs.qr.code']
+        for record in self:
+            record.copy_qr_code = record.copy_qr_code_id.sudo().data or QrCode._from_response(record.copy_post_response)
+
+    def _inverse_copy_qr_code(self):
+        for record in self:
+            record.copy_qr_code_id = self.env['frcs.qr.code']._get_or_create(record.copy_qr_code)
+
+    # ********* Pre-rendered thermal receipt *********
+    @api.depends('post_response', 'copy_post_response', 'is_copy_post_status')
+    def _compute_thermal_pdf_key(self):
         for record in self:
+            content = '%s|%s|%s' % (record.post_response or '', record.copy_post_response or '', record.is_copy_post_status)
+            record.thermal_pdf_key = hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+
+    def write(self, vals):
+        res = super().write(vals)
+        if THERMAL_PDF_FIELDS.intersection(vals) and not self.env.context.get('frcs_thermal_rendering'):
+            fiscalized = self.filtered('is_post_status')
+            if fiscalized:
+                # the cached receipt no longer matches the document
+                super(AccountMoveInherit, fiscalized).write({'thermal_pdf_pending': True})
+                self.env.ref('enovasions_account.ir_cron_render_thermal_pdf').sudo()._trigger()
+        return res
+
+    def _thermal_pdf_name(self):
+        """Attachment name of the thermal receipt of the move's current content."""
+        self.ensure_one()
+        return THERMAL_PDF_NAME % (self.id, self.thermal_pdf_key)
+
+    def _get_thermal_pdf_attachments(self):
+        """The cached thermal receipts of the moves, by move id, in one search.
+
+        The name embeds thermal_pdf_key, so a hit is never stale.
+        """
+        fiscalized = self.filtered('is_post_status')
+        if not fiscalized:
+            return {}
+        attachments = self.env['ir.attachment'].sudo().search([
+            ('res_model', '=', self._name),
+            ('res_id', 'in', fiscalized.ids),
+            ('name', 'in', [move._thermal_pdf_name() for move in fiscalized]),
+        ])
+        return {attachment.res_id: attachment for attachment in attachments}
+
+    @api.model
+    def _cron_render_thermal_pdfs(self, limit=20):
+        """Render the thermal receipts of newly fiscalized or changed moves, once each."""
+        report = self.env.ref('enovasions_account.action_report_frcs_invoice_thermal')
+        moves = self.search([('thermal_pdf_pending', '=', True)], limit=limit)
+        for move in moves:
             try:
-                record.post_response_json = json.loads(record.post_response) if record.post_response else {}
-            except (json.JSONDecodeError, TypeError):
-                record.post_response_json = {}
+                stale = self.env['ir.attachment'].search([
+                    ('res_model', '=', move._name),
+                    ('res_id', '=', move.id),
+                    ('name', '=like', THERMAL_PDF_NAME % (move.id, '%')),
+                ])
+                stale.unlink()
+                self.env['ir.actions.report']._render_qweb_pdf(report, move.ids)
+                move.with_context(frcs_thermal_rendering=True).thermal_pdf_pending = False
+                if not tools.config['test_enable']:
+                    self.env.cr.commit()
+            except Exception:
+                self.env.cr.rollback()
+                _logger.exception("Pre-rendering the thermal receipt of %s failed", move.name)
+                move.with_context(frcs_thermal_rendering=True).thermal_pdf_pending = False
+        if len(moves) == limit:
+            self.env.ref('enovasions_account.ir_cron_render_thermal_pdf')._trigger()
+
+    # ********* Lightweight thermal receipt *********
+    def _thermal_receipt_payments(self):
+        """``(method name, amount)`` pairs printed under the total."""
+        return []
+
+    def _get_thermal_receipt_data(self):
+        """The content of the thermal receipt, for ``receipt_render``."""
+        self.ensure_one()
+        data = self.post_response_json or {}
+        ext_code = data.get('invoiceCounterExtension') or ''
+        pending = not self.is_post_status and self.sudo().fiscal_queue_ids.filtered(
+            lambda j: j.is_offline and j.state != 'done')[:1]
+        return {
+            'fiscal': not (self.is_copy_post_status or ext_code in ('TS', 'TR', 'AS', 'AR')),
+            'copy': self.is_copy_post_status,
+            'pending_sequence': pending and pending.sequence,
+            'tin': data.get('tin', ''),
+            'business_name': data.get('businessName', ''),
+            'address': data.get('address', ''),
+            'cashier': self.user_id.name or '',
+            'buyer': self.partner_id.name or '',
+            'pos_number': self.name or '',
+            'pos_time': data.get('sdcDateTime', ''),
+            'mode_label': THERMAL_MODE_LABELS.get(ext_code, ''),
+            'items': [{
+                'name': line.product_id.name or '',
+                'taxed': bool(line.tax_ids),
+                'price_unit': line.price_unit,
+                'quantity': line.quantity,
+                'subtotal': line.price_subtotal,
+            } for line in self.invoice_line_ids],
+            'total': self.amount_total,
+            'payments': self._thermal_receipt_payments(),
+            'tax_items': data.get('taxItems') or [],
+            'sdc_time': data.get('sdcDateTime', ''),
+            'sdc_invoice_number': data.get('invoiceNumber', ''),
+            'invoice_counter': data.get('invoiceCounter', ''),
+            'qr_png': self.qr_code and base64.b64decode(self.qr_code),
+            'qr_url': data.get('verificationUrl') or False,
+        }
+
+    def _render_thermal_receipt(self, fmt='html'):
+        """Render the thermal receipt without QWeb nor wkhtmltopdf.
+
+        ``fmt`` is ``'html'`` (str) or ``'escpos'`` (bytes for the printer).
+        """
+        self.ensure_one()
+        if fmt == 'escpos':
+            return receipt_render.render_escpos(self._get_thermal_receipt_data())
+        if fmt == 'html':
+            return receipt_render.render_html(self._get_thermal_receipt_data())
+        raise UserError(_("Unknown receipt format: %s", fmt))
+
+    def _benchmark_thermal_receipt(self, rounds=10):
+        """Mean milliseconds per receipt of the lightweight and the PDF paths.
+
+        Meant for ``odoo-bin shell``; the PDF path bypasses the cached attachment.
+        """
+        report = self.env.ref('enovasions_account.action_report_frcs_invoice_thermal')
+        reports = self.env['ir.actions.report'].with_context(report_pdf_no_attachment=True)
+
+        def run(func):
+            started = time.perf_counter()
+            for _i in range(rounds):
+                for move in self:
+                    func(move)
+            return (time.perf_counter() - started) * 1000 / (rounds * len(self) or 1)
+
+        result = {
+            'html_ms': run(lambda move: move._render_thermal_receipt('html')),
+            'escpos_ms': run(lambda move: move._render_thermal_receipt('escpos')),
+            'pdf_ms': run(lambda move: reports._render_qweb_pdf(report, move.ids)),
+        }
+        _logger.info("Thermal receipt: html %(html_ms).1f ms, escpos %(escpos_ms).1f ms, "
+                     "pdf %(pdf_ms).1f ms", result)
+        return result
+
+    @api.model
+    def lookup_by_sdc_number(self, numbers):
+        """Resolve a batch of SDC invoice numbers to the documents carrying them.
+
+        Returns ``{number: [{'model', 'id', 'display_name', 'field'}]}``; a
+        refund is found both by its own number and by the one it refers to.
+        """
+        numbers = list({number.strip() for number in numbers or [] if number and number.strip()})
+        result = {number: [] for number in numbers}
+        if numbers:
+            for number, document in self._lookup_sdc_documents(numbers):
+                result[number].append(document)
+        return result
+
+    @api.model
+    def _lookup_sdc_documents(self, numbers):
+        """Yield ``(number, document)`` matches; one indexed query per model."""
+        wanted = set(numbers)
+        moves = self.search(['|', ('ref_doc_num', 'in', numbers), ('origin_doc_num', 'in', numbers)])
+        for move in moves:
+            for field in ('ref_doc_num', 'origin_doc_num'):
+                if move[field] in wanted:
+                    yield move[field], {'model': move._name, 'id': move.id, 'display_name': move.display_name, 'field': field}
 
     def _reverse_moves(self, default_values_list=None, cancel=False):
         self = self.with_context(_reverse_move=True)
@@ -133,33 +322,12 @@ class AccountMoveInherit(models.Model):
                     raise ValueError("Invalid JSON format in post_response")
 
             if qr_code_base64:
-                # Remove 'data:image/png;base64,' prefix if present
-                if qr_code_base64.startswith("data:image"):
-                    qr_code_base64 = qr_code_base64.split(",")[1]
-
                 try:
-                    # Strip spaces and fix padding if necessary
-                    qr_code_base64 = qr_code_base64.strip()
-                    # missing_padding = len(qr_code_base64) % 4
-                    # if missing_padding:
-                    #     qr_code_base64 += "=" * (4 - missing_padding)
-
-                    # Decode Base64
-                    decoded_qr = base64.b64decode(qr_code_base64)
-
-                    # Convert to image using PIL (Python Imaging Library)
-                    image = Image.open(io.BytesIO(decoded_qr))
-
-                    # Convert the image to PNG format (Odoo prefers PNG images)
-                    img_io = io.BytesIO()
-                    image.save(img_io, format="PNG")
-                    img_io.seek(0)
-
-                    # Store in Odoo's Image field
-                    record.qr_code = base64.b64encode(img_io.getvalue())
-                except Exception as e:
+                    # the VSDC already sends PNG, PIL only converts other formats
+                    record.qr_code = qr_image.qr_to_png_base64(qr_code_base64)
+                except ValueError:
                     record.qr_code = False
-                    raise ValueError(f"Error Decoding Base64: {str(e)}")
+                    raise
             else:
                 record.qr_code = False
                 raise ValueError("No QR Code Found in Response")
@@ -184,227 +352,218 @@ class AccountMoveInherit(models.Model):
 
             return False
 
-    def action_send_request(self):
-        for record in self:
-            if record.system_id:
-                if not (self._check_full_payment()):
-                    if not record.partner_id.charge_customer:
-                        raise ValidationError('The invoice has not been fully paid. Please complete the full payment to proceed')
+    def _prepare_frcs_request(self):
+        """Validate the move's certification and build its VSDC invoice payload.
 
-                if record.system_id.pfx_status == True:
-                    if record.move_type in ['out_invoice','out_refund']:
-                        # Fetch values from system parameters
-                        # path = record.system_id.pfx_file_path
-
-                        # base_path = "C:/Program Files/Odoo 18.0.2025090/VSDC/"
-
-                        # cert_file = os.path.join(base_path, "certificate.pem")
-                        # key_file = os.path.join(base_path, "private_key.pem")
-
-                        # print("cert_file",cert_file)
-                        # print("key_file",key_file)
-
-                        # password = record.system_id.pfx_password
-                        # pac_value = record.system_id.pfx_pac
-                        # pfx_expiry_date = record.system_id.pfx_expiry_date
-
-                        path = record.system_id.pfx_file_path
-
-                        cert_file = os.path.join(os.path.dirname(path), "certificate.pem")
-                        key_file = os.path.join(os.path.dirname(path), "private_key.pem")
-
-                        print("cert_file",cert_file)
-                        print("key_file",key_file)
-
-                        password = record.system_id.pfx_password
-                        pac_value = record.system_id.pfx_pac
-                        pfx_expiry_date = record.system_id.pfx_expiry_date
-                      
-                        if not cert_file or not key_file or not password or not pac_value:
-                            raise ValidationError(_("Please configure the required certification in Branch Systems."))
-
-                        if pfx_expiry_date < datetime.now():
-                            raise ValidationError(_("Certification in Branch Systems is expired."))
-                        
-                        if record.order_type =='advance': 
-                            invoiceType = "Advance"
-                        elif record.order_type =='training': 
-                            invoiceType = "Training"
-                        else: 
-                            invoiceType = "Normal"   
-
-                        if record.move_type =='out_invoice':
-                            transactionType = "Sale"
-
-                        if record.move_type =='out_refund':
-                            transactionType = "Refund"    
-
-                        invoice_data = {
-                            'dateAndTimeOfIssue':record.create_date.strftime('%Y-%m-%d %H:%M:%S') if record.create_date else None,
-                            'cashier':record.invoice_user_id.vat,
-                            'buyerId':record.partner_id.id,
-                            'buyerCostCenterId':record.buyer_cost_centerid or None,
-                            'invoiceType':invoiceType,
-                            'transactionType':transactionType, 
-                            'payment': [],              
-                            'invoiceNumber': '32/2.01',
-                            'referentDocumentNumber':'', #passig null
-                            'referentDocumentDT':'', #hardcoded value
-                            'items': []
-                        }
-                        
-                        if record.move_type == 'out_refund':
-                            if record.reversed_entry_id:
-                                invoice_data['referentDocumentNumber'] = record.reversed_entry_id.ref_doc_num
-                                invoice_data['referentDocumentDT'] = record.reversed_entry_id.ref_doc_date.strftime('%Y-%m-%d %H:%M:%S') if record.reversed_entry_id.ref_doc_date else '' 
-                          
-                        # Add line items (invoice lines)
-                        for line in record.invoice_line_ids:
-                            if  line.product_id.is_charging != True: 
-                                tax_labels =[]
-                                # Add tax lines (tax_ids)
-                                for tax in line.tax_ids:
-                                    tax_labels.append(tax.invoice_label)
-                                # print("tax_labels",tax_labels)  
-
-                                invoice_data["items"].append({
-                                    # "gtin":"XX",
-                                    "name": line.product_id.name,
-                                    "quantity": line.quantity,
-                                    "discount": line.discount,
-                                    "unitPrice": line.price_unit,
-                                    "totalAmount": line.price_total,
-                                    "labels":tax_labels
-                                })
-
-                        # Add payment (matched_payment_ids) for Normal Sale & POS
-                        if record.pos_payment_ids:
-                            payments = record.pos_payment_ids
-                        elif record.payment_ids:
-                            payments = record.payment_ids
-                        else:
-                            payments = False
-
-                        if record.pos_payment_ids:
-                            print("pos order invoice")
-                            for pos_payment in record.pos_payment_ids:
-                                pos_payment_type=pos_payment.payment_method_id.name
-                                if pos_payment_type =='Cash':
-                                    type=1
-                                elif pos_payment_type =='Card':
-                                    type=2
-                                else:
-                                    type=0
-
-                                invoice_data["payment"].append({
-                                    "amount": pos_payment.amount,
-                                    "paymentType": type
-                                })
-                                # vms_payment_type=pos_payment.vms_payment_type
-                                # payment_type = 0
-                                # if vms_payment_type and vms_payment_type.payment_type:
-                                #     payment_type = int(vms_payment_type.payment_type)
-
-                                # invoice_data["payment"].append({
-                                #     "amount": pos_payment.amount,
-                                #     "paymentType": payment_type
-                                # })
-                        else:
-                            print("Normal Invoice") 
-                            if record.partner_id.charge_customer != True and record.move_type =='out_invoice':
-                                if not record.matched_payment_ids: 
-                                    raise ValidationError(_("Payment Not collected."))
-
-                                for payment in record.matched_payment_ids:
-                                    if payment.state == 'paid':
-                                        vms_payment_type=payment.vms_payment_type
-                                        payment_type = False
-                                        if vms_payment_type and vms_payment_type.payment_type:
-                                            payment_type = vms_payment_type.payment_type
-
-                                        if payment_type:
-                                            invoice_data["payment"].append({
-                                                "amount": payment.amount,
-                                                "paymentType": int(payment_type)
-                                            })
-                            else:
-                                print("Charge Customer",record.amount_total)
-                                invoice_data["payment"].append({
-                                    "amount": record.amount_total,
-                                    "paymentType": 0 #other type
-                                })
-
-                        print("*****Final Json request*****",invoice_data)   
-
-                        url = "https://vsdc.sandbox.vms.frcs.org.fj/api/v3/invoices"
-                        context = ssl.create_default_context()
-                        context.load_cert_chain(certfile=cert_file, keyfile=key_file, password=password)  
-                        http = PoolManager(ssl_context=context)
-
-                        # Include PAC in headers
-                        headers = {
-                            "Content-Type": "application/json",
-                            "Accept": "application/json",
-                            "PAC": pac_value  
-                        }
-
-                        response = http.request(
-                           "POST", url,
-                            body=json.dumps(invoice_data),
-                            headers=headers
-                        )
-                        
-                        _logger.info("FRCS response status: %s", response.status)  
-                        
-                        if response.status == 200 or response.status == 201:
-                            record.post_response = response.data #storing response
-                            record.is_post_status = True
-                            if record.move_type == 'out_refund':
-                                if record.reversed_entry_id:
-                                    record.origin_doc_num =  record.reversed_entry_id.ref_doc_num
-                                    record.origin_doc_date = record.reversed_entry_id.ref_doc_date
-                            record.action_generate_qr()
+        Returns the payload builder's request (``payload``, serialized ``body``
+        and ``transaction_type``), or False when the move is not a customer
+        invoice or refund.
+        """
+        self.ensure_one()
+        record = self
+        if not record.system_id:
+            raise ValidationError(("Please configure the required Branch Certification."))
 
-                            # Add success log message in chatter
-                            log_message = "✅ %s invoice request successfully sent by %s on %s." % (
-                                transactionType,
-                                self.env.user.name,
-                                datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                            )
-                            record.message_post(body=log_message)
-                            self._onchange_show_send_button()
-
-                            # ✅ Success popup
-                            return {
-                                'type': 'ir.actions.client',
-                                'tag': 'display_notification',
-                                'params': {
-                                    'title': 'Success',
-                                    'message': '%s invoice posted successfully and QR generated.' % transactionType,
-                                    'type': 'success',
-                                    'sticky': False,
-                                    'next': {
-                                            'type': 'ir.actions.client',
-                                            'tag': 'reload',
-                                        }
-                                }
-                            }
-                            
-                        else:
-                            raise ValidationError(("Request failed with status code. Data: %s") % response.data.decode("utf-8"))
+        if not (record._check_full_payment()):
+            if not record.partner_id.charge_customer:
+                raise ValidationError('The invoice has not been fully paid. Please complete the full payment to proceed')
+
+        if record.system_id.pfx_status != True:
+            raise ValidationError(("Please Upload PFX for Mapped System."))
+
+        if record.move_type not in ['out_invoice','out_refund']:
+            return False
+
+        builder = self.env['frcs.payload.builder']
+        builder._check_system(record.system_id)
+        return builder._build_move_request(record)
+
+    def _process_frcs_response(self, response, transaction_type):
+        """Store a VSDC invoice response on the move and return the success notification."""
+        self.ensure_one()
+        record = self
+        _logger.info("FRCS response status: %s", response.status)  
+
+        if response.status not in (200, 201):
+            raise ValidationError(("Request failed with status code. Data: %s") % response.data.decode("utf-8"))
+
+        record.post_response = response.data #storing response
+        record.is_post_status = True
+        if record.move_type == 'out_refund':
+            if record.reversed_entry_id:
+                record.origin_doc_num =  record.reversed_entry_id.ref_doc_num
+                record.origin_doc_date = record.reversed_entry_id.ref_doc_date
+        record.action_generate_qr()
+
+        # Add success log message in chatter
+        log_message = "✅ %s invoice request successfully sent by %s on %s." % (
+            transaction_type,
+            self.env.user.name,
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        )
+        record.message_post(body=log_message)
+        record._onchange_show_send_button()
+
+        # ✅ Success popup
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Success',
+                'message': '%s invoice posted successfully and QR generated.' % transaction_type,
+                'type': 'success',
+                'sticky': False,
+                'next': {
+                        'type': 'ir.actions.client',
+                        'tag': 'reload',
+                    }
+            }
+        }
+
+    def action_send_request(self):
+        action = False
+        failures = []
+        for record in self:
+            action, error = record._send_frcs_request()
+            if error:
+                failures.append((record, error))
+        if failures:
+            # reported, not raised: the transaction keeps the ledger entries
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': _('Send to FRCS'),
+                    'message': "\n".join("%s: %s" % (move.name, error) for move, error in failures),
+                    'type': 'danger',
+                    'sticky': True,
+                    'next': {'type': 'ir.actions.client', 'tag': 'reload'},
+                }
+            }
+        return action
+
+    def _send_frcs_request(self):
+        """Build and submit the move's VSDC payload, see ``_submit_frcs_payload``.
+
+        Invalid moves raise before anything is sent.
+        """
+        self.ensure_one()
+        if self.is_post_status:
+            # already fiscalized, a second post would duplicate the fiscal counter
+            return False, None
+        request = self._prepare_frcs_request()
+        if not request:
+            return False, None
+        return self._submit_frcs_payload(request['body'], request['transaction_type'])
+
+    def _submit_frcs_payload(self, body, transaction_type):
+        """Post an already serialized invoice payload and store the VSDC response.
+
+        Returns ``(action, error)``. Once the payload may have reached the VSDC
+        nothing is raised: a failed send or response processing is returned,
+        so the caller's transaction commits the ledger entry of the attempt
+        and a later retry cannot fiscalize the invoice twice.
+        """
+        self.ensure_one()
+        send = self.system_id._vsdc_invoice_request(body)
+        response, error = self.env['frcs.submission.ledger']._submit(self, body, send)
+        if error:
+            return False, error
+        try:
+            with self.env.cr.savepoint():
+                return self._process_frcs_response(response, transaction_type), None
+        except Exception as e:
+            _logger.warning("FRCS response of %s not processed: %s", self.name, e)
+            return False, e
+
+    def action_bulk_send_request(self):
+        """Fiscalize a batch of posted invoices with concurrent VSDC calls.
+
+        Payloads are built here on prefetched records, the HTTP calls run on a
+        thread pool capped per branch system, and responses are written back
+        here once every call has returned.
+        """
+        moves = self.filtered(lambda m: m.state == 'posted' and not m.is_post_status
+                              and m.move_type in ('out_invoice', 'out_refund'))
+        # load the whole batch before building payloads
+        self.env['frcs.payload.builder']._prefetch_moves(moves)
+        moves.system_id.fetch(['pfx_status', 'pfx_password', 'pfx_pac', 'pfx_expiry_date'])
+
+        ledger = self.env['frcs.submission.ledger']
+        failures = []
+        replayed = []
+        calls = []
+        for move in moves:
+            try:
+                request = move._prepare_frcs_request()
+                if not request:
+                    continue
+                body = request['body']
+                payload_hash = ledger._hash_payload(body)
+                stored = ledger._get_stored_response(move, payload_hash)
+                if stored:
+                    replayed.append((move, request, stored))
                 else:
-                    raise ValidationError(("Please Upload PFX for Mapped System."))
-            else:
-                raise ValidationError(("Please configure the required Branch Certification."))
+                    ledger._check_outcome_known(move)
+                    send = move.system_id._vsdc_invoice_request(body)
+                    calls.append((move, request, payload_hash, send))
+            except (ValidationError, UserError) as e:
+                failures.append((move, str(e)))
+
+        ICP = self.env['ir.config_parameter'].sudo()
+        started = fields.Datetime.now()
+        outcomes = vsdc_pool.submit_many(
+            [(move.system_id.id, send) for move, request, payload_hash, send in calls],
+            max_workers=int(ICP.get_param('enovasions_account.bulk_send_workers', 8)),
+            per_key_limit=int(ICP.get_param('enovasions_account.bulk_send_per_system', 2)),
+        )
+        ledger._log_attempts([
+            (move, payload_hash, started, response, error)
+            for (move, request, payload_hash, send), (response, error) in zip(calls, outcomes)
+        ])
+
+        done = self.env['account.move']
+        results = [(move, request, (stored, None)) for move, request, stored in replayed]
+        results += [(move, request, outcome) for (move, request, payload_hash, send), outcome in zip(calls, outcomes)]
+        for move, request, (response, error) in results:
+            try:
+                if error:
+                    raise error
+                with self.env.cr.savepoint():
+                    move._process_frcs_response(response, request['transaction_type'])
+                done |= move
+            except Exception as e:
+                failures.append((move, str(e)))
+
+        for move, error in failures:
+            _logger.warning("FRCS bulk send failed for %s: %s", move.name, error)
+        _logger.info("FRCS bulk send: %s sent, %s failed, %s skipped",
+                     len(done), len(failures), len(self) - len(moves))
+
+        message = _("%(sent)s invoice(s) sent to FRCS, %(failed)s failed, %(skipped)s skipped.",
+                    sent=len(done), failed=len(failures), skipped=len(self) - len(moves))
+        if failures:
+            message += "\n" + "\n".join("%s: %s" % (move.name, error) for move, error in failures)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Send to FRCS'),
+                'message': message,
+                'type': 'warning' if failures else 'success',
+                'sticky': bool(failures),
+                'next': {
+                    'type': 'ir.actions.client',
+                    'tag': 'reload',
+                }
+            }
+        }
 
     # ********* Function for Copy Sale And Refund process *********
     @api.depends('copy_post_response')
     def _compute_post_copy_response_json(self):
         for record in self:
-            try:
-                record.copy_post_response_json = json.loads(record.copy_post_response) if record.copy_post_response else {}
-            except (json.JSONDecodeError, TypeError):
-                record.copy_post_response_json = {}
+            record.copy_post_response_json = vsdc_response.parse(record.copy_post_response)
 
     def action_generate_copy_qr(self):
         for record in self:
@@ -418,174 +577,32 @@ class AccountMoveInherit(models.Model):
                     raise ValueError("Invalid JSON format in Copy post response")
 
             if qr_code_base64:
-                if qr_code_base64.startswith("data:image"):
-                    qr_code_base64 = qr_code_base64.split(",")[1]
                 try:
-                    qr_code_base64 = qr_code_base64.strip()
-                    decoded_qr = base64.b64decode(qr_code_base64)
-                    image = Image.open(io.BytesIO(decoded_qr))
-                    img_io = io.BytesIO()
-                    image.save(img_io, format="PNG")
-                    img_io.seek(0)
-                    record.copy_qr_code = base64.b64encode(img_io.getvalue())
-                except Exception as e:
+                    # the VSDC already sends PNG, PIL only converts other formats
+                    record.copy_qr_code = qr_image.qr_to_png_base64(qr_code_base64)
+                except ValueError:
                     record.copy_qr_code = False
-                    raise ValueError(f"Error Decoding Base64: {str(e)}")
+                    raise
             else:
                 record.copy_qr_code = False
                 raise ValueError("No QR Code Found in Response") 
 
     def action_send_copy_request(self):
+        builder = self.env['frcs.payload.builder']
+        builder._prefetch_moves(self)
         for record in self:
             if record.system_id:
                 if record.system_id.pfx_status == True:
-                    copy_post_response = record.copy_post_response and json.loads(record.copy_post_response) or False
+                    copy_post_response = record.copy_post_response_json
                     if record.is_copy_post_status and copy_post_response:
                         record.copy_ref_doc_num = copy_post_response.get('invoiceNumber', False)
 
-                    print("record.move_type",record.move_type)
                     if record.move_type in ['out_invoice','out_refund']:
-                        # Fetch values from system parameters
-                        # path = record.system_id.pfx_file_path
-
-                        # base_path = "C:/Program Files/Odoo 18.0.2025090/VSDC/"
-
-                        # cert_file = os.path.join(base_path, "certificate.pem")
-                        # key_file = os.path.join(base_path, "private_key.pem")
-
-                        # print("cert_file",cert_file)
-                        # print("key_file",key_file)
-
-                        # password = record.system_id.pfx_password
-                        # pac_value = record.system_id.pfx_pac
-                        # pfx_expiry_date = record.system_id.pfx_expiry_date
-
-                        path = record.system_id.pfx_file_path
-
-                        cert_file = os.path.join(os.path.dirname(path), "certificate.pem")
-                        key_file = os.path.join(os.path.dirname(path), "private_key.pem")
-
-                        print("cert_file",cert_file)
-                        print("key_file",key_file)
-
-                        password = record.system_id.pfx_password
-                        pac_value = record.system_id.pfx_pac
-                        pfx_expiry_date = record.system_id.pfx_expiry_date
-                      
-                        if not cert_file or not key_file or not password or not pac_value:
-                            raise ValidationError(_("Please configure the required certification in Branch Systems."))
-
-                        if pfx_expiry_date < datetime.now():
-                            raise ValidationError(_("Certification in Branch Systems is expired."))
-
-                        invoiceType = "Copy"
-                        if record.move_type =='out_invoice':
-                            transactionType = "Sale"
-
-                        if record.move_type =='out_refund':
-                            transactionType = "Refund"
-
-                        invoice_data = {
-                            'dateAndTimeOfIssue':record.create_date.strftime('%Y-%m-%d %H:%M:%S') if record.create_date else None,
-                            'cashier':record.invoice_user_id.vat,
-                            'buyerId':record.partner_id.id,
-                            'buyerCostCenterId':record.buyer_cost_centerid or None,
-                            'invoiceType':invoiceType,
-                            'transactionType':transactionType, 
-                            'payment': [],              
-                            'invoiceNumber': '32/2.01',
-                            'referentDocumentNumber':record.ref_doc_num, 
-                            'referentDocumentDT': record.ref_doc_date.strftime('%Y-%m-%d %H:%M:%S') if record.ref_doc_date else '',
-                            'items': []
-                        }
-
-                        # Add line items (invoice lines)
-                        for line in record.invoice_line_ids:
-                            if  line.product_id.is_charging != True: 
-                                tax_labels =[]
-                                # Add tax lines (tax_ids)
-                                for tax in line.tax_ids:
-                                    tax_labels.append(tax.invoice_label)
-                                # print("tax_labels",tax_labels)    
-
-                                invoice_data["items"].append({
-                                    # "gtin":"XX",
-                                    "name": line.product_id.name,
-                                    "quantity": line.quantity,
-                                    "discount": line.discount,
-                                    "unitPrice": line.price_unit,
-                                    "totalAmount": line.price_total,
-                                    "labels":tax_labels
-                                })
-
-                        # Add payment (matched_payment_ids) for Normal Sale & POS
-                        if record.pos_order_ids:
-                            print("copy pos order invoice")
-                            for pos_payment in record.pos_order_ids.payment_ids:
-                                pos_payment_type=pos_payment.payment_method_id.name
-                                if pos_payment_type =='Cash':
-                                    type=1
-                                elif pos_payment_type =='Card':
-                                    type=2
-                                else:
-                                    type=0
-
-                                invoice_data["payment"].append({
-                                    "amount": pos_payment.amount,
-                                    "paymentType": type
-                                })
-                                # vms_payment_type=pos_payment.vms_payment_type
-                                # payment_type = 0
-                                # if vms_payment_type and vms_payment_type.payment_type:
-                                #     payment_type = int(vms_payment_type.payment_type)
-                              
-                                # invoice_data["payment"].append({
-                                #     "amount": pos_payment.amount,
-                                #     "paymentType": payment_type
-                                # })
-                        else:
-                            if record.move_type =='out_invoice':
-                                if not record.matched_payment_ids: 
-                                    raise ValidationError(_("Payment Not collected."))
-
-                                for payment in record.matched_payment_ids:
-                                    if payment.state == 'paid':
-                                        vms_payment_type=payment.vms_payment_type
-                                        payment_type = False
-                                        if vms_payment_type and vms_payment_type.payment_type:
-                                            payment_type = vms_payment_type.payment_type
-
-                                        if payment_type:
-                                            invoice_data["payment"].append({
-                                                "amount": payment.amount,
-                                                "paymentType": int(payment_type)
-                                            })
-                            else:
-                                print("Charge Customer",record.amount_total)
-                                invoice_data["payment"].append({
-                                    "amount": record.amount_total,
-                                    "paymentType": 0 #other type
-                                })
-
-                        print("*****Copy Final Json request*****",invoice_data)
-
-                        url = "https://vsdc.sandbox.vms.frcs.org.fj/api/v3/invoices"
-                        context = ssl.create_default_context()
-                        context.load_cert_chain(certfile=cert_file, keyfile=key_file, password=password)  
-                        http = PoolManager(ssl_context=context)
-
-                        # Include PAC in headers
-                        headers = {
-                            "Content-Type": "application/json",
-                            "Accept": "application/json",
-                            "PAC": pac_value  
-                        }
-
-                        response = http.request(
-                           "POST", url,
-                            body=json.dumps(invoice_data),
-                            headers=headers
-                        )
+                        builder._check_system(record.system_id)
+                        request = builder._build_move_request(record, invoice_type="Copy")
+                        transactionType = request['transaction_type']
+
+                        response = record.system_id._vsdc_invoice_request(request['body'])()
 
                         if response.status == 200 or response.status == 201:
                             record.copy_post_response = response.data #storing response
@@ -612,6 +629,7 @@ class AccountMoveInherit(models.Model):
     # ********* END of  Copy Sale And Refund process **************
     def _post(self, soft=True):
         """Override the _post method to POS Order."""
+        to_fiscalize = self.env['account.move']
         for move in self:
             if move.move_type == 'out_invoice':  # Ensure it runs only for customer invoices
                 if move.pos_order_ids:
@@ -622,9 +640,19 @@ class AccountMoveInherit(models.Model):
                         raise ValueError("Add System in Point of Sale config")   
 
                 if move.pos_order_ids: # trigger only in pos while posting invoice
-                    move.action_send_request()
+                    to_fiscalize |= move
         # Call the original _post method
-        return super(AccountMoveInherit, self)._post(soft)
+        res = super(AccountMoveInherit, self)._post(soft)
+        # Fiscalization runs from the queue so the POS transaction does not wait on the VSDC
+        to_fiscalize._enqueue_fiscalization()
+        return res
+
+    def _enqueue_fiscalization(self):
+        return self.env['frcs.fiscal.queue']._enqueue(self)
+
+    def _frcs_fiscalized(self):
+        """Called by the fiscal queue once the VSDC has accepted the moves."""
+        return True
 
     def action_print_frcs_report(self):
         return self.env.ref('enovasions_account.action_report_frcs_move').report_action(self)
@@ -633,6 +661,18 @@ class AccountMoveInherit(models.Model):
 class AccountMoveLineInherit(models.Model):
     _inherit = 'account.move.line'
    
+    def _get_computed_taxes(self):
+        """Sales taxes follow the tax timeline in force on the invoice date."""
+        tax_ids = super()._get_computed_taxes()
+        move = self.move_id
+        if self.product_id and move.is_sale_document(include_receipts=True):
+            day = move.invoice_date or move.date or fields.Date.context_today(self)
+            taxes = self.env['product.timeline.tax'].get_effective_taxes(self.product_id, day)[self.product_id.id]
+            taxes = taxes._filter_taxes_by_company(move.company_id)
+            if taxes:
+                tax_ids = move.fiscal_position_id.map_tax(taxes) if move.fiscal_position_id else taxes
+        return tax_ids
+
     @api.constrains('tax_ids')
     def _check_only_one_tax(self):
         for line in self:
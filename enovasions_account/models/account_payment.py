@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from odoo import api, fields, models
+import time
 
 import logging
 _logger = logging.getLogger(__name__)
@@ -45,6 +46,20 @@ class AccountPaymentRegister(models.TransientModel):
             payment_vals.update({'vms_payment_type': self.vms_payment_type.id})
         return payment_vals
 
+    def _create_payments(self):
+        """Validate the customer payments right away, in one call on the payments just created.
+
+        Reconciliation with the invoices is already batched by the standard flow.
+        """
+        payments = super()._create_payments()
+        if any(move.move_type == 'out_invoice' for move in self.line_ids.move_id):
+            started = time.perf_counter()
+            to_validate = payments.filtered(lambda p: p.state == 'in_process')
+            to_validate.action_validate()
+            _logger.debug("%s payment(s) validated in %.1f ms", len(to_validate),
+                          (time.perf_counter() - started) * 1000)
+        return payments
+
 
 class AccountPayment(models.Model):
     _inherit = 'account.payment'
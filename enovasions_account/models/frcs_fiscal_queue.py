@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+from odoo import api, fields, models, tools, SUPERUSER_ID
+from odoo.modules.registry import Registry
+from odoo.exceptions import UserError
+from odoo.addons.enovasions_vms_integration.tools.vsdc_client import (
+    RESET_TIMEOUT, VsdcConnectionError, VsdcOutcomeUnknown, VsdcUnavailable,
+)
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import threading
+
+import logging
+_logger = logging.getLogger(__name__)
+
+
+class FrcsFiscalQueue(models.Model):
+    _name = 'frcs.fiscal.queue'
+    _description = 'FRCS Fiscal Submission Queue'
+    _order = 'id'
+
+    move_id = fields.Many2one('account.move', string='Invoice', required=True, index=True, ondelete='cascade')
+    system_id = fields.Many2one('branch.systems', string='System', related='move_id.system_id', store=True)
+    user_id = fields.Many2one('res.users', string='Requested By', default=lambda self: self.env.user)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('processing', 'Processing'),
+        ('done', 'Done'),
+        ('failed', 'Failed')],
+        default='pending', string='Status', required=True, index=True)
+    attempt_count = fields.Integer(string='Attempts', default=0)
+    next_attempt_date = fields.Datetime(string='Next Attempt', readonly=True, index=True)
+    last_error = fields.Text(string='Last Error', readonly=True)
+    date_done = fields.Datetime(string='Done On', readonly=True)
+    # ****** Store-and-forward journal (POS offline mode)
+    is_offline = fields.Boolean(string='Store and Forward', readonly=True)
+    sequence = fields.Integer(string='Journal No.', readonly=True, index=True)
+    payload = fields.Text(string='Journaled Payload', readonly=True)
+    transaction_type = fields.Char(string='Transaction Type', readonly=True)
+
+    def _get_queue_param(self, key, default):
+        return int(self.env['ir.config_parameter'].sudo().get_param('enovasions_account.fiscal_queue_%s' % key, default))
+
+    @api.model
+    def _enqueue(self, moves, journal=False):
+        """Create one pending job per move that is neither fiscalized nor already queued.
+
+        With ``journal``, the payload is built and frozen now and the job gets
+        the next store-and-forward sequence number, so the VSDC receives the
+        invoices exactly as issued and in issue order once it is reachable.
+        """
+        moves = moves.filtered(lambda m: not m.is_post_status)
+        if not moves:
+            return self
+        queued = self.sudo().search([
+            ('move_id', 'in', moves.ids),
+            ('state', 'in', ('pending', 'processing')),
+        ]).move_id
+        moves -= queued
+        if not moves:
+            return self
+        vals_list = []
+        for move in moves:
+            vals = {'move_id': move.id, 'user_id': self.env.uid}
+            if journal:
+                vals.update(self._prepare_journal_vals(move))
+            vals_list.append(vals)
+        jobs = self.sudo().create(vals_list)
+        self.env.ref('enovasions_account.ir_cron_process_fiscal_queue').sudo()._trigger()
+        return jobs
+
+    @api.model
+    def _prepare_journal_vals(self, move):
+        try:
+            request = move._prepare_frcs_request()
+        except UserError as e:
+            # left to a regular job, which reports the error on the queue
+            _logger.warning("FRCS payload of %s not journaled: %s", move.name, e)
+            return {}
+        if not request:
+            return {}
+        return {
+            'is_offline': True,
+            'sequence': int(self.env['ir.sequence'].sudo().next_by_code('frcs.offline.journal')),
+            'payload': request['body'],
+            'transaction_type': request['transaction_type'],
+        }
+
+    def _get_pending_predecessor(self):
+        """Return the earliest journal entry of the same system not forwarded yet, if any."""
+        self.ensure_one()
+        return self.search([
+            ('is_offline', '=', True),
+            ('system_id', '=', self.system_id.id),
+            ('sequence', '<', self.sequence),
+            ('state', 'in', ('pending', 'processing')),
+        ], order='sequence', limit=1)
+
+    def _get_retry_date(self, attempts):
+        """Exponential backoff: `fiscal_queue_backoff_base` seconds doubled per
+        attempt, capped at `fiscal_queue_backoff_cap` seconds."""
+        base = self._get_queue_param('backoff_base', 30)
+        cap = self._get_queue_param('backoff_cap', 3600)
+        return fields.Datetime.now() + timedelta(seconds=min(cap, base * 2 ** max(attempts - 1, 0)))
+
+    def _execute(self):
+        """Send the job's invoice to the VSDC in the current transaction.
+
+        Returns the number of jobs actually sent, so callers can tell progress
+        from jobs that are waiting for the VSDC or for a predecessor.
+        """
+        max_attempts = self._get_queue_param('max_attempts', 5)
+        sent = 0
+        for job in self:
+            predecessor = job.is_offline and job._get_pending_predecessor()
+            if predecessor:
+                # journal entries are forwarded strictly in sequence order
+                job.write({'state': 'pending', 'next_attempt_date': predecessor.next_attempt_date})
+                continue
+            move = job.move_id.with_user(job.user_id or SUPERUSER_ID).sudo()
+            try:
+                # no savepoint here: the ledger entry of the attempt must stay,
+                # the response itself is processed in a savepoint
+                if not move.is_post_status:
+                    if job.payload:
+                        _action, error = move._submit_frcs_payload(job.payload, job.transaction_type)
+                    else:
+                        _action, error = move._send_frcs_request()
+                    if error:
+                        raise error
+            except Exception as e:
+                if isinstance(e, VsdcUnavailable) or (job.is_offline and isinstance(e, VsdcConnectionError)):
+                    # VSDC down: wait for it without spending an attempt
+                    job.write({
+                        'state': 'pending',
+                        'next_attempt_date': fields.Datetime.now() + timedelta(seconds=RESET_TIMEOUT),
+                        'last_error': str(e),
+                    })
+                    continue
+                _logger.warning("FRCS fiscal job %s for %s failed: %s", job.id, job.move_id.name, e)
+                sent += 1
+                attempts = job.attempt_count + 1
+                job.write({
+                    'attempt_count': attempts,
+                    'next_attempt_date': job._get_retry_date(attempts),
+                    # the VSDC may have fiscalized it: never resend on our own
+                    'state': 'pending' if attempts < max_attempts and not isinstance(e, VsdcOutcomeUnknown) else 'failed',
+                    'last_error': str(e),
+                })
+            else:
+                sent += 1
+                job.write({
+                    'attempt_count': job.attempt_count + 1,
+                    'state': 'done',
+                    'date_done': fields.Datetime.now(),
+                    'next_attempt_date': False,
+                    'last_error': False,
+                })
+                if move.is_post_status:
+                    job.move_id._frcs_fiscalized()
+        return sent
+
+    def _process_now(self):
+        """Run the pending jobs that no worker has claimed yet, inline."""
+        if not self:
+            return 0
+        self.env.cr.execute("""
+            SELECT id FROM frcs_fiscal_queue
+             WHERE id IN %s AND state = 'pending'
+               FOR UPDATE SKIP LOCKED
+        """, [tuple(self.ids)])
+        return self.browse([row[0] for row in self.env.cr.fetchall()])._execute()
+
+    def action_retry(self):
+        self.write({'state': 'pending', 'attempt_count': 0, 'next_attempt_date': False})
+        self.env.ref('enovasions_account.ir_cron_process_fiscal_queue')._trigger()
+
+    @api.model
+    def _cron_process_queue(self):
+        """Drain pending jobs with at most `fiscal_queue_workers` concurrent VSDC calls."""
+        # jobs left in processing by a dead worker go back to the queue
+        self.search([
+            ('state', '=', 'processing'),
+            ('write_date', '<', fields.Datetime.now() - timedelta(minutes=15)),
+        ]).write({'state': 'pending'})
+
+        # due jobs only, and no journal entry queued behind one that is in
+        # flight or backing off: it would only be put back to pending
+        batch_size = self._get_queue_param('batch_size', 50)
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            SELECT q.id FROM frcs_fiscal_queue q
+             WHERE q.state = 'pending'
+               AND (q.next_attempt_date IS NULL OR q.next_attempt_date <= %(now)s)
+               AND NOT (q.is_offline IS TRUE AND EXISTS (
+                       SELECT 1 FROM frcs_fiscal_queue p
+                        WHERE p.is_offline IS TRUE
+                          AND p.system_id = q.system_id
+                          AND p.sequence < q.sequence
+                          AND (p.state = 'processing'
+                               OR (p.state = 'pending' AND p.next_attempt_date > %(now)s))))
+             ORDER BY q.id
+             LIMIT %(limit)s
+               FOR UPDATE OF q SKIP LOCKED
+        """, {'now': now, 'limit': batch_size})
+        job_ids = [row[0] for row in self.env.cr.fetchall()]
+        if not job_ids:
+            return
+
+        if tools.config['test_enable']:
+            self.browse(job_ids)._execute()
+            return
+
+        self.browse(job_ids).write({'state': 'processing'})
+        self.env.cr.commit()
+
+        # regular jobs run independently; each system's journal is one ordered chain
+        jobs = self.browse(job_ids)
+        chains = [[job.id] for job in jobs if not job.is_offline]
+        journal = jobs.filtered('is_offline').sorted('sequence')
+        for system in journal.system_id:
+            chains.append(journal.filtered(lambda j: j.system_id == system).ids)
+
+        dbname = self.env.cr.dbname
+        context = dict(self.env.context)
+        workers = max(1, self._get_queue_param('workers', 4))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_run_jobs, dbname, chain, context) for chain in chains]
+        sent = sum(future.result() for future in futures)
+
+        # a full batch may leave due jobs behind; without any send the rest
+        # waits for its backoff and the next scheduled run
+        if len(job_ids) == batch_size and sent:
+            self.env.ref('enovasions_account.ir_cron_process_fiscal_queue')._trigger()
+
+
+def _run_jobs(dbname, job_ids, context):
+    """Execute claimed jobs in order in their own cursor, committing after each one;
+    used by the queue's worker threads. Returns the number of jobs sent."""
+    threading.current_thread().dbname = dbname
+    sent = 0
+    try:
+        with Registry(dbname).cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, context)
+            for job in env['frcs.fiscal.queue'].browse(job_ids):
+                count = job._execute()
+                cr.commit()
+                sent += count
+    except Exception:
+        _logger.exception("FRCS fiscal jobs %s crashed", job_ids)
+    return sent
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models, _
+from odoo.exceptions import ValidationError
+from datetime import datetime
+import json
+
+import logging
+_logger = logging.getLogger(__name__)
+
+# paymentType codes of the VSDC for POS payment methods, by method name
+POS_PAYMENT_TYPES = {'Cash': 1, 'Card': 2}
+
+
+class FrcsPayloadBuilder(models.AbstractModel):
+    """Build VSDC invoice payloads for account moves.
+
+    Every send path (regular, copy, bulk, offline journal) goes through here so
+    the payload is assembled from prefetched records and serialized once.
+    """
+    _name = 'frcs.payload.builder'
+    _description = 'FRCS Payload Builder'
+
+    @api.model
+    def _prefetch_moves(self, moves):
+        """Load everything the payload reads for ``moves`` in a few queries."""
+        moves.fetch(['create_date', 'invoice_user_id', 'partner_id', 'buyer_cost_centerid', 'move_type',
+                     'order_type', 'amount_total', 'ref_doc_num', 'ref_doc_date', 'reversed_entry_id'])
+        lines = moves.invoice_line_ids
+        lines.fetch(['product_id', 'quantity', 'discount', 'price_unit', 'price_total', 'tax_ids'])
+        lines.product_id.fetch(['name', 'is_charging'])
+        lines.tax_ids.fetch(['invoice_label'])
+        moves.partner_id.fetch(['charge_customer'])
+        moves.invoice_user_id.fetch(['vat'])
+        moves.reversed_entry_id.fetch(['ref_doc_num', 'ref_doc_date'])
+        payments = moves.matched_payment_ids
+        payments.fetch(['state', 'amount', 'vms_payment_type'])
+        payments.vms_payment_type.fetch(['payment_type'])
+        return moves
+
+    @api.model
+    def _check_system(self, system):
+        """Raise unless ``system`` holds a usable certificate."""
+        if not system:
+            raise ValidationError(_("Please configure the required Branch Certification."))
+        if system.pfx_status is not True:
+            raise ValidationError(_("Please Upload PFX for Mapped System."))
+        if not system.pfx_password or not system.pfx_pac:
+            raise ValidationError(_("Please configure the required certification in Branch Systems."))
+        if system.pfx_expiry_date and system.pfx_expiry_date < datetime.now():
+            raise ValidationError(_("Certification in Branch Systems is expired."))
+
+    @api.model
+    def _format_issue_date(self, date):
+        return date.strftime('%Y-%m-%d %H:%M:%S') if date else None
+
+    @api.model
+    def _format_referent_date(self, date):
+        return date.strftime('%Y-%m-%d %H:%M:%S') if date else ''
+
+    @api.model
+    def _move_invoice_type(self, move):
+        if move.order_type == 'advance':
+            return "Advance"
+        if move.order_type == 'training':
+            return "Training"
+        return "Normal"
+
+    @api.model
+    def _move_referent(self, move, invoice_type):
+        """Return the (number, date) of the document the payload refers to."""
+        if invoice_type == "Copy":
+            return move.ref_doc_num, self._format_referent_date(move.ref_doc_date)
+        if move.move_type == 'out_refund' and move.reversed_entry_id:
+            origin = move.reversed_entry_id
+            return origin.ref_doc_num, self._format_referent_date(origin.ref_doc_date)
+        return '', ''
+
+    @api.model
+    def _move_item_name(self, move, line, invoice_type):
+        return line.product_id.name
+
+    @api.model
+    def _move_items(self, move, invoice_type):
+        items = []
+        for line in move.invoice_line_ids:
+            if line.product_id.is_charging is True:
+                continue
+            items.append({
+                "name": self._move_item_name(move, line, invoice_type),
+                "quantity": line.quantity,
+                "discount": line.discount,
+                "unitPrice": line.price_unit,
+                "totalAmount": line.price_total,
+                "labels": [tax.invoice_label for tax in line.tax_ids],
+            })
+        return items
+
+    @api.model
+    def _pos_payments(self, move, invoice_type):
+        return move.pos_payment_ids if invoice_type != "Copy" else move.pos_order_ids.payment_ids
+
+    @api.model
+    def _matched_payments(self, move):
+        payments = []
+        for payment in move.matched_payment_ids:
+            if payment.state != 'paid':
+                continue
+            payment_type = payment.vms_payment_type.payment_type
+            if payment_type:
+                payments.append({"amount": payment.amount, "paymentType": int(payment_type)})
+        return payments
+
+    @api.model
+    def _move_payments(self, move, invoice_type):
+        pos_payments = self._pos_payments(move, invoice_type)
+        if pos_payments:
+            return [{
+                "amount": pos_payment.amount,
+                "paymentType": POS_PAYMENT_TYPES.get((pos_payment.payment_method_id.name or '').strip(), 0),
+            } for pos_payment in pos_payments]
+        charged = move.partner_id.charge_customer is True and invoice_type != "Copy"
+        if move.move_type == 'out_invoice' and not charged:
+            if not move.matched_payment_ids:
+                raise ValidationError(_("Payment Not collected."))
+            return self._matched_payments(move)
+        return [{"amount": move.amount_total, "paymentType": 0}]  # other type
+
+    @api.model
+    def _build_move_payload(self, move, invoice_type=None):
+        invoice_type = invoice_type or self._move_invoice_type(move)
+        transaction_type = "Sale" if move.move_type == 'out_invoice' else "Refund"
+        referent_number, referent_date = self._move_referent(move, invoice_type)
+        return {
+            'dateAndTimeOfIssue': self._format_issue_date(move.create_date),
+            'cashier': move.invoice_user_id.vat,
+            'buyerId': move.partner_id.id,
+            'buyerCostCenterId': move.buyer_cost_centerid or None,
+            'invoiceType': invoice_type,
+            'transactionType': transaction_type,
+            'payment': self._move_payments(move, invoice_type),
+            'invoiceNumber': '32/2.01',
+            'referentDocumentNumber': referent_number,
+            'referentDocumentDT': referent_date,
+            'items': self._move_items(move, invoice_type),
+        }
+
+    @api.model
+    def _make_request(self, payload, record):
+        """Serialize ``payload`` once; the same string is logged, hashed and sent."""
+        body = json.dumps(payload)
+        _logger.info("FRCS %s payload of %s: %s", payload['invoiceType'], record.display_name, body)
+        return {'payload': payload, 'body': body, 'transaction_type': payload['transactionType']}
+
+    @api.model
+    def _build_move_request(self, move, invoice_type=None):
+        """Return ``{'payload', 'body', 'transaction_type'}`` for one customer invoice or refund."""
+        return self._make_request(self._build_move_payload(move, invoice_type), move)
+
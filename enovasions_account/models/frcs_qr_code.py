@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+from odoo import api, fields, models
+from odoo.addons.enovasions_vms_integration.tools import qr_image
+import base64
+import hashlib
+import json
+
+import logging
+_logger = logging.getLogger(__name__)
+
+# Image fields of fiscal documents whose QR lived in ir.attachment before
+LEGACY_QR_FIELDS = [
+    ('account.move', 'qr_code'),
+    ('account.move', 'copy_qr_code'),
+    ('sale.order', 'so_qr_code'),
+    ('sale.order', 'so_refund_qr_code'),
+]
+
+
+class FrcsQrCode(models.Model):
+    """VSDC verification QR codes, stored once per content in a plain column.
+
+    Fiscal documents point to their QR instead of owning an Image field, so
+    fiscalization adds no ir.attachment row nor filestore file.
+    """
+    _name = 'frcs.qr.code'
+    _description = 'FRCS QR Code'
+    _log_access = False
+
+    checksum = fields.Char(string='Checksum', required=True, readonly=True, index=True)
+    data = fields.Binary(string='PNG', attachment=False, required=True, readonly=True)
+
+    _sql_constraints = [
+        ('checksum_uniq', 'unique(checksum)', 'A QR code is stored only once.'),
+    ]
+
+    @api.model
+    def _get_or_create(self, png_base64):
+        """Return the stored QR with this content, creating it if needed."""
+        if not png_base64:
+            return self.browse()
+        if isinstance(png_base64, str):
+            png_base64 = png_base64.encode('ascii')
+        checksum = hashlib.sha1(base64.b64decode(png_base64)).hexdigest()
+        qr = self.sudo().search([('checksum', '=', checksum)], limit=1)
+        if not qr:
+            qr = self.sudo().create({'checksum': checksum, 'data': png_base64})
+        return qr.sudo(False)
+
+    @api.model
+    def _from_response(self, response):
+        """Base64 PNG of the QR embedded in a raw VSDC response, or False."""
+        if not response:
+            return False
+        try:
+            qr_base64 = json.loads(response).get('verificationQRCode')
+            return qr_base64 and qr_image.qr_to_png_base64(qr_base64)
+        except ValueError:
+            return False
+
+    def _get_url(self):
+        self.ensure_one()
+        return '/frcs/qr/%s.png' % self.checksum
+
+    @api.model
+    def _purge_legacy_attachments(self):
+        """Delete the QR attachments of the former Image fields.
+
+        Documents without a stored QR rebuild it from their VSDC response.
+        """
+        domain = ['|'] * (len(LEGACY_QR_FIELDS) - 1)
+        for model, field in LEGACY_QR_FIELDS:
+            domain += ['&', ('res_model', '=', model), ('res_field', '=', field)]
+        attachments = self.env['ir.attachment'].sudo().search(domain)
+        _logger.info("Deleting %s legacy FRCS QR attachments", len(attachments))
+        attachments.unlink()
+        return len(attachments)
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
+from odoo.addons.enovasions_vms_integration.tools.vsdc_client import VsdcOutcomeUnknown
+from collections import namedtuple
+import hashlib
+
+import logging
+_logger = logging.getLogger(__name__)
+
+# Same shape as the urllib3 response read by _process_frcs_response
+StoredResponse = namedtuple('StoredResponse', ['status', 'data'])
+
+
+class FrcsSubmissionLedger(models.Model):
+    _name = 'frcs.submission.ledger'
+    _description = 'FRCS Submission Ledger'
+    _order = 'id desc'
+
+    move_id = fields.Many2one('account.move', string='Invoice', required=True, index=True, ondelete='cascade')
+    payload_hash = fields.Char(string='Payload Hash', required=True, index=True)
+    state = fields.Selection([
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+        ('unknown', 'Outcome Unknown')],
+        string='Status', required=True)
+    status_code = fields.Integer(string='HTTP Status')
+    response = fields.Text(string='Response', readonly=True)
+    error = fields.Text(string='Error', readonly=True)
+    attempt_count = fields.Integer(string='Attempts', default=0)
+    first_attempt_date = fields.Datetime(string='First Attempt')
+    last_attempt_date = fields.Datetime(string='Last Attempt')
+
+    _sql_constraints = [
+        ('move_payload_uniq', 'unique(move_id, payload_hash)', 'A payload can only be logged once per invoice.'),
+    ]
+
+    @api.model
+    def _hash_payload(self, body):
+        return hashlib.sha256(body.encode('utf-8') if isinstance(body, str) else body).hexdigest()
+
+    @api.model
+    def _get_stored_response(self, move, payload_hash):
+        """Return the accepted VSDC response for this exact payload, if any."""
+        entry = self.sudo().search([
+            ('move_id', '=', move.id),
+            ('payload_hash', '=', payload_hash),
+            ('state', '=', 'sent'),
+        ], limit=1)
+        if entry:
+            return StoredResponse(entry.status_code, (entry.response or '').encode('utf-8'))
+        return None
+
+    @api.model
+    def _check_outcome_known(self, move):
+        """Refuse a resend while an earlier submission of the move may have been fiscalized."""
+        if self.sudo().search_count([('move_id', '=', move.id), ('state', '=', 'unknown')], limit=1):
+            raise VsdcOutcomeUnknown(_(
+                "An earlier submission of %s timed out and may have been fiscalized. Check it on the "
+                "VSDC, then mark it as not received in the FRCS Submission Ledger before sending again.",
+                move.name))
+
+    def action_mark_not_received(self):
+        """Settle unknown outcomes the VSDC has no record of, allowing a resend."""
+        if self.filtered(lambda e: e.state != 'unknown'):
+            raise UserError(_("Only submissions with an unknown outcome can be marked as not received."))
+        self.write({'state': 'failed'})
+
+    @api.model
+    def _log_attempts(self, attempts):
+        """Record ``(move, payload_hash, started, response, error)`` attempts.
+
+        The ledger is written in the caller's transaction, next to the move it
+        refers to; callers keep it by processing the response in a savepoint.
+        """
+        if not attempts:
+            return
+        ledger = self.sudo()
+        for move, payload_hash, started, response, error in attempts:
+            vals = {'last_attempt_date': started}
+            if response is not None:
+                data = response.data or b''
+                vals.update({
+                    'state': 'sent' if response.status in (200, 201) else 'failed',
+                    'status_code': response.status,
+                    'response': data.decode('utf-8', 'replace') if isinstance(data, bytes) else data,
+                    'error': False,
+                })
+            else:
+                vals.update({
+                    'state': 'unknown' if isinstance(error, VsdcOutcomeUnknown) else 'failed',
+                    'error': str(error),
+                })
+            entry = ledger.search([('move_id', '=', move.id), ('payload_hash', '=', payload_hash)], limit=1)
+            if entry:
+                vals['attempt_count'] = entry.attempt_count + 1
+                entry.write(vals)
+            else:
+                ledger.create(dict(vals, move_id=move.id, payload_hash=payload_hash,
+                                   attempt_count=1, first_attempt_date=started))
+
+    @api.model
+    def _submit(self, move, body, send):
+        """Call ``send`` unless this payload was already accepted for the move.
+
+        Returns ``(response, error)``: a failed send is logged and returned,
+        never raised, so rolling back the caller cannot erase the attempt.
+        Refuses to send while an earlier outcome of the move is unknown.
+        """
+        payload_hash = self._hash_payload(body)
+        stored = self._get_stored_response(move, payload_hash)
+        if stored:
+            _logger.info("FRCS payload of %s already accepted, reusing stored response", move.name)
+            return stored, None
+        self._check_outcome_known(move)
+        started = fields.Datetime.now()
+        try:
+            response = send()
+        except Exception as e:
+            self._log_attempts([(move, payload_hash, started, None, e)])
+            return None, e
+        self._log_attempts([(move, payload_hash, started, response, None)])
+        return response, None
@@ -1,8 +1,22 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 from datetime import date 
 from datetime import datetime
 from odoo.exceptions import ValidationError
+from odoo.tools import SQL
+from odoo.tools.safe_eval import safe_eval
+from odoo.tools.sql import create_index
+from collections import defaultdict
+from datetime import timedelta
+import bisect
+import time
 
+import logging
+_logger = logging.getLogger(__name__)
+
+# bumped whenever what the timelines target changes; keys the cached tax index
+GENERATION_SEQUENCE = 'product_timeline_tax_generation'
+# product fields moving products in and out of category targets
+TARGET_FIELDS = {'categ_id', 'active'}
 
 
 class ProductTimelineTax(models.Model):
@@ -13,11 +27,21 @@ class ProductTimelineTax(models.Model):
     start_date = fields.Date(string="Start Date", required=True)
     end_date = fields.Date(string="End Date", required=True)
     tax_ids = fields.Many2many("account.tax", string="Taxes",required=True)
-    product_ids = fields.Many2many("product.product", string="Products",required=True)
+    product_ids = fields.Many2many("product.product", string="Products",
+                                   help="Always targeted, on top of the categories and the domain.")
+    categ_ids = fields.Many2many("product.category", string="Product Categories",
+                                 help="Targets the products of these categories and of their subcategories.")
+    product_domain = fields.Char(string="Product Filter", help="Targets the products matching this domain.")
     display_name = fields.Char(string="Display Name", compute="_compute_display_name", store=True)
 
 
 
+    def init(self):
+        # overlap checks compare date ranges, see _get_overlap_conflicts
+        create_index(self.env.cr, 'product_timeline_tax_daterange_index', self._table,
+                     ["daterange(start_date, end_date, '[]')"], method='gist')
+        self.env.cr.execute(SQL("CREATE SEQUENCE IF NOT EXISTS %s", SQL.identifier(GENERATION_SEQUENCE)))
+
     @api.onchange('start_date')
     def _onchange_start_date(self):
         for record in self:
@@ -45,20 +69,107 @@ class ProductTimelineTax(models.Model):
             if record.start_date > record.end_date:
                 raise ValidationError("Start Date cannot be greater than End Date.")
 
+        conflicts = self._get_overlap_conflicts()
+        if conflicts:
+            Tax = self.env["account.tax"]
+            lines = [
+                f"- {Tax.browse(tax_id).name}: {self.browse(record_id).display_name} / {self.browse(other_id).display_name}"
+                for record_id, other_id, tax_id in conflicts
+            ]
+            raise ValidationError(
+                "Date range overlaps for the following taxes. Please select a different date range.\n"
+                + "\n".join(lines)
+            )
+
+    def _get_overlap_conflicts(self):
+        """Every ``(timeline, other timeline, tax)`` whose date ranges overlap on a shared tax.
+
+        One query for the whole batch; each conflicting pair is reported once.
+        """
+        if not self.ids:
+            return []
+        self.flush_model(["start_date", "end_date", "tax_ids"])
+        tax_rel = self._fields["tax_ids"]
+        self.env.cr.execute(f"""
+            SELECT DISTINCT LEAST(r.id, o.id), GREATEST(r.id, o.id), rt.{tax_rel.column2}
+              FROM product_timeline_tax r
+              JOIN {tax_rel.relation} rt ON rt.{tax_rel.column1} = r.id
+              JOIN {tax_rel.relation} ot ON ot.{tax_rel.column2} = rt.{tax_rel.column2}
+                                        AND ot.{tax_rel.column1} != r.id
+              JOIN product_timeline_tax o ON o.id = ot.{tax_rel.column1}
+             WHERE r.id IN %s
+               AND daterange(o.start_date, o.end_date, '[]') && daterange(r.start_date, r.end_date, '[]')
+             ORDER BY 1, 2, 3
+        """, [tuple(self.ids)])
+        return self.env.cr.fetchall()
+
+    @api.constrains("product_ids", "categ_ids", "product_domain")
+    def _check_targets(self):
+        Product = self.env['product.product'].sudo().with_context(active_test=False)
+        for record in self:
+            try:
+                domain = record._get_product_domain()
+                # resolve the field names now rather than in the tax cron
+                Product._search(domain)
+            except Exception as e:
+                raise ValidationError("Invalid Product Filter %r: %s" % (record.product_domain, e))
+            if not (record.product_ids or record.categ_ids or domain):
+                raise ValidationError("Select the products, product categories or product filter the taxes apply to.")
+
+    def _get_product_domain(self):
+        self.ensure_one()
+        domain = safe_eval(self.product_domain) if self.product_domain else []
+        if not isinstance(domain, (list, tuple)):
+            raise ValueError("a domain must be a list")
+        return list(domain)
 
+    def _targets_sql(self):
+        """SQL selecting ``(timeline_id, product_id)`` for every product the timelines target.
 
-            for tax in record.tax_ids:
-                overlapping_records = self.env["product.timeline.tax"].search([
-                    ("id", "!=", record.id),  # Exclude the current record
-                    ("tax_ids", "in", tax.id),
-                    ("start_date", "<=", record.end_date),
-                    ("end_date", ">=", record.start_date),
-                ])
+        Explicit products, products of the categories (and subcategories) and
+        products matching each stored domain; resolved by the database when
+        taxes are applied, never stored per product. Domains are evaluated as
+        superuser on archived products too, so the result is the same for
+        every user and can be cached.
+        """
+        product_rel = self._fields['product_ids']
+        categ_rel = self._fields['categ_ids']
+        parts = [
+            SQL("SELECT %s AS timeline_id, %s AS product_id FROM %s",
+                SQL.identifier(product_rel.column1), SQL.identifier(product_rel.column2),
+                SQL.identifier(product_rel.relation)),
+            SQL("""
+                SELECT cr.%s, pp.id
+                  FROM %s cr
+                  JOIN product_category pc ON pc.id = cr.%s
+                  JOIN product_category child ON child.parent_path LIKE pc.parent_path || '%%'
+                  JOIN product_template pt ON pt.categ_id = child.id
+                  JOIN product_product pp ON pp.product_tmpl_id = pt.id
+            """, SQL.identifier(categ_rel.column1), SQL.identifier(categ_rel.relation),
+                SQL.identifier(categ_rel.column2)),
+        ]
+        Product = self.env['product.product'].sudo().with_context(active_test=False)
+        for timeline in self.sudo().search([('product_domain', '!=', False)]):
+            domain = timeline._get_product_domain()
+            if domain:
+                parts.append(SQL("SELECT %s, p.id FROM (%s) p", timeline.id, Product._search(domain).subselect('id')))
+        self.flush_model()
+        Product.flush_model(['product_tmpl_id'])
+        self.env['product.template'].flush_model(['categ_id'])
+        self.env['product.category'].flush_model(['parent_path'])
+        return SQL(" UNION ").join(parts)
 
-                if overlapping_records:
-                    raise ValidationError(
-                        f"Date range overlaps for Tax: {tax.name}. Please select a different date range."
-                    )
+    def _get_target_templates(self):
+        """Templates of the products these timelines target, in one query."""
+        if not self.ids:
+            return self.env['product.template']
+        self.env.cr.execute(SQL("""
+            SELECT DISTINCT pp.product_tmpl_id
+              FROM (%s) target
+              JOIN product_product pp ON pp.id = target.product_id
+             WHERE target.timeline_id IN %s
+        """, self._targets_sql(), tuple(self.ids)))
+        return self.env['product.template'].browse([row[0] for row in self.env.cr.fetchall()])
 
     @api.model_create_multi
     def create(self, vals_list):
@@ -66,18 +177,24 @@ class ProductTimelineTax(models.Model):
             if not vals.get('start_date'):
                 vals['start_date'] = fields.Date.today()
         record = super().create(vals_list)
-        record.update_sales_taxes()  
+        self._invalidate_tax_interval_index()
+        record.update_sales_taxes(templates=record._get_target_templates())
+        record._schedule_next_boundary()
         return record
 
 
     def write(self, vals):
-        print("vals",vals)
-
         if 'start_date' in vals or 'end_date' in vals:
             raise ValidationError("Start Date and End Date cannot be modified after creation.")
+        targets = {'product_ids', 'categ_ids', 'product_domain', 'tax_ids'}.intersection(vals)
+        # templates losing the timeline are re-applied too, another one may cover them
+        templates = self._get_target_templates() if targets else None
         result = super().write(vals)
-        self.update_sales_taxes()  
-        return result           
+        self._invalidate_tax_interval_index()
+        if targets:
+            self.update_sales_taxes(templates=templates | self._get_target_templates())
+        self._schedule_next_boundary()
+        return result
 
 
 
@@ -90,22 +207,228 @@ class ProductTimelineTax(models.Model):
                     f"Cannot delete record with past dates: {record.start_date} - {record.end_date}. "
                     "Only future records can be deleted."
                 )
-        return super(ProductTimelineTax, self).unlink() 
+        result = super(ProductTimelineTax, self).unlink()
+        self._invalidate_tax_interval_index()
+        self._schedule_next_boundary()
+        return result
         
 
     @api.model
-    def update_sales_taxes(self):
+    def _invalidate_tax_interval_index(self):
+        """Make every worker rebuild the tax interval index, without touching
+        the other registry caches.
+
+        The generation is bumped now, for this transaction, and once more after
+        commit so no worker keeps an index built from the uncommitted state.
+        """
+        cr = self.env.cr
+        query = SQL("SELECT nextval(%s)", GENERATION_SEQUENCE)
+        cr.execute(query)
+        if not cr.postcommit.data.get(GENERATION_SEQUENCE):
+            cr.postcommit.data[GENERATION_SEQUENCE] = True
+            registry = self.env.registry
+
+            @cr.postcommit.add
+            def bump_generation():
+                with registry.cursor() as new_cr:
+                    new_cr.execute(query)
+
+    @api.model
+    def _invalidate_for_products(self, vals=None):
+        """Invalidate the index when products are created, deleted or written
+        with ``vals`` changing what the timelines target: the category, or a
+        field a product filter reads. The tax writes of ``update_sales_taxes``
+        never do."""
+        if vals is not None:
+            if self.env.context.get('tax_timeline_update'):
+                return
+            if not TARGET_FIELDS.intersection(vals) and not self._get_domain_fields().intersection(vals):
+                return
+        self._invalidate_tax_interval_index()
+
+    @api.model
+    def _get_domain_fields(self):
+        """Names of the fields read by the stored product filters, path segments included."""
+        return self._get_domain_fields_cached(self._get_tax_index_generation())
+
+    @tools.ormcache('generation')
+    def _get_domain_fields_cached(self, generation):
+        names = set()
+        for timeline in self.sudo().search([('product_domain', '!=', False)]):
+            for leaf in timeline._get_product_domain():
+                if isinstance(leaf, (list, tuple)) and leaf and isinstance(leaf[0], str):
+                    names.update(leaf[0].split('.'))
+        return frozenset(names)
+
+    @api.model
+    def _get_tax_index_generation(self):
+        self.env.cr.execute(SQL("SELECT last_value FROM %s", SQL.identifier(GENERATION_SEQUENCE)))
+        return self.env.cr.fetchone()[0]
+
+    @tools.ormcache('generation')
+    def _get_tax_interval_index(self, generation):
+        """Per product, the dates where its timeline taxes change and the taxes from then on.
+
+        ``{product_id: (boundaries, tax_sets)}``: ``tax_sets[i]`` holds from
+        ``boundaries[i]`` until the next boundary, and is empty where no
+        timeline applies. Cached per worker for a ``generation`` of the timelines.
+        """
+        tax_rel = self._fields['tax_ids']
+        self.env.cr.execute(SQL("""
+            SELECT target.product_id, t.id, t.start_date, t.end_date, array_agg(tr.%s)
+              FROM product_timeline_tax t
+              JOIN (%s) target ON target.timeline_id = t.id
+              JOIN %s tr ON tr.%s = t.id
+             GROUP BY target.product_id, t.id
+        """, SQL.identifier(tax_rel.column2), self._targets_sql(),
+            SQL.identifier(tax_rel.relation), SQL.identifier(tax_rel.column1)))
+        intervals = defaultdict(list)
+        for product_id, timeline_id, start, end, tax_ids in self.env.cr.fetchall():
+            intervals[product_id].append((start, end + timedelta(days=1), timeline_id, frozenset(tax_ids)))
+        index = {}
+        for product_id, spans in intervals.items():
+            boundaries = sorted({span[0] for span in spans} | {span[1] for span in spans})
+            tax_sets = []
+            for day in boundaries:
+                # overlapping timelines: the latest created one wins, as lines take a single tax
+                active = [span for span in spans if span[0] <= day < span[1]]
+                tax_sets.append(max(active, key=lambda span: span[2])[3] if active else frozenset())
+            index[product_id] = (tuple(boundaries), tuple(tax_sets))
+        return index
+
+    @api.model
+    def get_effective_taxes(self, products, day):
+        """Sales taxes of ``products`` on ``day`` according to the timelines.
+
+        Returns ``{product_id: account.tax}``; products that no timeline covers
+        on that day keep their own ``taxes_id``. Where timelines overlap, the
+        latest created one applies.
+        """
+        index = self._get_tax_interval_index(self._get_tax_index_generation())
+        Tax = self.env['account.tax']
+        result = {}
+        for product in products:
+            boundaries, tax_sets = index.get(product.id, ((), ()))
+            position = bisect.bisect_right(boundaries, day) - 1
+            tax_ids = tax_sets[position] if position >= 0 else ()
+            result[product.id] = Tax.browse(tax_ids) if tax_ids else product.taxes_id
+        return result
+
+    @api.model
+    def _get_next_boundary(self, day):
+        """First date after ``day`` on which a timeline starts or stops applying, or None."""
+        self.flush_model(['start_date', 'end_date'])
+        self.env.cr.execute("""
+            SELECT LEAST(MIN(start_date) FILTER (WHERE start_date > %s),
+                         MIN(end_date + 1) FILTER (WHERE end_date + 1 > %s))
+              FROM product_timeline_tax
+        """, [day, day])
+        return self.env.cr.fetchone()[0]
+
+    @api.model
+    def _schedule_next_boundary(self):
+        """Make the tax cron run on the next timeline boundary."""
+        boundary = self._get_next_boundary(date.today())
+        if boundary:
+            cron = self.env.ref('enovasions_account.ir_cron_update_sales_taxes')
+            cron.sudo()._trigger(at=datetime.combine(boundary, datetime.min.time()))
+        return boundary
+
+    @api.model
+    def _cron_apply_tax_boundaries(self):
+        """Apply the taxes of the timelines that started or ended since the last run."""
+        params = self.env['ir.config_parameter'].sudo()
         today = date.today()
-        tax_records = self.search([("start_date", "<=", today), ("end_date", ">=", today)])
-        
-        if not tax_records:
-            return "No tax records found for today."
+        last_run = fields.Date.to_date(params.get_param('enovasions_account.tax_timeline_last_run')) or today - timedelta(days=1)
+        crossing = self.search([
+            '|',
+            '&', ('start_date', '>', last_run), ('start_date', '<=', today),
+            '&', ('end_date', '>=', last_run), ('end_date', '<', today),
+        ])
+        result = None
+        if crossing:
+            result = self.update_sales_taxes(templates=crossing._get_target_templates())
+        params.set_param('enovasions_account.tax_timeline_last_run', fields.Date.to_string(today))
+        self._schedule_next_boundary()
+        return result
+
+    def _get_effective_template_taxes(self, day, templates=None):
+        """Sales taxes of each template on ``day``, from the timelines active then.
+
+        Returns ``{template_id: set(tax_ids)}`` for the templates of ``templates``
+        (all targeted templates by default) that an active timeline covers.
+        Where timelines overlap, the latest created one applies: products and
+        invoice lines only take a single tax (see ``_check_only_one_tax``).
+        """
+        tax_rel = self._fields['tax_ids']
+        where = SQL("t.start_date <= %s AND t.end_date >= %s", day, day)
+        if templates is not None:
+            where = SQL("%s AND pp.product_tmpl_id IN %s", where, tuple(templates.ids) or (None,))
+        query = SQL("""
+            SELECT winner.product_tmpl_id, tr.%s
+              FROM (SELECT DISTINCT ON (pp.product_tmpl_id) pp.product_tmpl_id, t.id AS timeline_id
+                      FROM product_timeline_tax t
+                      JOIN (%s) target ON target.timeline_id = t.id
+                      JOIN product_product pp ON pp.id = target.product_id
+                     WHERE %s
+                     ORDER BY pp.product_tmpl_id, t.id DESC) winner
+              JOIN %s tr ON tr.%s = winner.timeline_id
+        """, SQL.identifier(tax_rel.column2), self._targets_sql(), where,
+            SQL.identifier(tax_rel.relation), SQL.identifier(tax_rel.column1))
+        self.env.cr.execute(query)
+        taxes = defaultdict(set)
+        for template_id, tax_id in self.env.cr.fetchall():
+            taxes[template_id].add(tax_id)
+        return taxes
+
+    @api.model
+    def update_sales_taxes(self, templates=None):
+        """Set the sales taxes of the products covered by today's timelines.
+
+        The taxes wanted for each template are diffed against its current ones
+        and only the templates that differ are written, one write per distinct
+        tax set. Returns the counts and timings of the run.
+
+        Templates no timeline covers any more are intentionally left as they
+        are: their taxes before the timeline are not kept, so an ended
+        timeline's taxes stay until another timeline applies.
+        """
+        started = time.perf_counter()
+        today = date.today()
+        desired = self._get_effective_template_taxes(today, templates)
+        resolved = time.perf_counter()
+
+        taxes_field = self.env['product.template']._fields['taxes_id']
+        current = defaultdict(set)
+        if desired:
+            self.env['product.template'].flush_model(['taxes_id'])
+            self.env.cr.execute(f"""
+                SELECT {taxes_field.column1}, {taxes_field.column2}
+                  FROM {taxes_field.relation}
+                 WHERE {taxes_field.column1} IN %s
+            """, [tuple(desired)])
+            for template_id, tax_id in self.env.cr.fetchall():
+                current[template_id].add(tax_id)
+
+        to_write = defaultdict(list)
+        for template_id, tax_ids in desired.items():
+            if current[template_id] != tax_ids:
+                to_write[frozenset(tax_ids)].append(template_id)
+        diffed = time.perf_counter()
 
-        updated_products = set()
-        for tax_record in tax_records:
-            for product in tax_record.product_ids:
-                if product.product_tmpl_id:
-                    product.product_tmpl_id.sudo().write({"taxes_id": [(6, 0, tax_record.tax_ids.ids)]})
-                    updated_products.add(product.id)
+        Template = self.env['product.template'].sudo().with_context(tax_timeline_update=True)
+        for tax_ids, template_ids in to_write.items():
+            Template.browse(template_ids).write({"taxes_id": [(6, 0, list(tax_ids))]})
+        done = time.perf_counter()
 
-        return f"Updated sales taxes for {len(updated_products)} unique products."
+        result = {
+            'templates': len(desired),
+            'updated': sum(len(template_ids) for template_ids in to_write.values()),
+            'writes': len(to_write),
+            'resolve_ms': (resolved - started) * 1000,
+            'diff_ms': (diffed - resolved) * 1000,
+            'write_ms': (done - diffed) * 1000,
+        }
+        _logger.info("Sales taxes: %(updated)s of %(templates)s templates updated in %(writes)s writes "
+                     "(resolve %(resolve_ms).0f ms, diff %(diff_ms).0f ms, write %(write_ms).0f ms)", result)
+        return result
@@ -1,6 +1,42 @@
-from odoo import models, fields
+from odoo import api, models, fields
 
 class ProductTemplateInherit(models.Model):
     _inherit = 'product.template'
 
     is_charging = fields.Boolean(string='Extra Charge Product', default=False)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        templates = super().create(vals_list)
+        self.env['product.timeline.tax']._invalidate_for_products()
+        return templates
+
+    def write(self, vals):
+        result = super().write(vals)
+        self.env['product.timeline.tax']._invalidate_for_products(vals)
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env['product.timeline.tax']._invalidate_for_products()
+        return result
+
+
+class ProductProductInherit(models.Model):
+    _inherit = 'product.product'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        products = super().create(vals_list)
+        self.env['product.timeline.tax']._invalidate_for_products()
+        return products
+
+    def write(self, vals):
+        result = super().write(vals)
+        self.env['product.timeline.tax']._invalidate_for_products(vals)
+        return result
+
+    def unlink(self):
+        result = super().unlink()
+        self.env['product.timeline.tax']._invalidate_for_products()
+        return result
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+from . import test_submission_ledger
+from . import test_fiscal_queue
+from . import test_tax_timeline
+from . import test_qr_code
+from . import test_sdc_lookup
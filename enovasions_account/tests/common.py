@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+import base64
+from datetime import timedelta
+
+from odoo import Command, fields
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+
+
+class FrcsTestCommon(AccountTestInvoicingCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.system = cls.env['branch.systems'].create({
+            'system_name': 'Test VSDC',
+            'pfx_file': base64.b64encode(b'test certificate'),
+            'pfx_filename': 'test.pfx',
+            'pfx_password': 'secret',
+            'pfx_uid': 'UID',
+            'pfx_pac': 'PAC',
+            'pfx_expiry_date': fields.Datetime.now() + timedelta(days=365),
+            'branch_id': cls.env.company.id,
+        })
+
+    @classmethod
+    def _create_invoice(cls):
+        return cls.env['account.move'].create({
+            'move_type': 'out_invoice',
+            'partner_id': cls.partner_a.id,
+            'system_id': cls.system.id,
+            'invoice_line_ids': [Command.create({'product_id': cls.product_a.id, 'price_unit': 100.0})],
+        })
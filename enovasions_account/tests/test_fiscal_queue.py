@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from odoo.addons.enovasions_account.tests.common import FrcsTestCommon
+from odoo.addons.enovasions_vms_integration.tools.vsdc_client import (
+    RESET_TIMEOUT, VsdcConnectionError, VsdcOutcomeUnknown, VsdcUnavailable,
+)
+
+
+@tagged('post_install', '-at_install')
+class TestFiscalQueue(FrcsTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Queue = cls.env['frcs.fiscal.queue']
+        cls.env['ir.config_parameter'].sudo().set_param('enovasions_account.fiscal_queue_max_attempts', 3)
+
+    def setUp(self):
+        super().setUp()
+        # the invoices sent, in order; an exception in `errors` is returned instead
+        self.sent = []
+        self.errors = []
+        test = self
+
+        def send(move):
+            if test.errors:
+                return False, test.errors.pop(0)
+            test.sent.append(move.id)
+            return False, None
+
+        def send_frcs_request(self):
+            return send(self)
+
+        def submit_frcs_payload(self, body, transaction_type):
+            return send(self)
+
+        Move = self.registry['account.move']
+        for patcher in (patch.object(Move, '_send_frcs_request', send_frcs_request),
+                        patch.object(Move, '_submit_frcs_payload', submit_frcs_payload)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _job(self, **vals):
+        return self.Queue.create(dict({'move_id': self._create_invoice().id}, **vals))
+
+    def _journal_job(self, sequence):
+        return self._job(is_offline=True, sequence=sequence, payload='{}', transaction_type='Normal')
+
+    def assertAbout(self, date, seconds):
+        self.assertAlmostEqual(date, fields.Datetime.now() + timedelta(seconds=seconds), delta=timedelta(seconds=5))
+
+    # ********* Claiming *********
+    def test_claim_skips_jobs_not_due(self):
+        waiting = self._job(next_attempt_date=fields.Datetime.now() + timedelta(hours=1))
+        due = self._job(next_attempt_date=fields.Datetime.now() - timedelta(minutes=1))
+        fresh = self._job()
+
+        self.Queue._cron_process_queue()
+
+        self.assertEqual(self.sent, [due.move_id.id, fresh.move_id.id])
+        self.assertEqual(waiting.state, 'pending')
+        self.assertEqual((due | fresh).mapped('state'), ['done', 'done'])
+
+    def test_claim_skips_journal_behind_backoff(self):
+        first = self._journal_job(1)
+        second = self._journal_job(2)
+        first.next_attempt_date = fields.Datetime.now() + timedelta(hours=1)
+
+        self.Queue._cron_process_queue()
+
+        self.assertFalse(self.sent)
+        self.assertEqual((first | second).mapped('state'), ['pending', 'pending'])
+
+    # ********* Store-and-forward ordering *********
+    def test_journal_is_forwarded_in_sequence(self):
+        second = self._journal_job(2)
+        first = self._journal_job(1)
+
+        second._execute()
+        self.assertFalse(self.sent, "a journal entry never overtakes its predecessor")
+        self.assertEqual(second.state, 'pending')
+
+        self.Queue._cron_process_queue()
+        self.assertEqual(self.sent, [first.move_id.id])
+        self.Queue._cron_process_queue()
+        self.assertEqual(self.sent, [first.move_id.id, second.move_id.id])
+
+    def test_journal_waits_for_unreachable_vsdc(self):
+        first = self._journal_job(1)
+        second = self._journal_job(2)
+        self.errors.append(VsdcConnectionError("connection refused"))
+
+        (first | second)._execute()
+
+        self.assertFalse(self.sent)
+        self.assertRecordValues(first | second, [
+            {'state': 'pending', 'attempt_count': 0},
+            {'state': 'pending', 'attempt_count': 0},
+        ])
+        self.assertAbout(first.next_attempt_date, RESET_TIMEOUT)
+        self.assertEqual(second.next_attempt_date, first.next_attempt_date)
+
+    # ********* Attempts and backoff *********
+    def test_failures_back_off_then_fail(self):
+        job = self._job()
+        self.errors += [UserError("rejected")] * 3
+
+        job._execute()
+        self.assertRecordValues(job, [{'state': 'pending', 'attempt_count': 1}])
+        self.assertAbout(job.next_attempt_date, 30)
+
+        job._execute()
+        self.assertRecordValues(job, [{'state': 'pending', 'attempt_count': 2}])
+        self.assertAbout(job.next_attempt_date, 60)
+
+        job._execute()
+        self.assertRecordValues(job, [{'state': 'failed', 'attempt_count': 3, 'last_error': 'rejected'}])
+
+    def test_backoff_is_capped(self):
+        self.env['ir.config_parameter'].sudo().set_param('enovasions_account.fiscal_queue_backoff_cap', 100)
+        self.assertAbout(self.Queue._get_retry_date(10), 100)
+
+    def test_unavailable_vsdc_spends_no_attempt(self):
+        job = self._job()
+        self.errors.append(VsdcUnavailable("circuit open"))
+
+        self.assertEqual(job._execute(), 0)
+        self.assertRecordValues(job, [{'state': 'pending', 'attempt_count': 0}])
+        self.assertAbout(job.next_attempt_date, RESET_TIMEOUT)
+
+    def test_unknown_outcome_is_not_retried(self):
+        job = self._job()
+        self.errors.append(VsdcOutcomeUnknown("read timed out"))
+
+        job._execute()
+        self.assertRecordValues(job, [{'state': 'failed', 'attempt_count': 1}])
+
+    def test_retry_resets_backoff(self):
+        job = self._job(state='failed', attempt_count=3, next_attempt_date=fields.Datetime.now() + timedelta(hours=1))
+        job.action_retry()
+        self.assertRecordValues(job, [{'state': 'pending', 'attempt_count': 0, 'next_attempt_date': False}])
+        self.assertEqual(job._execute(), 1)
+        self.assertEqual(job.state, 'done')
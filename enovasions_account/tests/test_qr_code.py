@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import base64
+import io
+
+from PIL import Image
+
+from odoo.tests import tagged
+
+from odoo.addons.enovasions_account.tests.common import FrcsTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestQrCode(FrcsTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.QrCode = cls.env['frcs.qr.code']
+        cls.png = cls._png('black')
+        cls.other_png = cls._png('white')
+
+    @classmethod
+    def _png(cls, color):
+        buffer = io.BytesIO()
+        Image.new('RGB', (4, 4), color).save(buffer, format='PNG')
+        return base64.b64encode(buffer.getvalue())
+
+    def test_same_content_is_stored_once(self):
+        qr = self.QrCode._get_or_create(self.png)
+        self.assertEqual(self.QrCode._get_or_create(self.png), qr)
+        # the same PNG given as str
+        self.assertEqual(self.QrCode._get_or_create(self.png.decode('ascii')), qr)
+        self.assertEqual(self.QrCode.search_count([('checksum', '=', qr.checksum)]), 1)
+
+    def test_other_content_gets_its_own_record(self):
+        qr = self.QrCode._get_or_create(self.png)
+        other = self.QrCode._get_or_create(self.other_png)
+        self.assertTrue(other)
+        self.assertNotEqual(other, qr)
+        self.assertEqual(base64.b64decode(other.data), base64.b64decode(self.other_png))
+
+    def test_empty_content(self):
+        self.assertFalse(self.QrCode._get_or_create(False))
+        self.assertFalse(self.QrCode._get_or_create(b''))
+
+    def test_documents_share_the_stored_qr(self):
+        first, second = self._create_invoice(), self._create_invoice()
+        first.qr_code = self.png
+        second.qr_code = self.png
+        self.assertTrue(first.qr_code_id)
+        self.assertEqual(second.qr_code_id, first.qr_code_id)
+        self.assertFalse(self.env['ir.attachment'].search_count([
+            ('res_model', '=', 'account.move'),
+            ('res_field', '=', 'qr_code'),
+            ('res_id', 'in', (first + second).ids),
+        ]))
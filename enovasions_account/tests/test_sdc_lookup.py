@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import json
+
+from odoo.tests import tagged
+
+from odoo.addons.enovasions_account.tests.common import FrcsTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestSdcLookup(FrcsTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Move = cls.env['account.move']
+        cls.invoice = cls._create_invoice()
+        cls.invoice.post_response = json.dumps({'invoiceNumber': 'LOOKUP-INV-1', 'totalAmount': 100})
+        cls.refund = cls._create_invoice()
+        cls.refund.write({
+            'post_response': json.dumps({'invoiceNumber': 'LOOKUP-REF-1', 'totalAmount': 100}),
+            'origin_doc_num': 'LOOKUP-INV-1',
+        })
+
+    def _match(self, move, field):
+        return {'model': 'account.move', 'id': move.id, 'display_name': move.display_name, 'field': field}
+
+    def test_numbers_resolve_to_their_documents(self):
+        self.assertEqual(self.invoice.ref_doc_num, 'LOOKUP-INV-1')
+        result = self.Move.lookup_by_sdc_number(['LOOKUP-INV-1', 'LOOKUP-REF-1'])
+        self.assertCountEqual(result['LOOKUP-INV-1'], [
+            self._match(self.invoice, 'ref_doc_num'),
+            # the refund is also found by the number it refers to
+            self._match(self.refund, 'origin_doc_num'),
+        ])
+        self.assertEqual(result['LOOKUP-REF-1'], [self._match(self.refund, 'ref_doc_num')])
+
+    def test_unknown_numbers_map_to_nothing(self):
+        self.assertEqual(self.Move.lookup_by_sdc_number(['LOOKUP-NONE']), {'LOOKUP-NONE': []})
+
+    def test_input_is_cleaned(self):
+        result = self.Move.lookup_by_sdc_number([' LOOKUP-REF-1 ', 'LOOKUP-REF-1', '', '  ', None])
+        self.assertEqual(result, {'LOOKUP-REF-1': [self._match(self.refund, 'ref_doc_num')]})
+        self.assertEqual(self.Move.lookup_by_sdc_number([]), {})
+        self.assertEqual(self.Move.lookup_by_sdc_number(None), {})
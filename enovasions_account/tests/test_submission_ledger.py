@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+
+from odoo.exceptions import UserError
+from odoo.tests import tagged
+
+from odoo.addons.enovasions_account.models.frcs_submission_ledger import StoredResponse
+from odoo.addons.enovasions_account.tests.common import FrcsTestCommon
+from odoo.addons.enovasions_vms_integration.tools.vsdc_client import VsdcOutcomeUnknown
+
+
+@tagged('post_install', '-at_install')
+class TestSubmissionLedger(FrcsTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.ledger = cls.env['frcs.submission.ledger']
+        cls.move = cls._create_invoice()
+
+    def _sender(self, *responses):
+        calls = []
+        responses = list(responses)
+
+        def send():
+            calls.append(True)
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        return send, calls
+
+    def _entries(self, move=None):
+        return self.ledger.search([('move_id', '=', (move or self.move).id)])
+
+    def test_accepted_payload_is_not_sent_twice(self):
+        send, calls = self._sender(StoredResponse(201, b'{"invoiceNumber": "A-1"}'))
+        first, _error = self.ledger._submit(self.move, '{"a": 1}', send)
+        second, error = self.ledger._submit(self.move, '{"a": 1}', send)
+
+        self.assertEqual(len(calls), 1)
+        self.assertIsNone(error)
+        self.assertEqual(second.status, 201)
+        self.assertEqual(second.data, first.data)
+        entry = self._entries()
+        self.assertRecordValues(entry, [{'state': 'sent', 'status_code': 201, 'attempt_count': 1}])
+
+    def test_attempts_share_one_entry_per_payload(self):
+        send, calls = self._sender(StoredResponse(400, b'{"message": "bad"}'), StoredResponse(201, b'{}'))
+        self.ledger._submit(self.move, '{"a": 1}', send)
+        self.assertEqual(self._entries().state, 'failed')
+
+        self.ledger._submit(self.move, '{"a": 1}', send)
+        self.assertEqual(len(calls), 2)
+        self.assertRecordValues(self._entries(), [{'state': 'sent', 'status_code': 201, 'attempt_count': 2}])
+
+    def test_other_payload_is_sent(self):
+        send, calls = self._sender(StoredResponse(201, b'{}'), StoredResponse(201, b'{}'))
+        self.ledger._submit(self.move, '{"a": 1}', send)
+        self.ledger._submit(self.move, '{"a": 2}', send)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(self._entries()), 2)
+
+    def test_payload_is_deduplicated_per_move(self):
+        other = self._create_invoice()
+        send, calls = self._sender(StoredResponse(201, b'{}'), StoredResponse(201, b'{}'))
+        self.ledger._submit(self.move, '{"a": 1}', send)
+        self.ledger._submit(other, '{"a": 1}', send)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(self._entries(other)), 1)
+
+    def test_unknown_outcome_blocks_resend_until_settled(self):
+        payload_hash = self.ledger._hash_payload('{"a": 1}')
+        self.ledger._log_attempts([(self.move, payload_hash, self.move.create_date, None,
+                                    VsdcOutcomeUnknown("read timed out"))])
+        entry = self._entries()
+        self.assertEqual(entry.state, 'unknown')
+
+        send, calls = self._sender(StoredResponse(201, b'{}'))
+        with self.assertRaises(VsdcOutcomeUnknown):
+            self.ledger._submit(self.move, '{"a": 1}', send)
+        with self.assertRaises(VsdcOutcomeUnknown):
+            self.ledger._submit(self.move, '{"a": 2}', send)
+        self.assertFalse(calls)
+
+        entry.action_mark_not_received()
+        self.ledger._submit(self.move, '{"a": 1}', send)
+        self.assertEqual(len(calls), 1)
+        self.assertRecordValues(entry, [{'state': 'sent', 'attempt_count': 2}])
+
+    def _patch_sending(self, send):
+        """Make the move's VSDC request post through ``send``."""
+        request = {'body': '{"a": 1}', 'transaction_type': 'Normal'}
+        for patcher in (
+            patch.object(self.registry['account.move'], '_prepare_frcs_request', lambda move: request),
+            patch.object(self.registry['branch.systems'], '_vsdc_invoice_request', lambda system, body: send),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_unknown_outcome_survives_the_caller(self):
+        send, calls = self._sender(VsdcOutcomeUnknown("read timed out"), StoredResponse(201, b'{}'))
+        self._patch_sending(send)
+
+        # a caller rolling back its savepoint on error must not lose the attempt
+        with self.env.cr.savepoint():
+            action = self.move.action_send_request()
+        self.assertEqual(action['params']['type'], 'danger')
+        self.assertRecordValues(self._entries(), [{'state': 'unknown', 'attempt_count': 1}])
+
+        with self.assertRaises(VsdcOutcomeUnknown):
+            self.move.action_send_request()
+        self.assertEqual(len(calls), 1)
+
+    def test_accepted_response_survives_processing_error(self):
+        send, calls = self._sender(StoredResponse(201, b'{}'))
+        self._patch_sending(send)
+
+        def process(move, response, transaction_type):
+            raise UserError("QR generation failed")
+
+        with patch.object(self.registry['account.move'], '_process_frcs_response', process):
+            with self.env.cr.savepoint():
+                action = self.move.action_send_request()
+        self.assertIn("QR generation failed", action['params']['message'])
+        self.assertRecordValues(self._entries(), [{'state': 'sent', 'status_code': 201}])
+
+        # the retry reuses the stored answer instead of posting again
+        with patch.object(self.registry['account.move'], '_process_frcs_response', lambda *args: True):
+            self.move.action_send_request()
+        self.assertEqual(len(calls), 1)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from datetime import date, timedelta
+
+from odoo import Command
+from odoo.exceptions import ValidationError
+from odoo.tests import tagged
+
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+
+
+@tagged('post_install', '-at_install')
+class TestTaxTimeline(AccountTestInvoicingCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.Timeline = cls.env['product.timeline.tax']
+        Tax = cls.env['account.tax']
+        cls.tax_own = Tax.create({'name': 'Own 5%', 'amount': 5, 'type_tax_use': 'sale'})
+        cls.tax_a = Tax.create({'name': 'Timeline 10%', 'amount': 10, 'type_tax_use': 'sale'})
+        cls.tax_b = Tax.create({'name': 'Timeline 20%', 'amount': 20, 'type_tax_use': 'sale'})
+        cls.parent_categ = cls.env['product.category'].create({'name': 'Timeline Parent'})
+        cls.child_categ = cls.env['product.category'].create({'name': 'Timeline Child', 'parent_id': cls.parent_categ.id})
+        cls.other_categ = cls.env['product.category'].create({'name': 'Timeline Other'})
+        cls.product_child = cls._create_product('Child Product', cls.child_categ)
+        cls.product_other = cls._create_product('Other Product', cls.other_categ)
+        cls.product_coded = cls._create_product('Coded Product', cls.other_categ, default_code='TL-DOMAIN')
+        cls.today = date.today()
+
+    @classmethod
+    def _create_product(cls, name, categ, **vals):
+        return cls.env['product.product'].create(dict({
+            'name': name,
+            'categ_id': categ.id,
+            'taxes_id': [Command.set(cls.tax_own.ids)],
+        }, **vals))
+
+    def _timeline(self, start, end, taxes, **targets):
+        return self.Timeline.create(dict({
+            'start_date': self.today + timedelta(days=start),
+            'end_date': self.today + timedelta(days=end),
+            'tax_ids': [Command.set(taxes.ids)],
+        }, **targets))
+
+    def _effective(self, product, day):
+        return self.Timeline.get_effective_taxes(product, self.today + timedelta(days=day))[product.id]
+
+    # ********* Targets *********
+    def test_category_targets_descendants(self):
+        self._timeline(0, 10, self.tax_a, categ_ids=[Command.set(self.parent_categ.ids)])
+        self.assertEqual(self.product_child.taxes_id, self.tax_a)
+        self.assertEqual(self.product_other.taxes_id, self.tax_own)
+        self.assertEqual(self._effective(self.product_child, 3), self.tax_a)
+
+    def test_domain_target(self):
+        self._timeline(0, 10, self.tax_a, product_domain="[('default_code', '=', 'TL-DOMAIN')]")
+        self.assertEqual(self.product_coded.taxes_id, self.tax_a)
+        self.assertEqual(self.product_other.taxes_id, self.tax_own)
+
+    def test_new_product_joins_category_target(self):
+        self._timeline(1, 10, self.tax_a, categ_ids=[Command.set(self.parent_categ.ids)])
+        self.assertEqual(self._effective(self.product_child, 2), self.tax_a)
+        late = self._create_product('Late Product', self.child_categ)
+        self.assertEqual(self._effective(late, 2), self.tax_a)
+
+    def test_invalid_domain_is_rejected(self):
+        for domain in ["[('default_code', '=', ", "[('no_such_field', '=', 1)]", "42"]:
+            with self.assertRaises(ValidationError):
+                self._timeline(0, 10, self.tax_a, product_domain=domain)
+
+    # ********* Date ranges *********
+    def test_overlapping_ranges_of_a_tax_are_rejected(self):
+        self._timeline(1, 5, self.tax_a, product_ids=[Command.set(self.product_child.ids)])
+        with self.assertRaises(ValidationError):
+            self._timeline(5, 9, self.tax_a, product_ids=[Command.set(self.product_other.ids)])
+        # adjacent ranges are fine
+        self._timeline(6, 9, self.tax_a, product_ids=[Command.set(self.product_other.ids)])
+
+    def test_interval_index(self):
+        products = [Command.set(self.product_child.ids)]
+        self._timeline(1, 4, self.tax_a, product_ids=products)
+        self._timeline(5, 9, self.tax_b, product_ids=products)
+        self.assertEqual(self._effective(self.product_child, 0), self.tax_own)
+        self.assertEqual(self._effective(self.product_child, 1), self.tax_a)
+        self.assertEqual(self._effective(self.product_child, 4), self.tax_a)
+        self.assertEqual(self._effective(self.product_child, 5), self.tax_b)
+        self.assertEqual(self._effective(self.product_child, 10), self.tax_own)
+
+    def test_overlapping_timelines_latest_wins(self):
+        self._timeline(0, 10, self.tax_a, categ_ids=[Command.set(self.parent_categ.ids)])
+        self._timeline(0, 5, self.tax_b, product_ids=[Command.set(self.product_child.ids)])
+        self.assertEqual(self.product_child.taxes_id, self.tax_b)
+        self.assertEqual(self._effective(self.product_child, 3), self.tax_b)
+        self.assertEqual(self._effective(self.product_child, 7), self.tax_a)
+
+    # ********* Applying taxes *********
+    def test_grouped_writes_and_idempotent_rerun(self):
+        products = [Command.set((self.product_child | self.product_other).ids)]
+        self._timeline(1, 10, self.tax_a, product_ids=products)
+        # nothing to apply today: the timeline starts tomorrow
+        self.assertEqual(self.product_child.taxes_id, self.tax_own)
+
+        self._timeline(0, 0, self.tax_b, product_ids=products)
+        self.assertEqual((self.product_child | self.product_other).taxes_id, self.tax_b)
+
+        result = self.Timeline.update_sales_taxes()
+        self.assertEqual(result['updated'], 0)
+        self.assertEqual(result['writes'], 0)
+
+    def test_diff_groups_templates_per_tax_set(self):
+        templates = (self.product_child | self.product_other).product_tmpl_id
+        self._timeline(0, 10, self.tax_a, product_ids=[Command.set((self.product_child | self.product_other).ids)])
+        templates.write({'taxes_id': [Command.set(self.tax_own.ids)]})
+        result = self.Timeline.update_sales_taxes(templates=templates)
+        self.assertEqual(result['updated'], 2)
+        self.assertEqual(result['writes'], 1)
+
+    # ********* Boundaries *********
+    def test_next_boundary(self):
+        self._timeline(2, 4, self.tax_a, product_ids=[Command.set(self.product_child.ids)])
+        self._timeline(7, 9, self.tax_b, product_ids=[Command.set(self.product_child.ids)])
+        self.assertEqual(self.Timeline._get_next_boundary(self.today), self.today + timedelta(days=2))
+        self.assertEqual(self.Timeline._get_next_boundary(self.today + timedelta(days=2)), self.today + timedelta(days=5))
+        self.assertEqual(self.Timeline._get_next_boundary(self.today + timedelta(days=5)), self.today + timedelta(days=7))
+        self.assertIsNone(self.Timeline._get_next_boundary(self.today + timedelta(days=10)))
@@ -8,7 +8,7 @@
     "website": "https://enovasions.com",
     "license": "OEEL-1",
     "icon": "/enovasions_pos/static/description/icon.png",
-    "depends": ["point_of_sale", "pos_sale", "enovasions_vms_integration", "enovasions_account"],
+    "depends": ["point_of_sale", "pos_sale", "enovasions_vms_integration", "enovasions_account", "enovasions_sale"],
     "data": [
         "security/ir.model.access.csv",
         "views/pos_config_views.xml",
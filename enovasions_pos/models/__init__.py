@@ -1,3 +1,4 @@
 from . import pos_config
+from . import frcs_payload_builder
 from . import pos_order
 from . import pos_order
\ No newline at end of file
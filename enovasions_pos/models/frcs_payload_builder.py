@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from odoo import api, models
+from datetime import timezone
+
+import logging
+_logger = logging.getLogger(__name__)
+
+
+class FrcsPayloadBuilder(models.AbstractModel):
+    """POS payments and UTC issue dates."""
+    _inherit = 'frcs.payload.builder'
+
+    @api.model
+    def _prefetch_moves(self, moves):
+        moves = super()._prefetch_moves(moves)
+        moves.pos_order_ids.payment_ids.fetch(['amount', 'payment_method_id'])
+        moves.pos_order_ids.payment_ids.payment_method_id.fetch(['name'])
+        return moves
+
+    @api.model
+    def _format_issue_date(self, date):
+        if not date:
+            return None
+        return date.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+    @api.model
+    def _pos_payments(self, move, invoice_type):
+        return move.pos_order_ids.payment_ids
+
+    @api.model
+    def _move_payments(self, move, invoice_type):
+        if invoice_type != "Copy" and not self._pos_payments(move, invoice_type):
+            if move.partner_id.charge_customer is True or move.move_type != 'out_invoice':
+                # charge customers and refunds report what was actually collected
+                return self._matched_payments(move)
+        return super()._move_payments(move, invoice_type)
+
+    @api.model
+    def _move_item_name(self, move, line, invoice_type):
+        if invoice_type == "Copy":
+            return line.product_id.name or line.name or "Item"
+        return super()._move_item_name(move, line, invoice_type)
@@ -8,6 +8,9 @@ class PosConfigInherit(models.Model):
     _inherit = 'pos.config'
 
     system_id = fields.Many2one("branch.systems",string="System",required=False)
+    fiscal_offline_mode = fields.Boolean(string="Offline Fiscalization",
+        help="Journal the FRCS payload locally when the VSDC cannot be reached, print a pending "
+             "fiscalization receipt and forward the journal in order once the VSDC is back.")
 
 
    
\ No newline at end of file
@@ -12,6 +12,7 @@ import os
 import io
 from odoo.exceptions import UserError
 from PIL import Image
+from odoo.addons.enovasions_vms_integration.tools import qr_image
 import pytz
 from dateutil import parser
 import sys
@@ -20,33 +21,19 @@ import logging
 _logger = logging.getLogger(__name__)
 
 
-class AccountPaymentRegister(models.TransientModel):
-    _inherit = 'account.payment.register'
-
-    def action_create_payments(self):
-        result = super().action_create_payments()
-        invoices = self.line_ids.mapped('move_id').filtered(lambda m: m.move_type == 'out_invoice')
-        if invoices:
-            payments = self.env['account.payment'].search([
-                ('invoice_ids', 'in', invoices.ids),
-                ('state', '=', 'in_process')
-            ])
-            for payment in payments:
-                payment.action_validate()
-        return result
-
-
 class AccountMoveInherit(models.Model):
     _inherit = 'account.move'
 
     post_response = fields.Text("Post response", readonly=True, copy=False)
-    post_response_json = fields.Json(string="Post Response JSON", compute="_compute_post_response_json", store=False, copy=False)
-    qr_code = fields.Image(string="QR Code", attachment=True, store=True, copy=False, readonly=True)
+    post_response_json = fields.Json(string="Post Response JSON", compute="_compute_post_response_json", store=True, copy=False)
+    qr_code_id = fields.Many2one("frcs.qr.code", string="QR Code Record", copy=False, readonly=True)
+    qr_code = fields.Image(string="QR Code", compute="_compute_qr_code", inverse="_inverse_qr_code", copy=False, readonly=True)
     is_post_status = fields.Boolean(default=False, string="Post Status", copy=False)
     # ****** Copy fields
     copy_post_response = fields.Text("Post Copy Response", readonly=True, copy=False)
-    copy_post_response_json = fields.Json(string="Post Copy Response JSON", compute="_compute_post_copy_response_json", store=False, copy=False)
-    copy_qr_code = fields.Image(string="QR Code", attachment=True, store=True, copy=False, readonly=True)
+    copy_post_response_json = fields.Json(string="Post Copy Response JSON", compute="_compute_post_copy_response_json", store=True, copy=False)
+    copy_qr_code_id = fields.Many2one("frcs.qr.code", string="Copy QR Code Record", copy=False, readonly=True)
+    copy_qr_code = fields.Image(string="QR Code", compute="_compute_copy_qr_code", inverse="_inverse_copy_qr_code", copy=False, readonly=True)
     is_copy_post_status = fields.Boolean(default=False, string="Copy Post Status", copy=False)
     # ****** END Copy fields
     system_id = fields.Many2one("branch.systems", string="System", required=True, copy=False)
@@ -58,9 +45,9 @@ class AccountMoveInherit(models.Model):
         ('invoice', 'Invoice'),
         ('refund', 'Refund')],
         default='invoice', string="Transaction Type")
-    ref_doc_num = fields.Text("Reference Doc No", copy=False, compute="_compute_ref_doc_fields", store=True)
+    ref_doc_num = fields.Char("Reference Doc No", copy=False, compute="_compute_ref_doc_fields", store=True, index='trigram')
     ref_doc_date = fields.Datetime("Reference Doc Date", copy=False, compute="_compute_ref_doc_fields", store=True)
-    origin_doc_num = fields.Text("SDC Invoice No", copy=False)
+    origin_doc_num = fields.Char("SDC Invoice No", copy=False, index='trigram')
     origin_doc_date = fields.Datetime("SDC Time", copy=False)
     copy_ref_doc_num = fields.Text("Copy Reference Doc No", copy=False)
     show_send_request_btn = fields.Boolean(compute='_compute_show_send_button', store=True)
@@ -87,29 +74,6 @@ class AccountMoveInherit(models.Model):
         self._onchange_show_send_button()
         return res
 
-    @api.depends('post_response')
-    def _compute_ref_doc_fields(self):
-        for rec in self:
-            if rec.post_response:
-                try:
-                    response_data = json.loads(rec.post_response)
-                except Exception:
-                    response_data = {}
-                sdc_datetime_str = response_data.get('sdcDateTime')
-                if sdc_datetime_str:
-                    sdc_datetime_obj = datetime.fromisoformat(sdc_datetime_str)
-                    sdc_datetime_utc = sdc_datetime_obj.astimezone(timezone.utc)
-                    rec.ref_doc_date = sdc_datetime_utc.replace(tzinfo=None) or False
-                rec.ref_doc_num = response_data.get('invoiceNumber', False)
-
-    @api.depends('post_response')
-    def _compute_post_response_json(self):
-        for record in self:
-            try:
-                record.post_response_json = json.loads(record.post_response) if record.post_response else {}
-            except (json.JSONDecodeError, TypeError):
-                record.post_response_json = {}
-
     def _reverse_moves(self, default_values_list=None, cancel=False):
         self = self.with_context(_reverse_move=True)
         moves = super()._reverse_moves(default_values_list=default_values_list, cancel=cancel)
@@ -131,19 +95,12 @@ class AccountMoveInherit(models.Model):
                 except json.JSONDecodeError:
                     raise ValueError("Invalid JSON format in post_response")
             if qr_code_base64:
-                if qr_code_base64.startswith("data:image"):
-                    qr_code_base64 = qr_code_base64.split(",")[1]
                 try:
-                    qr_code_base64 = qr_code_base64.strip()
-                    decoded_qr = base64.b64decode(qr_code_base64)
-                    image = Image.open(io.BytesIO(decoded_qr))
-                    img_io = io.BytesIO()
-                    image.save(img_io, format="PNG")
-                    img_io.seek(0)
-                    record.qr_code = base64.b64encode(img_io.getvalue())
-                except Exception as e:
+                    # the VSDC already sends PNG, PIL only converts other formats
+                    record.qr_code = qr_image.qr_to_png_base64(qr_code_base64)
+                except ValueError:
                     record.qr_code = False
-                    raise ValueError(f"Error Decoding Base64: {str(e)}")
+                    raise
             else:
                 record.qr_code = False
                 raise ValueError("No QR Code Found in Response")
@@ -177,452 +134,49 @@ class AccountMoveInherit(models.Model):
 
             return False
 
-    def _get_related_sale_order(self, record):
-        # from invoice → SO
-        sale_orders = record.invoice_line_ids.mapped('sale_line_ids.order_id').exists()
-        so = sale_orders[:1]
-        if not so and record.invoice_origin:
-            so = record.env['sale.order'].search([('name', '=', record.invoice_origin)], limit=1)
-        return so
-
-    def ordinal(self, n):
-        return "%d%s" % (
-            n,
-            "th" if 11 <= (n % 100) <= 13 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th"),
+    def _thermal_receipt_payments(self):
+        return [(p.payment_method_id.name or 'Other', p.amount) for p in self.pos_order_ids.payment_ids]
+
+    def _process_frcs_response(self, response, transaction_type):
+        self.ensure_one()
+        record = self
+        _logger.info("FRCS response status: %s", response.status)
+
+        if response.status not in (200, 201):
+            raise ValidationError(("Request failed with status code. Data: %s") % response.data.decode("utf-8"))
+
+        # decode to text so JSON fields can be parsed later
+        record.post_response = response.data.decode("utf-8") if response.data else ""
+        record.is_post_status = True
+        if record.move_type == 'out_refund' and record.reversed_entry_id:
+            record.origin_doc_num = record.reversed_entry_id.ref_doc_num
+            record.origin_doc_date = record.reversed_entry_id.ref_doc_date
+        record.action_generate_qr()
+
+        log_message = "✅ %s invoice request successfully sent by %s on %s." % (
+            transaction_type,
+            self.env.user.name,
+            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
         )
-
-    def _get_installment_number(self, record, so):
-        self_env = record.env['account.move']
-
-        advance_invoices = so.invoice_ids.filtered(
-            lambda m: m.order_type == 'advance'
-            and m.state not in ('cancel')
-            and m.id <= record.id      # so earlier advances + this one
-        ).sorted(lambda m: (m.invoice_date or fields.Date.today(), m.id))
-
-        # position of current invoice in that list = installment number
-        idx = 0
-        for inv in advance_invoices:
-            idx += 1
-            if inv.id == record.id:
-                return idx
-        return 1
-
-    def _get_reference_for_installment(self, record, so):
-        """Return the reference document number + date for this invoice."""
-        advance_invoices = so.invoice_ids.filtered(
-            lambda m: m.order_type == 'advance' and m.state != 'cancel'
-        ).sorted(lambda m: (m.invoice_date or m.create_date, m.id))
-
-        # If this is an advance invoice
-        if record.order_type == 'advance':
-            # Find index
-            idx = 0
-            for i, inv in enumerate(advance_invoices):
-                if inv.id == record.id:
-                    idx = i
-                    break
-
-            # If first advance invoice → no reference
-            if idx == 0:
-                return "", ""
-
-            # Otherwise reference previous advance invoice
-            prev_inv = advance_invoices[idx - 1]
-            return prev_inv.name or "", (
-                prev_inv.invoice_date or prev_inv.create_date
-            ).strftime("%Y-%m-%d %H:%M:%S")
-
-        # If this is final NORMAL invoice
-        elif record.order_type == 'normal':
-            if not advance_invoices:
-                return "", ""
-
-            last_adv = advance_invoices[-1]
-            return last_adv.name or "", (
-                last_adv.invoice_date or last_adv.create_date
-            ).strftime("%Y-%m-%d %H:%M:%S")
-
-        return "", ""
-
-    
-
-    def action_send_request(self):
-        for record in self:
-            if not record.system_id:
-                raise ValidationError(_("Please configure the required Branch Certification."))
-
-            # Enforce "must be fully paid when not a charge customer"
-            if not self._check_full_payment():
-                if not getattr(record.partner_id, 'charge_customer', False):
-                    raise ValidationError(_('The invoice has not been fully paid. Please complete the full payment to proceed'))
-
-            _logger.info("record.system_id.pfx_status: %s", record.system_id.pfx_status)
-            if record.system_id.pfx_status is True:
-                if record.move_type in ['out_invoice', 'out_refund']:
-                    # Certificates
-                    # path = record.system_id.pfx_file_path
-
-                    # base_path = "C:/Program Files/Odoo 18.0.2025090/VSDC/"
-
-                    # cert_file = os.path.join(base_path, "certificate.pem")
-                    # key_file = os.path.join(base_path, "private_key.pem")
-
-                    # print("cert_file",cert_file)
-                    # print("key_file",key_file)
-
-                    # password = record.system_id.pfx_password
-                    # pac_value = record.system_id.pfx_pac
-                    # pfx_expiry_date = record.system_id.pfx_expiry_date
-
-                    path = record.system_id.pfx_file_path
-
-                    cert_file = os.path.join(os.path.dirname(path), "certificate.pem")
-                    key_file = os.path.join(os.path.dirname(path), "private_key.pem")
-
-                    print("cert_file",cert_file)
-                    print("key_file",key_file)
-
-                    password = record.system_id.pfx_password
-                    pac_value = record.system_id.pfx_pac
-                    pfx_expiry_date = record.system_id.pfx_expiry_date
-
-                    if not cert_file or not key_file or not password or not pac_value:
-                        raise ValidationError(_("Please configure the required certification in Branch Systems."))
-                    if pfx_expiry_date and pfx_expiry_date < datetime.now():
-                        raise ValidationError(_("Certification in Branch Systems is expired."))
-
-                    # Types
-                    if record.order_type == 'advance':
-                        invoiceType = "Advance"
-                    elif record.order_type == 'training':
-                        invoiceType = "Training"
-                    else:
-                        invoiceType = "Normal"
-
-                    transactionType = "Sale" if record.move_type == 'out_invoice' else "Refund"
-                    _logger.info("Transaction : %s", record.move_type)
-                    _logger.info("Record Type : %s", record.order_type)
-
-                    invoice_data = {
-                        'dateAndTimeOfIssue': (record.create_date.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z' if record.create_date else None),
-                        'cashier': record.invoice_user_id.vat,
-                        'buyerId': record.partner_id.id,
-                        'buyerCostCenterId': record.buyer_cost_centerid or None,
-                        'invoiceType': invoiceType,
-                        'transactionType': transactionType,
-                        'payment': [],
-                        'invoiceNumber': '32/2.01',
-                        'referentDocumentNumber': '',
-                        'referentDocumentDT': '',
-                        'items': []
-                    }
-
-                    # Refund references
-                    if record.move_type == 'out_refund' and record.reversed_entry_id:
-                        invoice_data['referentDocumentNumber'] = record.reversed_entry_id.ref_doc_num
-                        invoice_data['referentDocumentDT'] = record.reversed_entry_id.ref_doc_date.strftime('%Y-%m-%d %H:%M:%S') if record.reversed_entry_id.ref_doc_date else ''
-
-                    # Items
-                    if record.order_type == "advance":
-                        _logger.info("Order Type adv : %s", record.order_type)
-                        
-                        # sale_orders = record.invoice_line_ids.mapped('sale_line_ids.order_id').exists()
-                        # so = sale_orders[:1]
-                        # if not so and record.invoice_origin:
-                        #     so = record.env['sale.order'].search([('name', '=', record.invoice_origin)], limit=1)
-
-                        # if so:
-                        #     for so_line in so.order_line:
-                        #         if so_line.display_type or getattr(so_line, "is_downpayment", False):
-                        #             continue
-                        #         tax_labels = [t.invoice_label for t in so_line.tax_id]
-                        #         invoice_data["items"].append({
-                        #             "name": so_line.product_id.name,
-                        #             "quantity": so_line.product_uom_qty,
-                        #             "discount": getattr(so_line, "discount", 0.0) or 0.0,
-                        #             "unitPrice": so_line.price_unit,
-                        #             "totalAmount": so_line.price_total,
-                        #             "labels": tax_labels,
-                        #         }) 
-
-                        so = self._get_related_sale_order(record) 
-                        if so:
-
-                           # All advance invoices (in order)
-                            advance_invoices = so.invoice_ids.filtered(
-                                lambda m: m.order_type == 'advance' and m.state != 'cancel'
-                            ).sorted(lambda m: (m.invoice_date or m.create_date, m.id))
-
-                            # Find position
-                            adv_ids = advance_invoices.ids
-                            try:
-                                idx = adv_ids.index(record.id)
-                            except ValueError:
-                                idx = -1
-
-                            # Previous advance invoice
-                            previous_inv = advance_invoices[idx - 1] if idx > 0 else None
-
-                            # Read previous invoice's stored REF fields
-                            if previous_inv:
-                                ref_no = previous_inv.ref_doc_num or ''
-                                dt = previous_inv.ref_doc_date or previous_inv.invoice_date or previous_inv.create_date
-                                ref_dt = dt.strftime('%Y-%m-%d %H:%M:%S')
-                            else:
-                                ref_no = ''
-                                ref_dt = ''
-
-                            # Assign to payload
-                            invoice_data["referentDocumentNumber"] = ref_no
-                            invoice_data["referentDocumentDT"] = ref_dt
-                            # invoice_data["invoiceType"] = "Normal" 
- 
-                            inst_no = self._get_installment_number(record, so)
-                            inst_label = self.ordinal(inst_no) 
- 
-                            base_so_line = so.order_line.filtered(
-                                lambda l: not l.display_type and not getattr(l, "is_downpayment", False)
-                            )[:1]
-
-                            base_name = base_so_line.product_id.name if base_so_line else ""
-    
-                            # ------- Correct TAX LABEL extraction -------
-                            # if base_so_line:
-                            #     tax_labels = [t.invoice_label for t in base_so_line.tax_id]
-                            # else:
-                            #     tax_labels = []
-                            # _logger.info("tax_labels : %s", tax_labels)
-
-                            # ------- Build item -------
-                            # invoice_data["items"].append({
-                            #     "name": item_name,
-                            #     "quantity": 1,
-                            #     "discount": 0.0,
-                            #     "unitPrice": record.amount_untaxed,
-                            #     "totalAmount": record.amount_untaxed,
-                            #     "labels": tax_labels,
-                            # })
-
-                            if transactionType == 'Refund':
-
-                                _logger.info("Advance REFUND logic triggered")
-
-                                # The original advance sale this refund reverses
-                                orig = record.reversed_entry_id
-
-                                # Build advance SALE chain only (exclude refunds/copies)
-                                advances = so.invoice_ids.filtered(
-                                    lambda m:
-                                        m.move_type == 'out_invoice'
-                                        and m.state != 'cancel'
-                                        and (getattr(m, 'order_type', '') == 'advance'
-                                            or getattr(m, 'invoice_type', '') == 'advance')
-                                        and m.invoice_type != 'copy'
-                                ).sorted(lambda m: (m.invoice_date or m.create_date, m.id))
-
-                                # Determine installment number from ORIGINAL advance, not this refund
-                                try:
-                                    inst_no = advances.ids.index(orig.id) + 1 if orig else 1
-                                except ValueError:
-                                    inst_no = 1
-
-                                inst_label = self.ordinal(inst_no)
-                                item_name = f"{inst_label} Installment"
-
-                                # Refund items copy the same installment name
-                                for line in record.invoice_line_ids:
-                                    if line.product_id.is_charging is not True:
-                                        tax_labels = [t.invoice_label for t in line.tax_ids]
-                                        invoice_data["items"].append({
-                                            "name": item_name,
-                                            "quantity": line.quantity,
-                                            "discount": line.discount,
-                                            "unitPrice": line.price_unit,
-                                            "totalAmount": line.price_total,
-                                            "labels": tax_labels,
-                                        })
-
-                                # Stop here – do NOT fall into Advance Sale block
-                                _logger.info("Advance refund item payload: %s", invoice_data)
-                                # continue to payment section
-                            # ---------------------------------------------------
-                            # 2) ADVANCE SALE (existing logic – unchanged)
-                            # ---------------------------------------------------
-                            else:
-                                _logger.info("Advance SALE logic triggered")
-
-                                # === your existing advance sale code below (no change except we need item_name defined) ===
-
-                                so = self._get_related_sale_order(record)
-                                if so:
-                                    advance_invoices = so.invoice_ids.filtered(
-                                        lambda m: m.order_type == 'advance' and m.state != 'cancel'
-                                    ).sorted(lambda m: (m.invoice_date or m.create_date, m.id))
-
-                                    adv_ids = advance_invoices.ids
-                                    try:
-                                        idx = adv_ids.index(record.id)
-                                    except ValueError:
-                                        idx = -1
-
-                                    previous_inv = advance_invoices[idx - 1] if idx > 0 else None
-
-                                    if previous_inv:
-                                        ref_no = previous_inv.ref_doc_num or ''
-                                        dt = previous_inv.ref_doc_date or previous_inv.invoice_date or previous_inv.create_date
-                                        ref_dt = dt.strftime('%Y-%m-%d %H:%M:%S')
-                                    else:
-                                        ref_no = ''
-                                        ref_dt = ''
-
-                                    invoice_data["referentDocumentNumber"] = ref_no
-                                    invoice_data["referentDocumentDT"] = ref_dt
-
-                                    inst_no = self._get_installment_number(record, so)
-                                    inst_label = self.ordinal(inst_no)
-
-                                    base_so_line = so.order_line.filtered(
-                                        lambda l: not l.display_type and not getattr(l, "is_downpayment", False)
-                                    )[:1]
-
-                                    base_name = base_so_line.product_id.name if base_so_line else ""
-
-                                    item_name = f"{inst_label} Installment"
-
-                                    for line in record.invoice_line_ids:
-                                        if line.product_id.is_charging is not True:
-                                            tax_labels = [t.invoice_label for t in line.tax_ids]
-                                            invoice_data["items"].append({
-                                                "name": item_name,
-                                                "quantity": line.quantity,
-                                                "discount": line.discount,
-                                                "unitPrice": line.price_unit,
-                                                "totalAmount": line.price_total,
-                                                "labels": tax_labels,
-                                            })
-                    else:
-                        _logger.info("Order Type not adv : %s", record.order_type)
-                        for line in record.invoice_line_ids:
-                            if line.product_id.is_charging is not True:
-                                tax_labels = []
-                                for tax in line.tax_ids:
-                                    tax_labels.append(tax.invoice_label)
-                                invoice_data["items"].append({
-                                    "name": line.product_id.name,
-                                    "quantity": line.quantity,
-                                    "discount": line.discount,
-                                    "unitPrice": line.price_unit,
-                                    "totalAmount": line.price_total,
-                                    "labels": tax_labels
-                                })
-                            _logger.info("Tax charging : %s", line.product_id.is_charging)
-                            _logger.info("Tax labels : %s", tax_labels if 'tax_labels' in locals() else [])
-
-                    # === FIX: build payments from POS when POS-origin invoice ===
-                    pos_payments = record.pos_order_ids.mapped('payment_ids') if record.pos_order_ids else self.env['pos.payment']
-                    if pos_payments:
-                        for pos_payment in pos_payments:
-                            pm_name = (pos_payment.payment_method_id.name or '').strip()
-                            if pm_name == 'Cash':
-                                type_val = 1
-                            elif pm_name == 'Card':
-                                type_val = 2
-                            else:
-                                type_val = 0
-                            invoice_data["payment"].append({
-                                "amount": pos_payment.amount,
-                                "paymentType": type_val
-                            })
-                    else:
-                        # Back-office path
-                        if getattr(record.partner_id, 'charge_customer', False) is not True and record.move_type == 'out_invoice':
-                            if not record.matched_payment_ids:
-                                raise ValidationError(_("Payment Not collected."))
-                            for payment in record.matched_payment_ids:
-                                if payment.state == 'paid':
-                                    vms_payment_type = getattr(payment, 'vms_payment_type', False)
-                                    payment_type = vms_payment_type.payment_type if (vms_payment_type and vms_payment_type.payment_type) else False
-                                    if payment_type:
-                                        invoice_data["payment"].append({
-                                            "amount": payment.amount,
-                                            "paymentType": int(payment_type)
-                                        })
-                        else:
-                            # charge customer / other
-                            for payment in record.matched_payment_ids:
-                                if payment.state == 'paid':
-                                    vms_payment_type = getattr(payment, 'vms_payment_type', False)
-                                    _logger.info("vms payment: %s", vms_payment_type)
-                                    payment_type = vms_payment_type.payment_type if (vms_payment_type and vms_payment_type.payment_type) else False
-                                    _logger.info("vms payment 2: %s", vms_payment_type)
-                                    if payment_type:
-                                        invoice_data["payment"].append({
-                                            "amount": payment.amount,
-                                            "paymentType": int(payment_type)
-                                        })
-
-                    _logger.info("FRCS invoice payload: %s", json.dumps(invoice_data, ensure_ascii=False))
-
-                    url = "https://vsdc.sandbox.vms.frcs.org.fj/api/v3/invoices"
-                    context = ssl.create_default_context()
-                    context.load_cert_chain(certfile=cert_file, keyfile=key_file, password=password)
-                    http = PoolManager(ssl_context=context)
-
-                    headers = {
-                        "Content-Type": "application/json",
-                        "Accept": "application/json",
-                        "PAC": pac_value
-                    }
-
-                    response = http.request("POST", url, body=json.dumps(invoice_data), headers=headers)
-                    _logger.info("FRCS response status: %s", response.status)
-
-                    if response.status in (200, 201):
-                        # decode to text so JSON fields can be parsed later
-                        record.post_response = response.data.decode("utf-8") if response.data else ""
-                        record.is_post_status = True
-                        if record.move_type == 'out_refund' and record.reversed_entry_id:
-                            record.origin_doc_num = record.reversed_entry_id.ref_doc_num
-                            record.origin_doc_date = record.reversed_entry_id.ref_doc_date
-                        record.action_generate_qr()
-
-                        log_message = "✅ %s invoice request successfully sent by %s on %s." % (
-                            transactionType,
-                            self.env.user.name,
-                            datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                        )
-                        record.message_post(body=log_message)
-                        self._onchange_show_send_button()
-
-                        return {
-                            'type': 'ir.actions.client',
-                            'tag': 'display_notification',
-                            'params': {
-                                'title': 'Success',
-                                'message': '%s invoice posted successfully and QR generated.' % transactionType,
-                                'type': 'success',
-                                'sticky': False,
-                                'next': {
-                                    'type': 'ir.actions.client',
-                                    'tag': 'reload',
-                                }
-                            }
-                        }
-                    else:
-                        raise ValidationError(("Request failed with status code. Data: %s") % response.data.decode("utf-8"))
-            else:
-                raise ValidationError(_("Please Upload PFX for Mapped System."))
+        record.message_post(body=log_message)
+        record._onchange_show_send_button()
+
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'Success',
+                'message': '%s invoice posted successfully and QR generated.' % transaction_type,
+                'type': 'success',
+                'sticky': False,
+                'next': {
+                    'type': 'ir.actions.client',
+                    'tag': 'reload',
+                }
+            }
+        }
 
     # ********* Function for Copy Sale And Refund process *********
-    @api.depends('copy_post_response')
-    def _compute_post_copy_response_json(self):
-        for record in self:
-            try:
-                record.copy_post_response_json = json.loads(record.copy_post_response) if record.copy_post_response else {}
-            except (json.JSONDecodeError, TypeError):
-                record.copy_post_response_json = {}
-
     def action_generate_copy_qr(self):
         for record in self:
             qr_code_base64 = None
@@ -634,192 +188,32 @@ class AccountMoveInherit(models.Model):
                 except json.JSONDecodeError:
                     raise ValueError("Invalid JSON format in Copy post response")
             if qr_code_base64:
-                if qr_code_base64.startswith("data:image"):
-                    qr_code_base64 = qr_code_base64.split(",")[1]
                 try:
-                    qr_code_base64 = qr_code_base64.strip()
-                    decoded_qr = base64.b64decode(qr_code_base64)
-                    image = Image.open(io.BytesIO(decoded_qr))
-                    img_io = io.BytesIO()
-                    image.save(img_io, format="PNG")
-                    img_io.seek(0)
-                    record.copy_qr_code = base64.b64encode(img_io.getvalue())
-                except Exception as e:
+                    # the VSDC already sends PNG, PIL only converts other formats
+                    record.copy_qr_code = qr_image.qr_to_png_base64(qr_code_base64)
+                except ValueError:
                     record.copy_qr_code = False
-                    raise ValueError(f"Error Decoding Base64: {str(e)}")
+                    raise
             else:
                 record.copy_qr_code = False
                 raise ValueError("No QR Code Found in Response")
 
     def action_send_copy_request(self):
+        builder = self.env['frcs.payload.builder']
+        builder._prefetch_moves(self)
         for record in self:
             if record.system_id and record.system_id.pfx_status is True:
-                copy_post_response = record.copy_post_response and json.loads(record.copy_post_response) or False
+                copy_post_response = record.copy_post_response_json
                 if record.is_copy_post_status and copy_post_response:
                     record.copy_ref_doc_num = copy_post_response.get('invoiceNumber', False)
 
                 if record.move_type in ['out_invoice', 'out_refund']:
+                    # Copy items keep the installment name of the advance they reverse
+                    builder._check_system(record.system_id)
+                    request = builder._build_move_request(record, invoice_type="Copy")
+                    transactionType = request['transaction_type']
 
-                    # path = record.system_id.pfx_file_path
-                    # base_path = "C:/Program Files/Odoo 18.0.2025090/VSDC/"
-                    # cert_file = os.path.join(base_path, "certificate.pem")
-                    # key_file = os.path.join(base_path, "private_key.pem")
-
-                    # print("cert_file",cert_file)
-                    # print("key_file",key_file)
-
-                    # password = record.system_id.pfx_password
-                    # pac_value = record.system_id.pfx_pac
-                    # pfx_expiry_date = record.system_id.pfx_expiry_date
-
-                    path = record.system_id.pfx_file_path
-
-                    cert_file = os.path.join(os.path.dirname(path), "certificate.pem")
-                    key_file = os.path.join(os.path.dirname(path), "private_key.pem")
-
-                    print("cert_file",cert_file)
-                    print("key_file",key_file)
-
-                    password = record.system_id.pfx_password
-                    pac_value = record.system_id.pfx_pac
-                    pfx_expiry_date = record.system_id.pfx_expiry_date
-
-                    if not cert_file or not key_file or not password or not pac_value:
-                        raise ValidationError(_("Please configure the required certification in Branch Systems."))
-                    if pfx_expiry_date and pfx_expiry_date < datetime.now():
-                        raise ValidationError(_("Certification in Branch Systems is expired."))
-
-                    invoiceType = "Copy"
-                    transactionType = "Sale" if record.move_type == 'out_invoice' else "Refund"
-
-                    invoice_data = {
-                        'dateAndTimeOfIssue': (record.create_date.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z' if record.create_date else None),
-                        'cashier': record.invoice_user_id.vat,
-                        'buyerId': record.partner_id.id,
-                        'buyerCostCenterId': record.buyer_cost_centerid or None,
-                        'invoiceType': invoiceType,
-                        'transactionType': transactionType,
-                        'payment': [],
-                        'invoiceNumber': '32/2.01',
-                        'referentDocumentNumber': record.ref_doc_num,
-                        'referentDocumentDT': record.ref_doc_date.strftime('%Y-%m-%d %H:%M:%S') if record.ref_doc_date else '',
-                        'items': []
-                    }
-
-                    # Items
-                    # if record.order_type == "advance":
-                    #     sale_orders = record.invoice_line_ids.mapped('sale_line_ids.order_id').exists()
-                    #     so = sale_orders[:1]
-                    #     if not so and record.invoice_origin:
-                    #         so = record.env['sale.order'].search([('name', '=', record.invoice_origin)], limit=1)
-
-                    #     if so:
-                    #         for so_line in so.order_line:
-                    #             if so_line.display_type or getattr(so_line, "is_downpayment", False):
-                    #                 continue
-                    #             tax_labels = [t.invoice_label for t in so_line.tax_id]
-                    #             invoice_data["items"].append({
-                    #                 "name": so_line.product_id.name,
-                    #                 "quantity": so_line.product_uom_qty,
-                    #                 "discount": getattr(so_line, "discount", 0.0) or 0.0,
-                    #                 "unitPrice": so_line.price_unit,
-                    #                 "totalAmount": so_line.price_total,
-                    #                 "labels": tax_labels,
-                    #             })
-                    # else:
-                    # for line in record.invoice_line_ids:
-                    #         if line.product_id.is_charging is not True:
-                    #             tax_labels = []
-                    #             for tax in line.tax_ids:
-                    #                 tax_labels.append(tax.invoice_label)
-                    #             item_name = line.product_id.name or line.name or "Item"
-                    #             invoice_data["items"].append({
-                    #                 "name": item_name,
-                    #                 "quantity": line.quantity,
-                    #                 "discount": line.discount,
-                    #                 "unitPrice": line.price_unit,
-                    #                 "totalAmount": line.price_total,
-                    #                 "labels": tax_labels
-                    #             })    
-
-                    # ================================
-                    # Copy Refund Line Logic (Advance-Aware)
-                    # ================================
-
-                    so = self._get_related_sale_order(record)
-
-                    # Detect if the original document was an advance installment
-                    inst_name = None
-                    if so and record.reversed_entry_id and record.reversed_entry_id.order_type == "advance":
-                        # Get the original installment number using your helper
-                        inst_no = self._get_installment_number(record.reversed_entry_id, so)
-                        inst_label = self.ordinal(inst_no)
-                        inst_name = f"{inst_label} Installment"
-
-                    for line in record.invoice_line_ids:
-                        if line.product_id.is_charging is not True:
-                            tax_labels = [t.invoice_label for t in line.tax_ids]
-
-                            # Use original installment name if available
-                            item_name = inst_name or line.product_id.name or line.name or "Item"
-
-                            invoice_data["items"].append({
-                                "name": item_name,
-                                "quantity": line.quantity,
-                                "discount": line.discount,
-                                "unitPrice": line.price_unit,
-                                "totalAmount": line.price_total,
-                                "labels": tax_labels
-                            })
-
-
-                    # POS payments for copy if POS-origin
-                    if record.pos_order_ids:
-                        for pos_payment in record.pos_order_ids.payment_ids:
-                            pm_name = (pos_payment.payment_method_id.name or '').strip()
-                            if pm_name == 'Cash':
-                                type_val = 1
-                            elif pm_name == 'Card':
-                                type_val = 2
-                            else:
-                                type_val = 0
-                            invoice_data["payment"].append({
-                                "amount": pos_payment.amount,
-                                "paymentType": type_val
-                            })
-                    else:
-                        if record.move_type == 'out_invoice':
-                            if not record.matched_payment_ids:
-                                raise ValidationError(_("Payment Not collected."))
-                            for payment in record.matched_payment_ids:
-                                if payment.state == 'paid':
-                                    vms_payment_type = getattr(payment, 'vms_payment_type', False)
-                                    payment_type = vms_payment_type.payment_type if (vms_payment_type and vms_payment_type.payment_type) else False
-                                    if payment_type:
-                                        invoice_data["payment"].append({
-                                            "amount": payment.amount,
-                                            "paymentType": int(payment_type)
-                                        })
-                        else:
-                            invoice_data["payment"].append({
-                                "amount": record.amount_total,
-                                "paymentType": 0
-                            })
-
-                    _logger.info("Refund lines belong to invoice: %s", invoice_data)
-                    
-                    url = "https://vsdc.sandbox.vms.frcs.org.fj/api/v3/invoices"
-                    context = ssl.create_default_context()
-                    context.load_cert_chain(certfile=cert_file, keyfile=key_file, password=password)
-                    http = PoolManager(ssl_context=context)
-
-                    headers = {
-                        "Content-Type": "application/json",
-                        "Accept": "application/json",
-                        "PAC": pac_value
-                    }
-
-                    response = http.request("POST", url, body=json.dumps(invoice_data), headers=headers)
+                    response = record.system_id._vsdc_invoice_request(request['body'])()
                     if response.status in (200, 201):
                         record.copy_post_response = response.data.decode("utf-8") if response.data else ""
                         record.is_copy_post_status = True
@@ -840,11 +234,12 @@ class AccountMoveInherit(models.Model):
 
     # ********* END of Copy Sale And Refund process **************
 
-    # === FIX: Post first, then send to FRCS for POS invoices ===
+    # === FIX: Post first, then queue the FRCS submission for POS invoices ===
     def _post(self, soft=True):
         """Override to ensure POS invoices are posted before sending to FRCS."""
         res = super(AccountMoveInherit, self)._post(soft)
 
+        to_fiscalize = self.env['account.move']
         for move in self:
             if move.move_type == 'out_invoice' and move.pos_order_ids:
                 # ensure system_id comes from POS config
@@ -853,12 +248,34 @@ class AccountMoveInherit(models.Model):
                     raise ValidationError(_("Please set a System on the POS Configuration (Point of Sale → Configuration → your POS)."))
                 if not move.system_id:
                     move.system_id = sys_id.id
+                to_fiscalize |= move
 
-                # now send to FRCS
-                move.action_send_request()
+        # the queue worker sends to FRCS once the POS transaction has committed
+        to_fiscalize._enqueue_fiscalization()
 
         return res
 
+    def _enqueue_fiscalization(self):
+        """Journal the payload of invoices from POS running in offline mode."""
+        offline = self.filtered(lambda m: m.pos_order_ids.config_id.fiscal_offline_mode)
+        queue = self.env['frcs.fiscal.queue']
+        return queue._enqueue(self - offline) | queue._enqueue(offline, journal=True)
+
+    def _frcs_fiscalized(self):
+        """Tell the POS sessions of the orders their invoice can be printed."""
+        res = super()._frcs_fiscalized()
+        urls = self.env['pos.order']._frcs_invoice_urls(self.filtered('pos_order_ids'), html=True)
+        for move in self:
+            for order in move.pos_order_ids:
+                self.env['bus.bus']._sendone(order.config_id.access_token, 'FRCS_FISCALIZED', {
+                    'order_id': order.id,
+                    'name': order.name,
+                    'pos_reference': order.pos_reference,
+                    'sdc_invoice_number': move.sdc_invoice_number,
+                    'url': urls[move.id],
+                })
+        return res
+
     def action_print_frcs_report(self):
         return self.env.ref('enovasions_account.action_report_frcs_move').report_action(self)
 
@@ -925,48 +342,167 @@ class AccountMoveLineInherit(models.Model):
 
 # enovasions_pos/models/pos_order.py
 
-from odoo import api, models
+from odoo import api, fields, models
 from odoo.exceptions import UserError
+from odoo.osv import expression
 import logging
 _logger = logging.getLogger(__name__)
 
+THERMAL_REPORT = 'enovasions_account.action_report_frcs_invoice_thermal'
+
+
 class PosOrder(models.Model):
     _inherit = 'pos.order'
 
+    # receipts are looked up by name as well as by pos_reference
+    name = fields.Char(index=True)
+
     @api.model
-    def pos_get_frcs_invoice_pdf(self, key):
-        """Return URL to FRCS report for the order's invoice.
-        Accepts either a numeric id or an order 'name' (e.g., 'Order 00003-...').
+    def _resolve_frcs_keys(self, keys):
+        """Map each order id, name or pos_reference of ``keys`` to its order, in one query."""
+        ids, refs = set(), set()
+        for key in keys:
+            if isinstance(key, int) or (isinstance(key, str) and key.isdigit()):
+                ids.add(int(key))
+            if isinstance(key, str):
+                refs.add(key)
+        domain = [('id', 'in', list(ids))]
+        if refs:
+            domain = expression.OR([domain, [('name', 'in', list(refs))], [('pos_reference', 'in', list(refs))]])
+        orders = self.search(domain)
+        by_id = {order.id: order for order in orders}
+        by_ref = {}
+        for order in orders:
+            by_ref.setdefault(order.pos_reference, order)
+            by_ref.setdefault(order.name, order)
+        result = {}
+        for key in keys:
+            order = by_id.get(int(key)) if str(key).isdigit() else None
+            result[key] = order or by_ref.get(key) or self.browse()
+        return result
+
+    @api.model
+    def _frcs_invoice_urls(self, moves, html=False):
+        """Receipt URL of each move: the pre-rendered PDF when cached, else the
+        report, or the lightweight HTML receipt with ``html``."""
+        self.sudo().env.ref(THERMAL_REPORT)  # will raise if missing
+        attachments = moves._get_thermal_pdf_attachments()
+        return {
+            move.id: "/web/content/%s?download=true" % attachments[move.id].id if move.id in attachments
+            else "/frcs/receipt/%s.html" % move.id if html
+            else "/report/pdf/%s/%s?download=1" % (THERMAL_REPORT, move.id)
+            for move in moves
+        }
+
+    @api.model
+    def _get_frcs_invoice_move(self, key):
+        """Resolve the order by id, name or pos_reference and return ``(move, error)``.
+
+        Fiscalizes the invoice now if no queue worker has picked it up yet; in
+        offline mode the move is returned unfiscalized, to print a pending
+        receipt. A failed fiscalization is returned, not raised: rolling back
+        the request would erase the ledger entry and the job's attempt, and the
+        queue could then send an invoice the VSDC already fiscalized.
+        """
+        order = self._resolve_frcs_keys([key])[key]
+        if not order:
+            raise UserError("POS order not found (key=%s)." % key)
+
+        move = order.account_move
+        if not move:
+            raise UserError("No customer invoice found for this order yet.")
+
+        if not move.is_post_status:
+            if order.config_id.fiscal_offline_mode:
+                # journaled: forwarded in sequence by the queue, never inline
+                return move, None
+            jobs = move.sudo().fiscal_queue_ids
+            if any(jobs.mapped('is_offline')):
+                return move, None
+            jobs._process_now()
+            failed = jobs.filtered(lambda j: j.state != 'done' and j.last_error)[-1:]
+            if failed and not move.is_post_status:
+                return move, "FRCS fiscalization failed: %s" % failed.last_error
+        return move, None
+
+    @api.model
+    def _frcs_receipt_result(self, key, get_url):
+        """``{'url', 'error'}`` of the order's receipt; ``get_url(move)`` builds the URL.
+
+        Nothing raises once the invoice may have been sent, so the request commits.
         """
+        move, error = self._get_frcs_invoice_move(key)
+        if error:
+            return {'url': False, 'error': error}
         try:
-            # 1) Resolve the order by id or by name
-            order = False
-            if isinstance(key, int):
-                order = self.browse(key)
-            else:
-                # try int-like
-                try:
-                    order = self.browse(int(key))
-                except Exception:
-                    order = self.search([('name', '=', key)], limit=1)
+            return {'url': get_url(move), 'error': False}
+        except Exception as e:
+            # full traceback in server log, friendly message to frontend
+            _logger.exception("FRCS receipt URL failed for key=%s", key)
+            return {'url': False, 'error': "FRCS receipt error: %s" % (str(e) or e.__class__.__name__)}
 
-            if not order:
-                raise UserError("POS order not found (key=%s)." % key)
+    @api.model
+    def pos_get_frcs_invoice_pdf(self, key):
+        """Return ``{'url', 'error'}``: the FRCS report of the order's invoice, or why it is missing.
+        Accepts either a numeric id, an order 'name' or its pos_reference (e.g., 'Order 00003-...').
+        """
+        # the pre-rendered receipt when the background render is done, else the report
+        return self._frcs_receipt_result(key, lambda move: self._frcs_invoice_urls(move)[move.id])
 
+    @api.model
+    def pos_get_frcs_invoice_pdfs(self, keys):
+        """Receipt URL and fiscal status of many orders at once (reprint-all, end of shift).
+
+        ``keys`` mixes order ids, names and pos_references. Nothing is
+        fiscalized here: each key maps to ``{'order_id', 'move_id', 'status',
+        'sdc_invoice_number', 'url', 'receipt_url'}`` where ``status`` is
+        ``'fiscalized'``, ``'pending'``, ``'offline'`` (journaled until the
+        VSDC is reachable), ``'failed'``, ``'no_invoice'`` or ``'not_found'``.
+        ``receipt_url`` is the cached PDF when rendered, else the HTML receipt.
+        """
+        orders_by_key = self._resolve_frcs_keys(keys)
+        orders = self.browse().union(*orders_by_key.values())
+        moves = orders.account_move
+        moves.fetch(['is_post_status', 'sdc_invoice_number', 'thermal_pdf_key'])
+        jobs = self.env['frcs.fiscal.queue'].sudo().search([
+            ('move_id', 'in', moves.filtered(lambda m: not m.is_post_status).ids),
+            ('state', 'in', ('pending', 'processing', 'failed')),
+        ])
+        failed = jobs.filtered(lambda j: j.state == 'failed').move_id
+        offline = jobs.filtered('is_offline').move_id
+        urls = self._frcs_invoice_urls(moves)
+        receipt_urls = self._frcs_invoice_urls(moves, html=True)
+        result = {}
+        for key, order in orders_by_key.items():
             move = order.account_move
-            if not move:
-                raise UserError("No customer invoice found for this order yet.")
-
-            # 2) Make sure the report action exists
-            report_xmlid = 'enovasions_account.action_report_frcs_invoice_thermal'
-            self.sudo().env.ref(report_xmlid)  # will raise if missing
+            if not order or not move:
+                result[key] = {
+                    'order_id': order.id or False,
+                    'move_id': False,
+                    'status': 'no_invoice' if order else 'not_found',
+                    'sdc_invoice_number': False,
+                    'url': False,
+                    'receipt_url': False,
+                }
+                continue
+            result[key] = {
+                'order_id': order.id,
+                'move_id': move.id,
+                'status': 'fiscalized' if move.is_post_status else 'failed' if move in failed
+                          else 'offline' if move in offline else 'pending',
+                'sdc_invoice_number': move.sdc_invoice_number or False,
+                'url': urls[move.id],
+                'receipt_url': receipt_urls[move.id],
+            }
+        return result
 
-            # 3) Return the report URL
-            return "/report/pdf/%s/%s?download=1" % (report_xmlid, move.id)
+    @api.model
+    def pos_get_frcs_receipt(self, key, fmt='html'):
+        """Return ``{'url', 'error'}`` for the lightweight thermal receipt of the order's invoice.
 
-        except UserError:
-            raise  # show the message to the POS user
-        except Exception as e:
-            # full traceback in server log, friendly message to frontend
-            _logger.exception("pos_get_frcs_invoice_pdf failed for key=%s", key)
-            raise UserError("FRCS PDF error: %s" % (str(e) or e.__class__.__name__))
+        ``fmt`` is ``'html'`` to print from the browser or ``'escpos'`` for
+        the raw bytes of a receipt printer; no PDF is rendered.
+        """
+        if fmt == 'html':
+            return self._frcs_receipt_result(key, lambda move: self._frcs_invoice_urls(move, html=True)[move.id])
+        return self._frcs_receipt_result(key, lambda move: "/frcs/receipt/%s.%s" % (move.id, fmt))
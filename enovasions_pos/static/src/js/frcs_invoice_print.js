@@ -3,18 +3,83 @@ import { patch } from "@web/core/utils/patch";
 import { onMounted, onWillUnmount } from "@odoo/owl";
 import { ReceiptScreen } from "@point_of_sale/app/screens/receipt_screen/receipt_screen";
 
-const wait = (ms) => new Promise((r) => setTimeout(r, ms));
 const isInvoiced = (o) =>
   o && (typeof o.isToInvoice === "function" ? !!o.isToInvoice() : !!o.to_invoice);
 
+// Fiscalized invoices pushed by the server (FRCS_FISCALIZED), by order id / name / reference;
+// an entry is dropped once printed, and the oldest go first (pushes of other terminals)
+const frcsReady = new Map();
+const frcsWaiting = new Map();
+const FRCS_WAIT_MS = 15000;
+const FRCS_READY_MAX = 200;
+
+const orderKeys = (o) =>
+  [o && (o.backendId || o.server_id || o.orderId), o?.name, o?.pos_reference]
+    .filter(Boolean).map(String);
+
+const payloadKeys = (payload) =>
+  [payload.order_id, payload.name, payload.pos_reference].filter(Boolean).map(String);
+
+function onFrcsFiscalized(payload) {
+  console.log("[frcs] bus FRCS_FISCALIZED:", payload);
+  const keys = payloadKeys(payload);
+  const resolve = keys.map((key) => frcsWaiting.get(key)).find(Boolean);
+  if (resolve) {
+    resolve(payload);  // consumed right away, nothing to keep
+    return;
+  }
+  for (const key of keys) {
+    frcsReady.delete(key);
+    frcsReady.set(key, payload);
+  }
+  for (const key of frcsReady.keys()) {
+    if (frcsReady.size <= FRCS_READY_MAX) break;
+    frcsReady.delete(key);
+  }
+}
+
+// Takes the pushed payload of an order out of the cache, or null
+function takeFiscalized(order) {
+  for (const key of orderKeys(order)) {
+    const payload = frcsReady.get(key);
+    if (payload) {
+      payloadKeys(payload).forEach((k) => frcsReady.delete(k));
+      return payload;
+    }
+  }
+  return null;
+}
+
+let frcsSubscribed = false;
+function subscribeFrcs(bus, accessToken) {
+  if (frcsSubscribed || !bus) return;
+  frcsSubscribed = true;
+  try { accessToken && bus.addChannel(accessToken); } catch(_) {}
+  bus.subscribe("FRCS_FISCALIZED", onFrcsFiscalized);
+}
+
+// Resolves with the pushed payload, or null if nothing arrives in time
+function waitFiscalized(order) {
+  const ready = takeFiscalized(order);
+  if (ready) return Promise.resolve(ready);
+  const keys = orderKeys(order);
+  return new Promise((resolve) => {
+    const done = (payload) => {
+      clearTimeout(timer);
+      keys.forEach((key) => frcsWaiting.delete(key));
+      resolve(payload);
+    };
+    const timer = setTimeout(() => done(null), FRCS_WAIT_MS);
+    keys.forEach((key) => frcsWaiting.set(key, done));
+  });
+}
+
 // Small helper: call UI methods only if provided
 const safeUI = {
-  block:   (ui) => { try { ui && ui.block && ui.block(); } catch(_) {} },
-  unblock: (ui) => { try { ui && ui.unblock && ui.unblock(); } catch(_) {} },
   notify:  (ui, opts) => { try { ui && ui.showNotification && ui.showNotification(opts); } catch(_) {} },
 };
 
-// Core: open FRCS pdf (component-agnostic)
+// Core: open the FRCS receipt once the server reports the invoice fiscalized (component-agnostic)
 async function openFrcsPdf(ormService, uiServiceOrNull, order) {
   console.log("[frcs] openFrcsPdf() called");
   if (!isInvoiced(order)) {
@@ -26,13 +91,7 @@ async function openFrcsPdf(ormService, uiServiceOrNull, order) {
     });
     return false;
   }
-
-  // resolve key
-  const idOf = (o) => o && (o.backendId || o.server_id || o.orderId || null);
-  let key = idOf(order);
-  const t0 = Date.now();
-  while (!key && Date.now() - t0 < 500) { await wait(100); key = idOf(order); }
-  key ||= order?.name;
+  const key = orderKeys(order)[0];
   if (!key) {
     console.warn("[frcs] no identifier yet → abort");
     safeUI.notify(uiServiceOrNull, {
@@ -43,16 +102,33 @@ async function openFrcsPdf(ormService, uiServiceOrNull, order) {
     return false;
   }
 
-  safeUI.block(uiServiceOrNull);
+  // the UI stays usable: the cashier can start the next sale while this resolves
   try {
-    const tStart = performance.now();
-    const url = await ormService.call("pos.order", "pos_get_frcs_invoice_pdf", [key], {});
-    const ms = (performance.now() - tStart).toFixed(1);
-    console.log(`[frcs] RPC pos.order.pos_get_frcs_invoice_pdf: ${ms} ms`);
-    console.log("[frcs] RPC url:", url);
-
+    let url = takeFiscalized(order)?.url;
+    if (!url) {
+      const info = (await ormService.call("pos.order", "pos_get_frcs_invoice_pdfs", [[key]], {}))[key] || {};
+      console.log("[frcs] fiscal status:", info.status);
+      if (info.status === "fiscalized") {
+        url = info.receipt_url;  // the cached PDF once rendered
+      } else if (info.status === "not_found" || info.status === "no_invoice") {
+        // still syncing: the server pushes the receipt once fiscalized
+        url = (await waitFiscalized(order))?.url;
+      }
+    }
+    if (!url) {
+      // offline, pending, failed or no push: the server prints a pending
+      // receipt, fiscalizes inline or reports the error
+      console.log("[frcs] no receipt yet → RPC fallback");
+      const result = await ormService.call("pos.order", "pos_get_frcs_receipt", [key], {});
+      if (result.error) {
+        console.warn("[frcs] fiscalization failed:", result.error);
+        safeUI.notify(uiServiceOrNull, { title: "FRCS", message: result.error, type: "danger" });
+        return false;
+      }
+      url = result.url;
+    }
     if (!url) {
-      console.warn("[frcs] RPC returned no URL");
+      console.warn("[frcs] no receipt URL");
       safeUI.notify(uiServiceOrNull, { title: "No PDF", message: "Invoice not available.", type: "warning" });
       return false;
     }
@@ -64,8 +140,6 @@ async function openFrcsPdf(ormService, uiServiceOrNull, order) {
     console.error("[frcs] RPC error:", e);
     safeUI.notify(uiServiceOrNull, { title: "Error", message: e.message || "FRCS PDF failed.", type: "danger" });
     return false;
-  } finally {
-    safeUI.unblock(uiServiceOrNull);
   }
 }
 
@@ -82,6 +156,7 @@ patch(ReceiptScreen.prototype, {
     // IMPORTANT: use raw services from env, not useService() proxies
     this.ormSvc = this.env.services.orm;
     this.uiSvc  = this.env.services.ui;
+    subscribeFrcs(this.env.services.bus_service, this.pos?.config?.access_token);
 
     // prevent auto-print behaviors
     try {
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 from odoo import api, exceptions, fields, models, _
 from odoo.exceptions import ValidationError
+from odoo.tools import SQL
 from urllib3 import PoolManager
 from urllib3.contrib import pyopenssl
 from datetime import datetime
@@ -11,6 +12,7 @@ import ssl
 import os
 import io
 from PIL import Image
+from odoo.addons.enovasions_vms_integration.tools import qr_image, vsdc_response
 import pytz
 from dateutil import parser
 import sys
@@ -20,22 +22,30 @@ _logger = logging.getLogger(__name__)
 
 class SaleOrderInherit(models.Model):
     _inherit = 'sale.order'
+    _rec_names_search = ['name', 'partner_id.name', 'ref_doc_num', 'origin_doc_num']
 
     so_post_response = fields.Text("Post response",readonly=True,copy=False)
-    so_post_response_json = fields.Json(string="Post Response JSON", compute="_compute_post_sale_json", store=False,copy=False)
-    so_qr_code =fields.Image(string="QR Code",attachment=True,store=True,copy=False,readonly=True)
+    so_post_response_json = fields.Json(string="Post Response JSON", compute="_compute_post_sale_json", store=True,copy=False)
+    # ****** Hot keys of the parsed response, as on account.move
+    sdc_invoice_number = fields.Char("SDC Invoice Number", compute="_compute_post_sale_json", store=True, index=True, copy=False)
+    sdc_date_time = fields.Datetime("SDC Date Time", compute="_compute_post_sale_json", store=True, index=True, copy=False)
+    sdc_invoice_counter = fields.Char("SDC Invoice Counter", compute="_compute_post_sale_json", store=True, copy=False)
+    sdc_total_amount = fields.Float("SDC Total Amount", compute="_compute_post_sale_json", store=True, copy=False)
+    so_qr_code_id = fields.Many2one("frcs.qr.code",string="QR Code Record",copy=False,readonly=True)
+    so_qr_code = fields.Image(string="QR Code",compute="_compute_so_qr_code",inverse="_inverse_so_qr_code",copy=False,readonly=True)
     so_refund_response = fields.Text("Refund response",readonly=True,copy=False)
-    so_refund_response_json = fields.Json(string="Refund Response JSON", compute="_compute_post_refund_json", store=False,copy=False)
-    so_refund_qr_code =fields.Image(string="Refund QR Code",attachment=True,store=True,copy=False,readonly=True)
+    so_refund_response_json = fields.Json(string="Refund Response JSON", compute="_compute_post_refund_json", store=True,copy=False)
+    so_refund_qr_code_id = fields.Many2one("frcs.qr.code",string="Refund QR Code Record",copy=False,readonly=True)
+    so_refund_qr_code = fields.Image(string="Refund QR Code",compute="_compute_so_refund_qr_code",inverse="_inverse_so_refund_qr_code",copy=False,readonly=True)
     so_is_post_sale_status = fields.Boolean(default=False,string="Proforma Sale Status",copy=False)
     so_is_post_refund_status = fields.Boolean(default=False,string="Proforma Return Status",copy=False)
     so_system_id = fields.Many2one("branch.systems",string="System",copy=False)
     is_proforma = fields.Boolean(default=False,string="Proforma",copy=False)
     is_proforma_sale = fields.Boolean(default=False,string="Proforma Sale",copy=False)
     is_proforma_refund = fields.Boolean(default=False,string="Proforma Return",copy=False)
-    ref_doc_num = fields.Text("Reference Doc No",copy=False,compute="_compute_ref_doc_fields", store=True)
+    ref_doc_num = fields.Char("Reference Doc No",copy=False,compute="_compute_ref_doc_fields", store=True, index='trigram')
     ref_doc_date = fields.Text("Reference Doc Date",copy=False,compute="_compute_ref_doc_fields", store=True)
-    origin_doc_num = fields.Text("SDC Invoice No",copy=False,compute="_compute_original_doc_fields", store=True)
+    origin_doc_num = fields.Char("SDC Invoice No",copy=False,compute="_compute_original_doc_fields", store=True, index='trigram')
     origin_doc_date = fields.Text("SDC Time",copy=False,compute="_compute_original_doc_fields", store=True)
     is_refund = fields.Boolean(default=True,string="Refund",copy=False)
     is_button_visible = fields.Boolean(compute='_compute_button_visibility', store=False)
@@ -64,46 +74,30 @@ class SaleOrderInherit(models.Model):
             else:
                 rec.is_advance = False
 
-    @api.depends('so_post_response')
+    @api.depends('so_post_response_json')
     def _compute_ref_doc_fields(self):
         for rec in self:
-            rec.ref_doc_num = False
+            data = rec.so_post_response_json or {}
+            rec.ref_doc_num = data.get('invoiceNumber', False)
             rec.ref_doc_date = False
-
-            if rec.so_post_response:
+            if data.get('sdcDateTime'):
                 try:
-                    response_data = json.loads(rec.so_post_response)
-                    sdc_datetime_str = response_data.get('sdcDateTime')
-
-                    if sdc_datetime_str:
-                        sdc_datetime_obj = parser.isoparse(sdc_datetime_str)
-                        rec.ref_doc_date = sdc_datetime_obj.strftime('%Y-%m-%d %H:%M:%S')
-
-                    rec.ref_doc_num = response_data.get('invoiceNumber', False)
-
-                except Exception as e:
-                    _logger.warning(f"Failed to parse ref doc datetime from post_response: {e}")
+                    # kept in the VSDC's local time, as sent back in proforma refunds
+                    rec.ref_doc_date = parser.isoparse(data['sdcDateTime']).strftime('%Y-%m-%d %H:%M:%S')
+                except ValueError as e:
+                    _logger.warning("Failed to parse SDC datetime of %s: %s", rec.name, e)
 
-    @api.depends('so_refund_response')
+    @api.depends('so_refund_response_json')
     def _compute_original_doc_fields(self):
         for rec in self:
+            data = rec.so_refund_response_json or {}
+            rec.origin_doc_num = data.get('invoiceNumber', False)
             rec.origin_doc_date = False
-            rec.origin_doc_num = False
-
-            if rec.so_refund_response:
+            if data.get('sdcDateTime'):
                 try:
-                    response_data = json.loads(rec.so_refund_response)
-                    sdc_datetime_str = response_data.get('sdcDateTime')
-
-                    if sdc_datetime_str:
-                        sdc_datetime_obj = parser.isoparse(sdc_datetime_str)
-                        rec.origin_doc_date = sdc_datetime_obj.strftime('%Y-%m-%d %H:%M:%S')
-
-                    rec.origin_doc_num = response_data.get('invoiceNumber', False)
-
-                except Exception as e:
-                    _logger.warning(f"Failed to parse Original ref doc datetime from post_response: {e}")  
- 
+                    rec.origin_doc_date = parser.isoparse(data['sdcDateTime']).strftime('%Y-%m-%d %H:%M:%S')
+                except ValueError as e:
+                    _logger.warning("Failed to parse SDC datetime of %s: %s", rec.name, e)
 
     @api.depends('so_post_response','is_proforma')
     def _compute_button_visibility(self):
@@ -115,19 +109,37 @@ class SaleOrderInherit(models.Model):
 
     @api.depends('so_post_response')
     def _compute_post_sale_json(self):
+        """Parse the response once, on receipt, into jsonb and the typed sdc_* columns."""
         for record in self:
-            try:
-                record.so_post_response_json = json.loads(record.so_post_response) if record.so_post_response else {}               
-            except (json.JSONDecodeError, TypeError):
-                record.so_post_response_json = {}
+            data = vsdc_response.parse(record.so_post_response)
+            record.so_post_response_json = data
+            record.update(vsdc_response.sdc_values(data))
 
     @api.depends('so_refund_response')
     def _compute_post_refund_json(self):
         for record in self:
-            try:
-                record.so_refund_response_json = json.loads(record.so_refund_response) if record.so_refund_response else {}
-            except (json.JSONDecodeError, TypeError):
-                record.so_refund_response_json = {}
+            record.so_refund_response_json = vsdc_response.parse(record.so_refund_response)
+
+    # QR codes live in frcs.qr.code; orders fiscalized before that rebuild theirs from the response
+    @api.depends('so_qr_code_id', 'so_post_response')
+    def _compute_so_qr_code(self):
+        QrCode = self.env['frcs.qr.code']
+        for record in self:
+            record.so_qr_code = record.so_qr_code_id.sudo().data or QrCode._from_response(record.so_post_response)
+
+    def _inverse_so_qr_code(self):
+        for record in self:
+            record.so_qr_code_id = self.env['frcs.qr.code']._get_or_create(record.so_qr_code)
+
+    @api.depends('so_refund_qr_code_id', 'so_refund_response')
+    def _compute_so_refund_qr_code(self):
+        QrCode = self.env['frcs.qr.code']
+        for record in self:
+            record.so_refund_qr_code = record.so_refund_qr_code_id.sudo().data or QrCode._from_response(record.so_refund_response)
+
+    def _inverse_so_refund_qr_code(self):
+        for record in self:
+            record.so_refund_qr_code_id = self.env['frcs.qr.code']._get_or_create(record.so_refund_qr_code)
 
     def _prepare_invoice(self):
         invoice_vals = super()._prepare_invoice()
@@ -156,24 +168,12 @@ class SaleOrderInherit(models.Model):
                     raise ValueError("Invalid JSON format in post_response")
 
             if qr_code_base64:
-                if qr_code_base64.startswith("data:image"):
-                    qr_code_base64 = qr_code_base64.split(",")[1]
-
                 try:
-                    qr_code_base64 = qr_code_base64.strip()                  
-
-                    decoded_qr = base64.b64decode(qr_code_base64)
-
-                    image = Image.open(io.BytesIO(decoded_qr))
-
-                    img_io = io.BytesIO()
-                    image.save(img_io, format="PNG")
-                    img_io.seek(0)
-
-                    record.so_refund_qr_code = base64.b64encode(img_io.getvalue())
-                except Exception as e:
+                    # the VSDC already sends PNG, PIL only converts other formats
+                    record.so_refund_qr_code = qr_image.qr_to_png_base64(qr_code_base64)
+                except ValueError:
                     record.so_refund_qr_code = False
-                    raise ValueError(f"Error Decoding Base64: {str(e)}")
+                    raise
             else:
                 record.so_refund_qr_code = False
                 raise ValueError("No QR Code Found in Refund Response") 
@@ -190,24 +190,12 @@ class SaleOrderInherit(models.Model):
                     raise ValueError("Invalid JSON format in post_response")
 
             if qr_code_base64:
-                if qr_code_base64.startswith("data:image"):
-                    qr_code_base64 = qr_code_base64.split(",")[1]
-
                 try:
-                    qr_code_base64 = qr_code_base64.strip()                  
-
-                    decoded_qr = base64.b64decode(qr_code_base64)
-
-                    image = Image.open(io.BytesIO(decoded_qr))
-
-                    img_io = io.BytesIO()
-                    image.save(img_io, format="PNG")
-                    img_io.seek(0)
-
-                    record.so_qr_code = base64.b64encode(img_io.getvalue())
-                except Exception as e:
+                    # the VSDC already sends PNG, PIL only converts other formats
+                    record.so_qr_code = qr_image.qr_to_png_base64(qr_code_base64)
+                except ValueError:
                     record.so_qr_code = False
-                    raise ValueError(f"Error Decoding Base64: {str(e)}")
+                    raise
             else:
                 record.so_qr_code = False
                 raise ValueError("No QR Code Found in Response")            
@@ -217,82 +205,9 @@ class SaleOrderInherit(models.Model):
             if record.is_proforma == True:
                 if record.so_system_id:
                     if record.so_system_id.pfx_status == True: 
-                            path = record.so_system_id.pfx_file_path       
-                            cert_file = os.path.join(os.path.dirname(path), "certificate.pem")
-                            key_file = os.path.join(os.path.dirname(path), "private_key.pem")
-
-                            password = record.so_system_id.pfx_password
-                            pac_value = record.so_system_id.pfx_pac
-                            pfx_expiry_date = record.so_system_id.pfx_expiry_date
-                          
-                            if not cert_file or not key_file or not password or not pac_value:
-                                raise ValidationError(_("Please configure the required certification in Branch Systems."))
-
-                            if pfx_expiry_date < datetime.now():
-                                raise ValidationError(_("Certification in Branch Systems is expired."))                     
-                               
-                            proforma_data = {
-                                'dateAndTimeOfIssue':record.create_date.strftime('%Y-%m-%d %H:%M:%S') if record.create_date else None,
-                                'cashier':record.user_id.vat,
-                                'buyerId':record.partner_id.id,
-                                'buyerCostCenterId':record.so_buyer_cost_centerid or None,
-                                'invoiceType': "Proforma",
-                                'transactionType': "Sale", 
-                                'payment': [],              
-                                'invoiceNumber': '32/2.01',
-                                'referentDocumentNumber':'', #passig null
-                                'referentDocumentDT':'', #hardcoded value
-                                'items': [],
-                                
-                            }
-
-                            # Add line items (invoice lines)
-                            for line in record.order_line:
-                                if  line.product_id.is_charging != True: 
-                                    tax_labels =[]
-                                    # Add tax lines (tax_ids)
-                                    for tax in line.tax_id:
-                                        tax_labels.append(tax.invoice_label)
-                                    # print("tax_labels",tax_labels)    
-
-                                    proforma_data["items"].append({
-                                        "name": line.product_id.name,
-                                        "quantity": line.product_uom_qty,
-                                        "unitPrice": line.price_unit,
-                                        "totalAmount": line.price_total,
-                                        "labels":tax_labels
-                                    })
-
-                            # Add payment  Proforma Sale 
-                            proforma_data["payment"].append({
-                                        "amount": record.amount_total,
-                                        "paymentType": 1 #cash
-                                    })  
-                             
-                            print("*****Final Json Proforma Sales request*****",proforma_data)   
-
-
-                            
-                            url = "https://vsdc.sandbox.vms.frcs.org.fj/api/v3/invoices"                                     
-                            context = ssl.create_default_context()
-                            context.load_cert_chain(certfile=cert_file, keyfile=key_file, password=password)  
-                            http = PoolManager(ssl_context=context)
-
-                            # Include PAC in headers
-                            headers = {
-                                "Content-Type": "application/json",
-                                "Accept": "application/json",
-                                "PAC": pac_value  
-                            }
-
-                             
-                            response = http.request(
-                                       "POST", url,
-                                        body=json.dumps(proforma_data),
-                                        headers=headers
-                                    )
-
-                            
+                            request = self.env['frcs.payload.builder']._build_order_request(record, "Sale")
+                            response = record.so_system_id._vsdc_invoice_request(request['body'])()
+
                             if response.status == 200 or response.status == 201:
                                 print("******Request was successful")
                                 record.so_post_response = response.data
@@ -343,83 +258,9 @@ class SaleOrderInherit(models.Model):
 
                 if record.so_system_id:
                     if record.so_system_id.pfx_status == True:   
-                            path = record.so_system_id.pfx_file_path       
-                            cert_file = os.path.join(os.path.dirname(path), "certificate.pem")
-                            key_file = os.path.join(os.path.dirname(path), "private_key.pem")
-
-                            password = record.so_system_id.pfx_password
-                            pac_value = record.so_system_id.pfx_pac
-                            pfx_expiry_date = record.so_system_id.pfx_expiry_date
-                          
-                            if not cert_file or not key_file or not password or not pac_value:
-                                raise ValidationError(_("Please configure the required certification in Branch Systems."))
-
-                            if pfx_expiry_date < datetime.now():
-                                raise ValidationError(_("Certification in Branch Systems is expired.")) 
-
-                                                                              
-                               
-                            proforma_data = {
-                                'dateAndTimeOfIssue':record.create_date.strftime('%Y-%m-%d %H:%M:%S') if record.create_date else None,
-                                'cashier':record.user_id.vat,
-                                'buyerId':record.partner_id.id,
-                                'buyerCostCenterId':record.so_buyer_cost_centerid or None,
-                                'invoiceType': "Proforma",
-                                'transactionType': "Refund", 
-                                'payment': [],              
-                                'invoiceNumber': '32/2.01',
-                                'referentDocumentNumber':record.ref_doc_num, 
-                                'referentDocumentDT': record.ref_doc_date if record.ref_doc_date else None, 
-                                'items': [],
-                                
-                            }
-
-                            # Add line items (invoice lines)
-                            for line in record.order_line:
-                                if  line.product_id.is_charging != True: 
-                                    tax_labels =[]
-                                    # Add tax lines (tax_ids)
-                                    for tax in line.tax_id:
-                                        tax_labels.append(tax.invoice_label)
-                                    # print("tax_labels",tax_labels)    
-
-                                    proforma_data["items"].append({
-                                        "name": line.product_id.name,
-                                        "quantity": line.product_uom_qty,
-                                        "unitPrice": line.price_unit,
-                                        "totalAmount": line.price_total,
-                                        "labels":tax_labels
-                                    })
-
-                            # Add payment  Proforma Sale 
-                            proforma_data["payment"].append({
-                                       "amount": record.amount_total,
-                                        "paymentType": 1 #cash
-                                    })  
-                            print("*****Final Json Proforma Sales request*****",proforma_data)   
-
-
-                            
-                            url = "https://vsdc.sandbox.vms.frcs.org.fj/api/v3/invoices"                                     
-                            context = ssl.create_default_context()
-                            context.load_cert_chain(certfile=cert_file, keyfile=key_file, password=password)  
-                            http = PoolManager(ssl_context=context)
-
-                            # Include PAC in headers
-                            headers = {
-                                "Content-Type": "application/json",
-                                "Accept": "application/json",
-                                "PAC": pac_value  
-                            }
-
-                             
-                            response = http.request(
-                                       "POST", url,
-                                        body=json.dumps(proforma_data),
-                                        headers=headers
-                                    )
+                            request = self.env['frcs.payload.builder']._build_order_request(record, "Refund")
+                            response = record.so_system_id._vsdc_invoice_request(request['body'])()
 
-                                
                             if response.status == 200 or response.status == 201:
                                 print("******Request was successful")
 
@@ -477,9 +318,219 @@ class SaleOrderInherit(models.Model):
         return self.env.ref('enovasions_sale.action_print_pr_report').report_action(self)
    
 
+class FrcsPayloadBuilder(models.AbstractModel):
+    _inherit = 'frcs.payload.builder'
+
+    @api.model
+    def _prefetch_moves(self, moves):
+        moves = super()._prefetch_moves(moves)
+        moves.fetch(['installment_number', 'advance_order_id', 'previous_advance_move_id'])
+        moves.previous_advance_move_id.fetch(['ref_doc_num', 'ref_doc_date', 'invoice_date', 'create_date'])
+        return moves
+
+    @api.model
+    def _move_referent(self, move, invoice_type):
+        if invoice_type == "Copy" or move.order_type != 'advance' or move.move_type != 'out_invoice':
+            return super()._move_referent(move, invoice_type)
+        if not move.installment_number:
+            move._link_advance_installments()
+        if not move.advance_order_id:
+            return super()._move_referent(move, invoice_type)
+        # each installment refers to the previous one of the chain
+        previous = move.previous_advance_move_id
+        if not previous:
+            return '', ''
+        date = previous.ref_doc_date or previous.invoice_date or previous.create_date
+        return previous.ref_doc_num or '', date.strftime('%Y-%m-%d %H:%M:%S')
+
+    @api.model
+    def _installment_name(self, move, invoice_type):
+        """Return the "<n>th Installment" item name of advance documents, else None."""
+        # copies name the installment of the advance they reverse
+        document = move.reversed_entry_id if invoice_type == "Copy" else move
+        if not document or document.order_type != 'advance':
+            return None
+        if not document.installment_number:
+            document._link_advance_installments()
+        if not document.advance_order_id:
+            return None
+        return "%s Installment" % move.ordinal(document.installment_number)
+
+    @api.model
+    def _move_items(self, move, invoice_type):
+        items = super()._move_items(move, invoice_type)
+        installment = self._installment_name(move, invoice_type)
+        if installment:
+            for item in items:
+                item['name'] = installment
+        return items
+
+    @api.model
+    def _build_order_request(self, order, transaction_type):
+        """Return the Proforma ``transaction_type`` request of a sale order."""
+        self._check_system(order.so_system_id)
+        order.order_line.fetch(['product_id', 'product_uom_qty', 'price_unit', 'price_total', 'tax_id'])
+        order.order_line.product_id.fetch(['name', 'is_charging'])
+        order.order_line.tax_id.fetch(['invoice_label'])
+        refund = transaction_type == "Refund"
+        payload = {
+            'dateAndTimeOfIssue': order.create_date.strftime('%Y-%m-%d %H:%M:%S') if order.create_date else None,
+            'cashier': order.user_id.vat,
+            'buyerId': order.partner_id.id,
+            'buyerCostCenterId': order.so_buyer_cost_centerid or None,
+            'invoiceType': "Proforma",
+            'transactionType': transaction_type,
+            'payment': [{"amount": order.amount_total, "paymentType": 1}],  # cash
+            'invoiceNumber': '32/2.01',
+            'referentDocumentNumber': order.ref_doc_num if refund else '',
+            'referentDocumentDT': (order.ref_doc_date or None) if refund else '',
+            'items': [{
+                "name": line.product_id.name,
+                "quantity": line.product_uom_qty,
+                "unitPrice": line.price_unit,
+                "totalAmount": line.price_total,
+                "labels": [tax.invoice_label for tax in line.tax_id],
+            } for line in order.order_line if line.product_id.is_charging is not True],
+        }
+        return self._make_request(payload, order)
+
+
+class AccountMoveInherit(models.Model):
+    _inherit = 'account.move'
+
+    # ****** Advance installment chain, maintained on post and reset to draft / cancel
+    advance_order_id = fields.Many2one("sale.order", string="Advance Sale Order", copy=False, readonly=True, index='btree_not_null')
+    installment_number = fields.Integer(string="Installment No.", copy=False, readonly=True)
+    previous_advance_move_id = fields.Many2one("account.move", string="Previous Installment", copy=False, readonly=True)
+
+    def _post(self, soft=True):
+        res = super()._post(soft)
+        self._link_advance_installments()
+        return res
+
+    def _get_related_sale_order(self, record):
+        # from invoice → SO
+        sale_orders = record.invoice_line_ids.mapped('sale_line_ids.order_id').exists()
+        so = sale_orders[:1]
+        if not so and record.invoice_origin:
+            so = record.env['sale.order'].search([('name', '=', record.invoice_origin)], limit=1)
+        return so
+
+    def ordinal(self, n):
+        return "%d%s" % (
+            n,
+            "th" if 11 <= (n % 100) <= 13 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th"),
+        )
+
+    def _get_installment_number(self, record, so):
+        if not record.installment_number:
+            record._link_advance_installments()
+        return record.installment_number or 1
+
+    def _link_advance_installments(self):
+        """Number posted advance invoices and link each one to the previous installment.
+
+        A refund takes the number of the advance it reverses and refers to it.
+        """
+        for move in self.filtered(lambda m: m.order_type == 'advance' and m.state == 'posted'
+                                  and not m.installment_number).sorted('id'):
+            so = move._get_related_sale_order(move)
+            if not so:
+                continue
+            if move.move_type == 'out_refund':
+                origin = move.reversed_entry_id
+                if origin and not origin.installment_number:
+                    origin._link_advance_installments()
+                move.write({
+                    'advance_order_id': so.id,
+                    'installment_number': origin.installment_number or 1,
+                    'previous_advance_move_id': origin.id,
+                })
+                continue
+            move._lock_advance_order(so)
+            last = move._last_advance_installment(so)
+            if not last:
+                # advances posted before the chain was stored are numbered once, in issue order
+                legacy = so.invoice_ids.filtered(
+                    lambda m: m.order_type == 'advance' and m.move_type == 'out_invoice'
+                    and m.state == 'posted' and not m.installment_number and m != move
+                ).sorted(lambda m: (m.invoice_date or m.create_date, m.id))
+                for previous in legacy:
+                    previous.write(previous._next_installment_vals(so, previous._last_advance_installment(so)))
+                last = move._last_advance_installment(so)
+            move.write(move._next_installment_vals(so, last))
+
+    def _lock_advance_order(self, so):
+        """Serialize the numbering of the advances of ``so`` across transactions.
+
+        A concurrent post of the same order fails fast on the row lock and is retried
+        by the RPC layer with a fresh snapshot, in which it sees the installment taken.
+        """
+        self.env.cr.execute(SQL("SELECT id FROM sale_order WHERE id = %s FOR UPDATE NOWAIT", so.id))
+
+    def _last_advance_installment(self, so):
+        return self.search([
+            ('advance_order_id', '=', so.id),
+            ('move_type', '=', 'out_invoice'),
+            ('state', '=', 'posted'),
+            ('installment_number', '>', 0),
+        ], order='installment_number desc', limit=1)
+
+    def _next_installment_vals(self, so, last):
+        return {
+            'advance_order_id': so.id,
+            'installment_number': last.installment_number + 1,
+            'previous_advance_move_id': last.id,
+        }
+
+    def _unlink_advance_installments(self):
+        """Take moves that left the posted state out of their chain and close the gap."""
+        for move in self.sorted('installment_number', reverse=True):
+            if move.move_type == 'out_invoice':
+                self.search([
+                    ('previous_advance_move_id', '=', move.id),
+                    ('move_type', '=', 'out_invoice'),
+                ]).previous_advance_move_id = move.previous_advance_move_id
+                later = self.search([
+                    ('advance_order_id', '=', move.advance_order_id.id),
+                    ('installment_number', '>', move.installment_number),
+                ])
+                for installment in later:
+                    installment.installment_number -= 1
+            move.write({'advance_order_id': False, 'installment_number': 0, 'previous_advance_move_id': False})
+
+    def button_draft(self):
+        # also reached from button_cancel for posted moves
+        chained = self.filtered('installment_number')
+        res = super().button_draft()
+        chained._unlink_advance_installments()
+        return res
+
+    @api.model
+    def _lookup_sdc_documents(self, numbers):
+        yield from super()._lookup_sdc_documents(numbers)
+        wanted = set(numbers)
+        orders = self.env['sale.order'].search(['|', ('ref_doc_num', 'in', numbers), ('origin_doc_num', 'in', numbers)])
+        for order in orders:
+            for field in ('ref_doc_num', 'origin_doc_num'):
+                if order[field] in wanted:
+                    yield order[field], {'model': order._name, 'id': order.id, 'display_name': order.display_name, 'field': field}
+
+
 class SaleOrderLineInherit(models.Model):
     _inherit = 'sale.order.line'
 
+    def _compute_tax_id(self):
+        """Sales taxes follow the tax timeline in force on the order date."""
+        super()._compute_tax_id()
+        Timeline = self.env['product.timeline.tax']
+        for line in self.filtered('product_id'):
+            order = line.order_id
+            day = fields.Date.to_date(order.date_order) or fields.Date.context_today(line)
+            taxes = Timeline.get_effective_taxes(line.product_id, day)[line.product_id.id]
+            taxes = taxes._filter_taxes_by_company(line.company_id)
+            if taxes:
+                line.tax_id = order.fiscal_position_id.map_tax(taxes)
 
     @api.constrains('tax_id')
     def _check_only_one_tax(self):
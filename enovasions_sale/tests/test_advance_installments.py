@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from odoo import Command
+from odoo.tests import tagged
+
+from odoo.addons.enovasions_account.tests.common import FrcsTestCommon
+
+
+@tagged('post_install', '-at_install')
+class TestAdvanceInstallments(FrcsTestCommon):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.order = cls.env['sale.order'].create({
+            'partner_id': cls.partner_a.id,
+            'order_type': 'advance',
+            'so_system_id': cls.system.id,
+            'order_line': [Command.create({'product_id': cls.product_a.id, 'price_unit': 300.0})],
+        })
+
+    def _post_advance(self):
+        move = self._create_invoice()
+        move.write({'order_type': 'advance', 'invoice_origin': self.order.name})
+        move.action_post()
+        return move
+
+    def _row_locked(self):
+        self.env.cr.execute("""
+            SELECT 1 FROM pg_locks
+             WHERE pid = pg_backend_pid()
+               AND relation = 'sale_order'::regclass
+               AND mode = 'RowShareLock'
+        """)
+        return bool(self.env.cr.fetchone())
+
+    def test_installments_are_chained_in_post_order(self):
+        first, second, third = self._post_advance(), self._post_advance(), self._post_advance()
+        self.assertRecordValues(first + second + third, [
+            {'advance_order_id': self.order.id, 'installment_number': 1, 'previous_advance_move_id': False},
+            {'advance_order_id': self.order.id, 'installment_number': 2, 'previous_advance_move_id': first.id},
+            {'advance_order_id': self.order.id, 'installment_number': 3, 'previous_advance_move_id': second.id},
+        ])
+
+    def test_numbering_locks_the_order(self):
+        self.assertFalse(self._row_locked())
+        self._post_advance()
+        self.assertTrue(self._row_locked())
+
+    def test_reset_to_draft_closes_the_gap(self):
+        first, second, third = self._post_advance(), self._post_advance(), self._post_advance()
+        second.button_draft()
+        self.assertRecordValues(first + second + third, [
+            {'installment_number': 1, 'previous_advance_move_id': False},
+            {'installment_number': 0, 'previous_advance_move_id': False},
+            {'installment_number': 2, 'previous_advance_move_id': first.id},
+        ])
+
+        second.action_post()
+        self.assertRecordValues(second, [{'installment_number': 3, 'previous_advance_move_id': third.id}])
+
+    def test_refund_takes_the_number_of_its_advance(self):
+        self._post_advance()
+        second = self._post_advance()
+        refund = second._reverse_moves()
+        refund.invoice_origin = self.order.name
+        refund.action_post()
+        self.assertRecordValues(refund, [{
+            'advance_order_id': self.order.id,
+            'installment_number': 2,
+            'previous_advance_move_id': second.id,
+        }])
+        self.assertEqual(self._post_advance().installment_number, 3)
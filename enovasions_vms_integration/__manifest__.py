@@ -1,7 +1,7 @@
 {
     'name': 'VAT Monitoring System Integration',
     'category': 'Accounting/Localizations/EDI',
-    'version': '1.0',
+    'version': '1.1',
     'depends': ['base','mail'],
     'summary': 'VAT Monitoring System Integration and certification for Fiji Tax Portal ',
     'data': [
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+from odoo import api, SUPERUSER_ID
+
+
+def migrate(cr, version):
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    # the extracted PEMs are no longer stored: drop the unencrypted private keys from the filestore
+    env['ir.attachment'].search([
+        ('res_model', '=', 'branch.systems'),
+        ('res_field', 'in', ['certificate_pem', 'private_key_pem']),
+    ]).unlink()
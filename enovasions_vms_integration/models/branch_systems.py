@@ -9,11 +9,19 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.serialization import pkcs12
 from odoo.exceptions import UserError
 from odoo.tools import date_utils
+from collections import defaultdict
 from datetime import datetime, timedelta
 import base64
-import os
-from pathlib import Path
+import functools
+import hashlib
 
+from ..tools import cert_store, vsdc_client, vsdc_pool
+
+import logging
+_logger = logging.getLogger(__name__)
+
+# days before expiry at which the branch is reminded
+PFX_NOTICE_DAYS = (30, 5, 4, 3, 2, 1, 0)
 
 
 class BranchSystem(models.Model):
@@ -27,12 +35,19 @@ class BranchSystem(models.Model):
     pfx_password = fields.Char(string='PFX Password',required=True,copy=False)
     pfx_uid = fields.Char(string='PFX UID',required=True,copy=False)
     pfx_pac = fields.Char(string='PFX PAC',required=True,copy=False)   
-    pfx_file_path = fields.Char("File Path",compute="_compute_save_binary_file",store=True,copy=False)
+    pfx_checksum = fields.Char("PFX Checksum",compute="_compute_pfx_checksum",store=True,copy=False)
     pfx_expiry_date  = fields.Datetime(string="Expiry Date",required=True,copy=False)
     pfx_status = fields.Boolean(string="PFX Status", default=False,copy=False)
-    certificate_pem = fields.Binary(string="Certificate PEM",attachment=True,copy=False)
-    private_key_pem = fields.Binary(string="Private Key PEM",attachment=True,copy=False)
+    certificate_fingerprint = fields.Char(string="Certificate Fingerprint",readonly=True,copy=False)
+    vsdc_url = fields.Char(string="VSDC Invoice URL",required=True,default=lambda self: vsdc_pool.INVOICE_URL,
+        help="Invoices endpoint of the VSDC, e.g. a local simulator (tools/vsdc_simulator.py) for load tests.")
+    vsdc_connect_timeout = fields.Float(string="Connect Timeout (s)",default=5.0)
+    vsdc_read_timeout = fields.Float(string="Read Timeout (s)",default=30.0)
+    vsdc_max_retries = fields.Integer(string="Max Retries",default=2,help="Retries after a 5xx answer or a connection error, with jittered exponential backoff.")
     branch_id = fields.Many2one('res.company',string='Branch',required=True,copy=False)
+    pfx_notice_days = fields.Integer(string="Last Expiry Reminder (days)",readonly=True,copy=False)
+    pfx_notice_expiry_date = fields.Datetime(string="Reminded Expiry Date",readonly=True,copy=False,
+        help="Expiry date the last reminder was about; a renewed certificate starts over.")
 
 
 
@@ -58,40 +73,34 @@ class BranchSystem(models.Model):
                        
 
     @api.depends('pfx_file')
-    def _compute_save_binary_file(self):
+    def _compute_pfx_checksum(self):
+        """Same sha1 as the attachment's, which keys the certificate store."""
         for record in self:
             if record.pfx_file:
-                pfx_file_data =  record.pfx_file
-                pfx_filename =   record.pfx_filename
-                system_name =  record.system_name
-
                 try:
-                    try:
-                        file_data = base64.b64decode(pfx_file_data, validate=True)
-                    except Exception:
-                        raise UserError(_("❌ Invalid PFX File: Base64 decoding failed. Please upload a valid file."))
-
-                    file_dir = '/home/odoo/' + system_name +'/'
-                    print("file_dir",file_dir)
-                    os.makedirs(file_dir, exist_ok=True)  # Ensure directory exists
-
-                    folder = Path(file_dir)
-                    folder.chmod(0o755)
-                    os.chmod(file_dir, 0o755)
-
-                    file_path = os.path.join(file_dir, pfx_filename)
-                    with open(file_path, 'wb') as f:
-                        f.write(file_data)
+                    file_data = base64.b64decode(record.pfx_file, validate=True)
+                except Exception:
+                    raise UserError(_("❌ Invalid PFX File: Base64 decoding failed. Please upload a valid file."))
+                record.pfx_checksum = hashlib.sha1(file_data).hexdigest()
+            else:
+                record.pfx_checksum = False
+
+    def write(self, vals):
+        replaced = []
+        if 'pfx_file' in vals or 'pfx_password' in vals:
+            replaced = [(record.id, record.pfx_checksum, record.pfx_password) for record in self]
+        res = super().write(vals)
+        # Free this worker's context and pools of the previous certificate; other
+        # workers miss on the new checksum and age the old context out
+        for system_id, checksum, password in replaced:
+            cert_store.discard(checksum or '', password)
+            vsdc_pool.invalidate(self.env.cr.dbname, system_id)
+        return res
+
+    def _get_pfx_data(self):
+        self.ensure_one()
+        return base64.b64decode(self.sudo().pfx_file)
 
-                    record.pfx_file_path = file_path
-                    print(f"✅ PFX file successfully saved at: {file_path}")
-
-                except UserError as e:
-                    raise e 
-                except Exception as e:
-                    raise UserError(_("❌ File Save Failed: %s") % str(e))      
-
-    
     # @api.model
     # def ffetch_and_simulate_file_path(self, pfx_file):
     #     attachment = self.env['ir.attachment'].browse(['name','=',self.pfx_file])
@@ -108,59 +117,27 @@ class BranchSystem(models.Model):
  
     def upload_pfx(self):
         try:
-            # self.ffetch_and_simulate_file_path(self.pfx_file)
-            # er
-            pfx_path =   self.pfx_file_path 
-            if not pfx_path:
-                raise UserError(_("❌ PFX file path not found. Please upload a valid .pfx file."))
+            if not self.pfx_file:
+                raise UserError(_("❌ PFX file not found. Please upload a valid .pfx file."))
 
             pfx_password = self.pfx_password  
             if not pfx_password:
                 raise UserError(_("❌ PFX password is missing."))
 
-            pfx_password = pfx_password.encode('utf-8')
-
-            with open(pfx_path, "rb") as pfx_file:
-                pfx_data = pfx_file.read()
-
-            # Load the PFX file
-            private_key, certificate, additional_certificates = pkcs12.load_key_and_certificates(
-                pfx_data, password=pfx_password, backend=default_backend()
-            )
+            # Decrypt the PFX in memory: the certificate never touches the disk
+            cert_pem, _key_pem = cert_store.pfx_to_pem(self._get_pfx_data(), pfx_password)
 
-            # Convert the certificate to PEM format
-            cert_pem = certificate.public_bytes(encoding=serialization.Encoding.PEM)
-
-            # Convert the private key to PEM format
-            private_key_pem = private_key.private_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PrivateFormat.PKCS8,
-                encryption_algorithm=serialization.NoEncryption()
-            )
-
-            # Define file paths for the PEM files
-            cert_pem_path = os.path.join(os.path.dirname(pfx_path), "certificate.pem")
-            private_key_pem_path = os.path.join(os.path.dirname(pfx_path), "private_key.pem")
-
-            # Save certificate.pem
-            with open(cert_pem_path, "wb") as cert_file:
-                cert_file.write(cert_pem)
-
-            # Save private_key.pem
-            with open(private_key_pem_path, "wb") as key_file:
-                key_file.write(private_key_pem)
-
-       
-
-            # Store binary data in Odoo fields for attachment
-            self.certificate_pem = base64.b64encode(cert_pem)
-            self.private_key_pem = base64.b64encode(private_key_pem)
+            # Only the fingerprint is kept: the PEMs live in the worker's certificate store
+            self.certificate_fingerprint = hashlib.sha256(cert_pem).hexdigest()
             self.pfx_status = True
 
+            # Drop the warm connections still using the previous certificate
+            vsdc_pool.invalidate(self.env.cr.dbname, self.id)
+
             return {
                 'effect': {
                     'fadeout': 'slow',
-                    'message': _('✅ Successfully extracted and stored Certificate & Private Key!'),
+                    'message': _('✅ Certificate verified and loaded!'),
                     'type': 'rainbow_man',
                 }
             }
@@ -168,22 +145,74 @@ class BranchSystem(models.Model):
         except Exception as e:
             raise UserError(_("❌ Upload failed: %s") % str(e))
 
+    def _get_ssl_context(self):
+        """Client SSL context of the system's certificate, from the worker's certificate store."""
+        self.ensure_one()
+        return cert_store.get_ssl_context(self.pfx_checksum or '', self.pfx_password, self._get_pfx_data)
+
+    def _get_vsdc_http(self):
+        """Return the keep-alive connection pool bound to this system's certificate."""
+        self.ensure_one()
+        return vsdc_pool.get_pool_manager(
+            self.env.cr.dbname,
+            self.id,
+            cert_store.cache_key(self.pfx_checksum, self.pfx_password),
+            self._get_ssl_context,
+        )
+
+    def _vsdc_invoice_request(self, body):
+        """Return a callable posting the JSON ``body`` to the VSDC invoices API.
+
+        Everything is read from the record up front, so the callable can run
+        on a worker thread without touching the ORM. The call is bounded by the
+        system's timeouts, retried, and short-circuited while the branch's
+        VSDC is failing (see ``tools/vsdc_client.py``).
+        """
+        self.ensure_one()
+        http = self._get_vsdc_http()
+        headers = {
+            "Content-Type": "application/json",
+            "Accept": "application/json",
+            "PAC": self.pfx_pac,
+        }
+        policy = vsdc_client.DEFAULT_POLICY._replace(
+            connect_timeout=self.vsdc_connect_timeout or vsdc_client.DEFAULT_POLICY.connect_timeout,
+            read_timeout=self.vsdc_read_timeout or vsdc_client.DEFAULT_POLICY.read_timeout,
+            max_retries=max(self.vsdc_max_retries, 0),
+        )
+        return functools.partial(
+            vsdc_client.post, http, self.vsdc_url or vsdc_pool.INVOICE_URL, body, headers,
+            (self.env.cr.dbname, self.id), policy,
+        )
+
     @api.model
     def _cron_notify_pfx_expiry(self):
-        today = fields.Date.today()
-        notify_days = [30, 5, 4, 3, 2, 1, 0]
-        for days in notify_days:
-            target_date = today + timedelta(days=days)
-            expiring_records = self.search([
-                ('pfx_expiry_date', '>=', target_date.strftime('%Y-%m-%d 00:00:00')),
-                ('pfx_expiry_date', '<=', target_date.strftime('%Y-%m-%d 23:59:59'))
-            ])
-            for record in expiring_records:
-                if record.branch_id.email:
-                    template = self.env.ref('enovasions_vms_integration.email_template_pfx_expiry_notification')
-                    template.send_mail(record.id, force_send=True)        
-            
-
-                  
+        """Queue a reminder 30, 5, 4, 3, 2, 1 and 0 days before each certificate expires.
 
-    
+        One search covers the whole notice window; each reminder is sent
+        once per expiry date, so reruns and catch-up runs send nothing twice.
+        """
+        today = fields.Date.today()
+        window_end = datetime.combine(today + timedelta(days=max(PFX_NOTICE_DAYS)), datetime.max.time())
+        systems = self.search([
+            ('pfx_expiry_date', '>=', datetime.combine(today, datetime.min.time())),
+            ('pfx_expiry_date', '<=', window_end),
+            ('branch_id.email', '!=', False),
+        ])
+        to_notify = defaultdict(lambda: self.browse())
+        for system in systems:
+            days = (system.pfx_expiry_date.date() - today).days
+            if days not in PFX_NOTICE_DAYS:
+                continue
+            if system.pfx_notice_expiry_date == system.pfx_expiry_date and system.pfx_notice_days <= days:
+                continue  # this reminder, or a later one, already went out
+            to_notify[days] |= system
+        if not to_notify:
+            return
+        template = self.env.ref('enovasions_vms_integration.email_template_pfx_expiry_notification')
+        for days, notified in to_notify.items():
+            # queued: the mail cron sends them outside this transaction
+            template.send_mail_batch(notified.ids)
+            for system in notified:
+                system.write({'pfx_notice_days': days, 'pfx_notice_expiry_date': system.pfx_expiry_date})
+        _logger.info("PFX expiry reminders queued for %s systems", sum(len(n) for n in to_notify.values()))
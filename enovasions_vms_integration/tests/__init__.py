@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+from . import test_vsdc_client
+from . import test_vsdc_response
+from . import test_receipt_render
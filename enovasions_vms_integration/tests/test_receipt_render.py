@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from odoo.tests.common import BaseCase
+
+from odoo.addons.enovasions_vms_integration.tools import receipt_render
+
+
+class TestReceiptRender(BaseCase):
+
+    def test_pair_fits_on_one_line(self):
+        self.assertEqual(receipt_render._pair('Total', '12.50', 20), ['Total          12.50'])
+
+    def test_pair_wraps_a_long_value(self):
+        lines = receipt_render._pair('SDC Invoice No', 'ABCDEFGH-IJKLMNOP-123', 10)
+        self.assertEqual(lines, [
+            'SDC Invoic',
+            'ABCDEFGH-I',
+            'JKLMNOP-12',
+            '         3',
+        ])
+        self.assertTrue(all(len(line) <= 10 for line in lines))
+        self.assertEqual(''.join(line.strip() for line in lines[1:]), 'ABCDEFGH-IJKLMNOP-123')
+
+    def test_pair_without_room_for_a_space(self):
+        # left and right exactly fill the line: no separating space left
+        self.assertEqual(receipt_render._pair('Label', '12345', 10), ['Label', '     12345'])
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+from collections import namedtuple
+from unittest.mock import patch
+
+from urllib3.exceptions import NewConnectionError, ProtocolError, ReadTimeoutError
+
+from odoo.tests.common import BaseCase
+
+from odoo.addons.enovasions_vms_integration.tools import vsdc_client
+from odoo.addons.enovasions_vms_integration.tools.vsdc_client import (
+    CircuitBreaker, VsdcConnectionError, VsdcOutcomeUnknown, VsdcUnavailable,
+)
+
+Response = namedtuple('Response', ['status', 'data'])
+
+
+class FakeTime:
+    """Clock of the client: ``sleep`` only moves ``monotonic`` forward."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeHttp:
+    """Answers each request with the next outcome: a response, or an exception to raise."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class TestVsdcClient(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.clock = FakeTime()
+        for patcher in (patch.object(vsdc_client, 'time', self.clock), patch.dict(vsdc_client._breakers, clear=True)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.policy = vsdc_client.DEFAULT_POLICY._replace(max_retries=2)
+
+    def _post(self, http, key):
+        return vsdc_client.post(http, 'https://vsdc.test/api/v3/invoices', '{}', {}, key, self.policy)
+
+    def _fail(self, breaker, times):
+        for _i in range(times):
+            breaker.before_call()
+            breaker.record_failure()
+
+    # ********* Circuit breaker *********
+    def test_breaker_opens_after_threshold(self):
+        breaker = CircuitBreaker()
+        self._fail(breaker, vsdc_client.FAILURE_THRESHOLD - 1)
+        self.assertFalse(breaker.is_open)
+        breaker.before_call()
+
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        with self.assertRaises(VsdcUnavailable):
+            breaker.before_call()
+
+    def test_breaker_half_open_lets_one_trial_through(self):
+        breaker = CircuitBreaker()
+        self._fail(breaker, vsdc_client.FAILURE_THRESHOLD)
+        self.clock.now += vsdc_client.RESET_TIMEOUT
+        self.assertFalse(breaker.is_open)
+
+        breaker.before_call()  # the trial
+        with self.assertRaises(VsdcUnavailable):
+            breaker.before_call()
+
+        breaker.record_success()
+        self.assertEqual(breaker.failures, 0)
+        breaker.before_call()
+
+    def test_breaker_failed_trial_reopens(self):
+        breaker = CircuitBreaker()
+        self._fail(breaker, vsdc_client.FAILURE_THRESHOLD)
+        self.clock.now += vsdc_client.RESET_TIMEOUT
+        breaker.before_call()
+        breaker.record_failure()
+        self.assertTrue(breaker.is_open)
+        with self.assertRaises(VsdcUnavailable):
+            breaker.before_call()
+
+    def test_backoff_is_capped_full_jitter(self):
+        for attempt in range(10):
+            ceiling = min(self.policy.backoff_cap, self.policy.backoff_base * 2 ** attempt)
+            for _i in range(20):
+                delay = vsdc_client._backoff(self.policy, attempt)
+                self.assertGreaterEqual(delay, 0)
+                self.assertLessEqual(delay, ceiling)
+
+    # ********* Retries *********
+    def test_post_retries_connection_errors(self):
+        http = FakeHttp(NewConnectionError(None, 'refused'), Response(201, b'{}'))
+        response = self._post(http, 'retry-connect')
+        self.assertEqual(response.status, 201)
+        self.assertEqual(http.calls, 2)
+        self.assertEqual(len(self.clock.sleeps), 1)
+        self.assertEqual(vsdc_client.get_breaker('retry-connect').failures, 0)
+
+    def test_post_gives_up_on_503(self):
+        http = FakeHttp(*[Response(503, b'')] * 3)
+        with self.assertRaises(VsdcConnectionError) as caught:
+            self._post(http, 'retry-503')
+        self.assertNotIsInstance(caught.exception, VsdcOutcomeUnknown)
+        self.assertEqual(http.calls, self.policy.max_retries + 1)
+
+    def test_post_never_retries_unknown_outcomes(self):
+        for key, outcome in [
+            ('unknown-500', Response(500, b'')),
+            ('unknown-read', ReadTimeoutError(None, '/api/v3/invoices', 'read timed out')),
+            ('unknown-protocol', ProtocolError('Connection aborted.')),
+        ]:
+            http = FakeHttp(outcome, Response(201, b'{}'))
+            with self.assertRaises(VsdcOutcomeUnknown):
+                self._post(http, key)
+            self.assertEqual(http.calls, 1, "%s must not be resent" % key)
+            self.assertEqual(vsdc_client.get_breaker(key).failures, 1)
+
+    def test_post_returns_client_errors(self):
+        http = FakeHttp(Response(400, b'{"message": "bad"}'))
+        self.assertEqual(self._post(http, 'client-error').status, 400)
+        self.assertEqual(http.calls, 1)
+
+    def test_post_fails_fast_while_open(self):
+        breaker = vsdc_client.get_breaker('open-circuit')
+        self._fail(breaker, vsdc_client.FAILURE_THRESHOLD)
+        http = FakeHttp()
+        with self.assertRaises(VsdcUnavailable):
+            self._post(http, 'open-circuit')
+        self.assertEqual(http.calls, 0)
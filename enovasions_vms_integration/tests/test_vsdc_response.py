@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import json
+from datetime import datetime
+
+from odoo.tests.common import BaseCase
+
+from odoo.addons.enovasions_vms_integration.tools import vsdc_response
+
+
+class TestVsdcResponse(BaseCase):
+
+    def test_parse_drops_qr_and_bad_input(self):
+        raw = json.dumps({'invoiceNumber': 'ABC-1', vsdc_response.QR_KEY: 'iVBOR'})
+        self.assertEqual(vsdc_response.parse(raw), {'invoiceNumber': 'ABC-1'})
+        for raw in (None, '', 'not json', '[1, 2]'):
+            self.assertEqual(vsdc_response.parse(raw), {})
+
+    def test_sdc_values(self):
+        values = vsdc_response.sdc_values({
+            'invoiceNumber': 'ABC-1',
+            'invoiceCounter': '12/40NS',
+            'sdcDateTime': '2025-03-01T10:30:00+12:00',
+            'totalAmount': 115,
+        })
+        self.assertEqual(values, {
+            'sdc_invoice_number': 'ABC-1',
+            'sdc_date_time': datetime(2025, 2, 28, 22, 30),
+            'sdc_invoice_counter': '12/40NS',
+            'sdc_total_amount': 115.0,
+        })
+
+    def test_total_amount_coercion(self):
+        for total, expected in [('115.50', 115.5), (7, 7.0), (None, 0.0), ('', 0.0), ('n/a', 0.0)]:
+            self.assertEqual(vsdc_response.sdc_values({'totalAmount': total})['sdc_total_amount'], expected, total)
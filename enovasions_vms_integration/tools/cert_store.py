@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Process-wide store of the SSL contexts built from branch PFX certificates.
+
+The PFX is decrypted once per worker, straight from the ``pfx_file``
+attachment, and the resulting context is kept in memory keyed by the
+attachment checksum. A new certificate has a new checksum, so every worker
+misses the cache on its next send; nothing is written to or read from a
+shared disk.
+"""
+import hashlib
+import logging
+import os
+import ssl
+import threading
+from collections import OrderedDict
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.serialization import pkcs12
+
+_logger = logging.getLogger(__name__)
+
+# contexts kept per worker; one per branch certificate in use
+MAX_CONTEXTS = 64
+
+_lock = threading.RLock()
+_contexts = OrderedDict()
+
+
+def cache_key(checksum, password):
+    """Key of a certificate: its PFX checksum, salted with the password that opens it."""
+    return hashlib.sha256(('%s:%s' % (checksum, password or '')).encode('utf-8')).hexdigest()
+
+
+def pfx_to_pem(pfx_data, password):
+    """Decrypt a PFX and return ``(certificate chain PEM, unencrypted private key PEM)``."""
+    private_key, certificate, additional_certificates = pkcs12.load_key_and_certificates(
+        pfx_data, password=(password or '').encode('utf-8'))
+    if not private_key or not certificate:
+        raise ValueError("The PFX file holds no certificate or private key.")
+    cert_pem = b''.join(
+        cert.public_bytes(serialization.Encoding.PEM)
+        for cert in [certificate] + list(additional_certificates or [])
+    )
+    key_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    return cert_pem, key_pem
+
+
+def _load_cert_chain(context, pem):
+    """``SSLContext.load_cert_chain`` only reads files: hand it an anonymous
+    in-memory file, so the unencrypted key is never written to disk."""
+    if not hasattr(os, 'memfd_create'):
+        raise RuntimeError("VSDC certificates can only be loaded where os.memfd_create is available (Linux).")
+    fd = os.memfd_create('vsdc-cert', os.MFD_CLOEXEC)
+    try:
+        os.write(fd, pem)
+        context.load_cert_chain('/proc/self/fd/%d' % fd)
+    finally:
+        os.close(fd)
+
+
+def get_ssl_context(checksum, password, load_pfx):
+    """Return the client SSL context of a PFX, decrypting it on a miss.
+
+    ``load_pfx`` returns the raw PFX bytes; it is only called on a miss.
+    """
+    key = cache_key(checksum, password)
+    with _lock:
+        context = _contexts.get(key)
+        if context is not None:
+            _contexts.move_to_end(key)
+            return context
+        cert_pem, key_pem = pfx_to_pem(load_pfx(), password)
+        context = ssl.create_default_context()
+        _load_cert_chain(context, cert_pem + key_pem)
+        _contexts[key] = context
+        while len(_contexts) > MAX_CONTEXTS:
+            _contexts.popitem(last=False)
+        _logger.info("SSL context loaded for certificate %s", checksum[:12])
+        return context
+
+
+def discard(checksum, password):
+    """Forget the context of a certificate that was replaced."""
+    with _lock:
+        _contexts.pop(cache_key(checksum, password), None)
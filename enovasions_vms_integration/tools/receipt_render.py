@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""Fixed-width rendering of the 80mm FRCS receipt without QWeb nor wkhtmltopdf.
+
+The receipt is described by a plain dict (see
+``account.move._get_thermal_receipt_data``) and laid out once as monospace
+lines, which are then emitted as HTML or ESC/POS. ESC/POS prints the QR with
+the printer's native QR command from the verification URL; HTML embeds the
+PNG returned by the VSDC.
+"""
+import base64
+import html
+
+WIDTH = 42  # characters per line of Font A on 80mm paper
+
+ESC = b'\x1b'
+GS = b'\x1d'
+
+
+def _pair(left, right, width):
+    left, right = str(left), str(right)
+    space = width - len(left) - len(right)
+    if space < 1:
+        # long values go on their own lines, wrapped to the paper width
+        return [left[:width]] + [right[i:i + width].rjust(width) for i in range(0, len(right), width)]
+    return [left + ' ' * space + right]
+
+
+def _center(text, width):
+    return str(text)[:width].center(width).rstrip()
+
+
+def _rule(char, width, title=''):
+    if not title:
+        return char * width
+    return (' %s ' % title).center(width, char)
+
+
+def _money(value):
+    return '%.2f' % (value or 0.0)
+
+
+def receipt_lines(receipt, width=WIDTH):
+    """Lay the receipt out as ``(text, bold)`` lines of at most ``width`` chars."""
+    lines = []
+
+    def add(text, bold=False):
+        lines.append((text, bold))
+
+    fiscal = receipt.get('fiscal')
+    add(_rule('=', width, 'FISCAL INVOICE' if fiscal else 'NOT A FISCAL INVOICE'), True)
+    if receipt.get('copy'):
+        add(_rule('=', width, 'COPY'), True)
+    if receipt.get('pending_sequence'):
+        add(_rule('=', width, 'PENDING FISCALIZATION'), True)
+        add(_center('Offline receipt no. %s' % receipt['pending_sequence'], width))
+    for key in ('tin', 'business_name', 'address'):
+        if receipt.get(key):
+            add(_center(receipt[key], width))
+    for label, key in (('Cashier:', 'cashier'), ('Buyer:', 'buyer'),
+                       ('POS Number:', 'pos_number'), ('POS Time:', 'pos_time')):
+        for text in _pair(label, receipt.get(key) or '', width):
+            add(text)
+    add(_rule('-', width, receipt.get('mode_label') or ''))
+    add(_center('Items', width))
+    add(_rule('=', width))
+    for item in receipt.get('items', []):
+        name = item['name'] + (' (A)' if item.get('taxed') else '')
+        add(name[:width])
+        detail = '%s x %s' % (_money(item['price_unit']), '%.0f' % (item['quantity'] or 0))
+        for text in _pair('  ' + detail, _money(item['subtotal']), width):
+            add(text)
+    add(_rule('-', width))
+    for text in _pair('Total Purchase:', _money(receipt.get('total')), width):
+        add(text, True)
+    for name, amount in receipt.get('payments', []):
+        for text in _pair('%s:' % (name or 'Other'), _money(amount), width):
+            add(text)
+    add(_rule('=', width))
+    tax_items = receipt.get('tax_items', [])
+    if tax_items:
+        for tax in tax_items:
+            left = '%s %s %s%%' % (tax.get('label', ''), tax.get('categoryName', ''), tax.get('rate', '0.00'))
+            for text in _pair(left, _money(tax.get('amount')), width):
+                add(text)
+        for text in _pair('Total Tax:', _money(sum(tax.get('amount') or 0.0 for tax in tax_items)), width):
+            add(text)
+        add(_rule('=', width))
+    for label, key in (('SDC Time:', 'sdc_time'), ('SDC Invoice No:', 'sdc_invoice_number'),
+                       ('Invoice Counter:', 'invoice_counter')):
+        for text in _pair(label, receipt.get(key) or '', width):
+            add(text)
+    add(_rule('=', width))
+    return lines
+
+
+def _footer(receipt, width):
+    return _rule('=', width, 'END OF FISCAL INVOICE' if receipt.get('fiscal') else 'END OF NON-FISCAL INVOICE')
+
+
+def render_html(receipt, width=WIDTH):
+    """Return a self-contained HTML receipt, the QR inlined as a data URI."""
+    body = '\n'.join(
+        '<b>%s</b>' % html.escape(text) if bold else html.escape(text)
+        for text, bold in receipt_lines(receipt, width)
+    )
+    qr = ''
+    if receipt.get('qr_png'):
+        qr = '<img alt="QR" style="width:55mm;height:55mm;display:block;margin:8px auto" src="data:image/png;base64,%s"/>' % (
+            base64.b64encode(receipt['qr_png']).decode())
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"/><style>'
+        'body{margin:0;width:72mm}pre{font:13px/1.35 "DejaVu Sans Mono",monospace;margin:0;white-space:pre}'
+        '</style></head><body><pre>%s</pre>%s<pre>%s</pre></body></html>'
+    ) % (body, qr, html.escape(_footer(receipt, width)))
+
+
+def _escpos_qr(data):
+    """GS ( k: store ``data`` as a model 2 QR, module size 6, level M, and print it."""
+    payload = data.encode('utf-8')
+    store_len = len(payload) + 3
+    return b''.join([
+        GS + b'(k\x04\x00\x31\x41\x32\x00',  # model 2
+        GS + b'(k\x03\x00\x31\x43\x06',  # module size
+        GS + b'(k\x03\x00\x31\x45\x31',  # error correction M
+        GS + b'(k' + bytes([store_len % 256, store_len // 256]) + b'\x31\x50\x30' + payload,
+        GS + b'(k\x03\x00\x31\x51\x30',  # print
+    ])
+
+
+def render_escpos(receipt, width=WIDTH, encoding='cp437'):
+    """Return the receipt as ESC/POS bytes, ending with a partial cut."""
+    out = [ESC + b'@', ESC + b'a\x00']
+    for text, bold in receipt_lines(receipt, width):
+        line = text.encode(encoding, 'replace') + b'\n'
+        out.append(ESC + b'E\x01' + line + ESC + b'E\x00' if bold else line)
+    if receipt.get('qr_url'):
+        out += [ESC + b'a\x01', _escpos_qr(receipt['qr_url']), b'\n', ESC + b'a\x00']
+    out += [_footer(receipt, width).encode(encoding, 'replace'), b'\n\n\n\n', GS + b'V\x01']
+    return b''.join(out)
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+"""VSDC HTTP client with bounded timeouts, jittered retries and a circuit
+breaker per branch system.
+
+A hung or failing VSDC must not pin Odoo workers: every call is bounded by
+connect/read timeouts, and after repeated failures calls for that branch fail
+fast until the breaker lets a trial request through again.
+
+Only failures where the VSDC certainly never received the invoice are
+retried: connection errors, connect timeouts and 503 answers. A read timeout,
+a dropped connection or any other 5xx may come after the invoice was signed,
+so it raises ``VsdcOutcomeUnknown`` and must be settled before a resend,
+otherwise the fiscal counter could be incremented twice.
+"""
+import logging
+import random
+import threading
+import time
+from collections import namedtuple
+
+from urllib3 import Timeout
+from urllib3.exceptions import ConnectTimeoutError, HTTPError, NewConnectionError
+
+from odoo import _
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+RetryPolicy = namedtuple('RetryPolicy', [
+    'connect_timeout', 'read_timeout', 'max_retries', 'backoff_base', 'backoff_cap',
+])
+
+DEFAULT_POLICY = RetryPolicy(connect_timeout=5.0, read_timeout=30.0, max_retries=2, backoff_base=0.5, backoff_cap=8.0)
+
+# consecutive failures that open the breaker, and how long it stays open
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 60.0
+
+# errors raised before the request reached the VSDC, and the only status
+# telling the VSDC did not process it
+NOT_SENT_ERRORS = (NewConnectionError, ConnectTimeoutError)
+RETRY_STATUS = 503
+
+
+class VsdcConnectionError(UserError):
+    """The VSDC could not be reached at all: no HTTP response was received."""
+
+
+class VsdcUnavailable(VsdcConnectionError):
+    """Raised without any network call while a branch's circuit is open."""
+
+
+class VsdcOutcomeUnknown(UserError):
+    """The request may have reached the VSDC but no usable answer came back:
+    the invoice must not be sent again until the outcome is settled."""
+
+
+class CircuitBreaker:
+    """Closed → open after FAILURE_THRESHOLD failures → half-open after RESET_TIMEOUT."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+
+    def before_call(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = RESET_TIMEOUT - (time.monotonic() - self.opened_at)
+            if remaining > 0 or self.trial_running:
+                raise VsdcUnavailable(_(
+                    "The VSDC is unreachable, submissions are paused for %s more seconds.",
+                    max(int(remaining), 1)))
+            # half-open: let exactly one trial request through
+            self.trial_running = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.trial_running or self.failures >= FAILURE_THRESHOLD:
+                self.opened_at = time.monotonic()
+            self.trial_running = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None and time.monotonic() - self.opened_at < RESET_TIMEOUT
+
+
+_breakers_lock = threading.Lock()
+_breakers = {}
+
+
+def get_breaker(key):
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker()
+        return breaker
+
+
+def _backoff(policy, attempt):
+    # "full jitter": spread retries of concurrent workers over the whole window
+    return random.uniform(0, min(policy.backoff_cap, policy.backoff_base * (2 ** attempt)))
+
+
+def post(http, url, body, headers, breaker_key, policy=DEFAULT_POLICY):
+    """POST ``body``, retrying only while the VSDC certainly did not receive it.
+
+    Responses below 500 are returned as-is for the caller to interpret.
+    Raises ``VsdcConnectionError`` once the retries of a connection failure
+    or 503 are exhausted, and ``VsdcOutcomeUnknown`` right away when the
+    request may have been processed (read timeout, dropped connection, other 5xx).
+    """
+    breaker = get_breaker(breaker_key)
+    timeout = Timeout(connect=policy.connect_timeout, read=policy.read_timeout)
+    error = None
+    for attempt in range(policy.max_retries + 1):
+        breaker.before_call()
+        try:
+            response = http.request("POST", url, body=body, headers=headers, timeout=timeout, retries=False)
+        except NOT_SENT_ERRORS as e:
+            breaker.record_failure()
+            error = e
+            _logger.warning("VSDC unreachable (attempt %s/%s): %s", attempt + 1, policy.max_retries + 1, e)
+        except (HTTPError, OSError) as e:
+            breaker.record_failure()
+            _logger.warning("VSDC call interrupted, outcome unknown: %s", e)
+            raise VsdcOutcomeUnknown(_(
+                "The VSDC did not answer (%s); the invoice may have been fiscalized.", e)) from e
+        else:
+            if response.status < 500:
+                breaker.record_success()
+                return response
+            breaker.record_failure()
+            if response.status != RETRY_STATUS:
+                _logger.warning("VSDC answered %s, outcome unknown", response.status)
+                raise VsdcOutcomeUnknown(_(
+                    "The VSDC answered %s; the invoice may have been fiscalized.", response.status))
+            error = _("VSDC answered %s", response.status)
+            _logger.warning("VSDC answered %s (attempt %s/%s)", response.status, attempt + 1, policy.max_retries + 1)
+        if attempt < policy.max_retries:
+            time.sleep(_backoff(policy, attempt))
+    raise VsdcConnectionError(_("Could not reach the VSDC: %s", error))
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Process-wide registry of keep-alive VSDC connection pools.
+
+Building an SSL context and a PoolManager for every receipt costs a full
+mTLS handshake per send. Pools are kept per worker process, keyed by
+database and branch system, and tagged with the certificate fingerprint
+so a newly uploaded certificate misses the cache in every worker.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from urllib3 import PoolManager
+
+_logger = logging.getLogger(__name__)
+
+# connections kept alive per VSDC host and branch system
+POOL_MAXSIZE = 4
+
+# default of branch.systems.vsdc_url
+INVOICE_URL = "https://vsdc.sandbox.vms.frcs.org.fj/api/v3/invoices"
+
+_lock = threading.RLock()
+_pools = {}
+
+
+def get_pool_manager(dbname, system_id, fingerprint, context_factory):
+    """Return the warm PoolManager of a branch system, building it on a miss.
+
+    ``context_factory`` returns the client SSL context; it is only called on a miss.
+    """
+    key = (dbname, system_id)
+    with _lock:
+        entry = _pools.get(key)
+        if entry and entry[0] == fingerprint:
+            return entry[1]
+        if entry:
+            entry[1].clear()
+        http = PoolManager(ssl_context=context_factory(), maxsize=POOL_MAXSIZE)
+        _pools[key] = (fingerprint, http)
+        _logger.info("VSDC connection pool created for system %s (db %s)", system_id, dbname)
+        return http
+
+
+def invalidate(dbname, system_id=None):
+    """Drop the pools of one branch system, or of every system of a database."""
+    with _lock:
+        for key in list(_pools):
+            if key[0] == dbname and system_id in (None, key[1]):
+                _pools.pop(key)[1].clear()
+
+
+def submit_many(calls, max_workers=8, per_key_limit=2):
+    """Run ``(key, callable)`` pairs on a thread pool, at most ``per_key_limit``
+    at a time for the same key (branch system).
+
+    Returns one ``(result, exception)`` tuple per call, in input order. The
+    callables must not touch the ORM: they run outside the request cursor.
+    """
+    if not calls:
+        return []
+    semaphores = {key: threading.BoundedSemaphore(per_key_limit) for key, call in calls}
+
+    def run(key, call):
+        with semaphores[key]:
+            try:
+                return call(), None
+            except Exception as e:
+                return None, e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(calls)))) as executor:
+        futures = [executor.submit(run, key, call) for key, call in calls]
+        return [future.result() for future in futures]
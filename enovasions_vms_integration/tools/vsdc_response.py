@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Parsing of raw VSDC invoice responses into what the database keeps."""
+import json
+from datetime import datetime, timezone
+
+# kept out of the parsed response: it is stored once in frcs.qr.code
+QR_KEY = 'verificationQRCode'
+
+
+def parse(raw):
+    """Return the response as a dict without its QR; {} when empty or invalid."""
+    if not raw:
+        return {}
+    try:
+        data = json.loads(raw)
+    except (ValueError, TypeError):
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    data.pop(QR_KEY, None)
+    return data
+
+
+def sdc_datetime(data):
+    """``sdcDateTime`` of a parsed response as a naive UTC datetime, or False."""
+    value = data.get('sdcDateTime')
+    if not value:
+        return False
+    try:
+        return datetime.fromisoformat(value).astimezone(timezone.utc).replace(tzinfo=None)
+    except ValueError:
+        return False
+
+
+def sdc_values(data):
+    """The hot keys of a parsed response, as typed values of the ``sdc_*`` columns."""
+    try:
+        # the VSDC may send the amount as a number or as a numeric string
+        total = float(data.get('totalAmount') or 0.0)
+    except (TypeError, ValueError):
+        total = 0.0
+    return {
+        'sdc_invoice_number': data.get('invoiceNumber') or False,
+        'sdc_date_time': sdc_datetime(data),
+        'sdc_invoice_counter': data.get('invoiceCounter') or False,
+        'sdc_total_amount': total,
+    }
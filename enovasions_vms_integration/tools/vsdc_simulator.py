@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""Local VSDC simulator for development and load tests.
+
+Serves ``POST /api/v3/invoices`` with responses shaped like the FRCS
+sandbox (``invoiceNumber``, ``sdcDateTime``, ``invoiceCounter``,
+``verificationQRCode``, ``taxItems``...) and can inject latency and errors.
+Only the standard library is needed::
+
+    python3 vsdc_simulator.py --port 8443 \\
+        --certfile server.pem --keyfile server.key --client-ca client-ca.pem \\
+        --latency-ms 150 --jitter-ms 50 --error-rate 0.05
+
+Then set the branch system's VSDC URL to
+``https://localhost:8443/api/v3/invoices``. The Odoo host must trust the
+simulator's server certificate (e.g. ``SSL_CERT_FILE``); without
+``--certfile`` the simulator speaks plain HTTP, and without ``--client-ca``
+client certificates are not verified.
+"""
+import argparse
+import base64
+import json
+import logging
+import random
+import ssl
+import struct
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_logger = logging.getLogger('vsdc_simulator')
+
+INVOICE_PATH = '/api/v3/invoices'
+
+# invoiceCounterExtension per (invoiceType, transactionType)
+COUNTER_EXTENSIONS = {
+    ('Normal', 'Sale'): 'NS', ('Normal', 'Refund'): 'NR',
+    ('Proforma', 'Sale'): 'PS', ('Proforma', 'Refund'): 'PR',
+    ('Copy', 'Sale'): 'CS', ('Copy', 'Refund'): 'CR',
+    ('Training', 'Sale'): 'TS', ('Training', 'Refund'): 'TR',
+    ('Advance', 'Sale'): 'AS', ('Advance', 'Refund'): 'AR',
+}
+
+
+def _png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+
+def placeholder_qr_png(seed, modules=29, scale=4):
+    """Return a black and white PNG that looks like a QR code (not decodable)."""
+    rng = random.Random(seed)
+    size = modules * scale
+    rows = []
+    for y in range(modules):
+        bits = [rng.random() < 0.5 for _x in range(modules)]
+        row = bytes([0]) + bytes(0 if bit else 255 for bit in bits for _s in range(scale))
+        rows.extend([row] * scale)
+    header = struct.pack('>IIBBBBB', size, size, 8, 0, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', header)
+            + _png_chunk(b'IDAT', zlib.compress(b''.join(rows))) + _png_chunk(b'IEND', b''))
+
+
+class Simulator:
+    def __init__(self, options):
+        self.options = options
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.total = 0
+        self.sdc_id = options.sdc_id
+
+    def next_counter(self, extension):
+        with self.lock:
+            self.total += 1
+            self.counters[extension] = self.counters.get(extension, 0) + 1
+            return self.counters[extension], self.total
+
+    def build_response(self, request):
+        invoice_type = request.get('invoiceType') or 'Normal'
+        transaction_type = request.get('transactionType') or 'Sale'
+        extension = COUNTER_EXTENSIONS.get((invoice_type, transaction_type), 'NS')
+        type_counter, total_counter = self.next_counter(extension)
+
+        tax_items = {}
+        total_amount = 0.0
+        for item in request.get('items') or []:
+            amount = float(item.get('totalAmount') or 0.0)
+            total_amount += amount
+            for label in item.get('labels') or []:
+                rate = self.options.tax_rate
+                tax = tax_items.setdefault(label, {
+                    'label': label, 'categoryName': 'VAT', 'categoryType': 0, 'rate': rate, 'amount': 0.0,
+                })
+                tax['amount'] += amount * rate / (100.0 + rate)
+        for tax in tax_items.values():
+            tax['amount'] = round(tax['amount'], 4)
+
+        invoice_number = '%s-%s-%s' % (self.sdc_id, self.sdc_id, total_counter)
+        qr_png = placeholder_qr_png(invoice_number)
+        return {
+            'requestedBy': self.sdc_id,
+            'signedBy': self.sdc_id,
+            'sdcDateTime': datetime.now(timezone.utc).astimezone().isoformat(timespec='milliseconds'),
+            'invoiceCounter': '%s/%s%s' % (type_counter, total_counter, extension),
+            'invoiceCounterExtension': extension,
+            'invoiceNumber': invoice_number,
+            'taxItems': list(tax_items.values()),
+            'verificationUrl': 'https://vsdc.sandbox.vms.frcs.org.fj/v/?vl=%s' % uuid.uuid4().hex,
+            'verificationQRCode': base64.b64encode(qr_png).decode(),
+            'journal': '',
+            'messages': 'Success',
+            'signature': base64.b64encode(uuid.uuid4().bytes).decode(),
+            'encryptedInternalData': base64.b64encode(uuid.uuid4().bytes).decode(),
+            'totalCounter': total_counter,
+            'transactionTypeCounter': type_counter,
+            'totalAmount': round(total_amount, 2),
+            'taxGroupRevision': 1,
+            'businessName': self.options.business_name,
+            'tin': self.options.tin,
+            'locationName': self.options.business_name,
+            'address': self.options.address,
+            'district': '',
+            'mrc': '',
+        }
+
+
+def make_handler(simulator):
+    options = simulator.options
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, fmt, *args):
+            _logger.info("%s %s", self.address_string(), fmt % args)
+
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip('/') == '/api/v3/status':
+                return self._reply(200, {'status': 'OK', 'sdcId': simulator.sdc_id})
+            return self._reply(404, {'message': 'Not found'})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length)
+            if self.path.split('?')[0].rstrip('/') != INVOICE_PATH:
+                return self._reply(404, {'message': 'Not found'})
+
+            delay = max(options.latency_ms + random.uniform(-options.jitter_ms, options.jitter_ms), 0)
+            time.sleep(delay / 1000.0)
+
+            roll = random.random()
+            if roll < options.drop_rate:
+                # drop the connection without answering, like a crashed VSDC
+                self.close_connection = True
+                self.connection.shutdown(2)
+                return
+            if roll < options.drop_rate + options.error_rate:
+                return self._reply(options.error_status, {'message': 'Simulated VSDC failure'})
+
+            if not self.headers.get('PAC'):
+                return self._reply(401, {'message': 'PAC header is missing'})
+            try:
+                request = json.loads(raw or b'{}')
+            except ValueError:
+                return self._reply(400, {'message': 'Invalid JSON'})
+            return self._reply(200, simulator.build_response(request))
+
+    return Handler
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8443)
+    parser.add_argument('--certfile', help="server certificate (PEM); plain HTTP when omitted")
+    parser.add_argument('--keyfile', help="server private key (PEM)")
+    parser.add_argument('--client-ca', help="CA bundle used to require and verify client certificates")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="added delay per invoice")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="random +/- spread on the delay")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="share of requests answered with --error-status")
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--drop-rate', type=float, default=0.0, help="share of connections closed without answer")
+    parser.add_argument('--tax-rate', type=float, default=15.0, help="rate applied to every tax label")
+    parser.add_argument('--sdc-id', default='SIMULATR')
+    parser.add_argument('--tin', default='000000000')
+    parser.add_argument('--business-name', default='VSDC Simulator')
+    parser.add_argument('--address', default='Suva, Fiji')
+    return parser.parse_args(argv)
+
+
+def serve(options):
+    server = ThreadingHTTPServer((options.host, options.port), make_handler(Simulator(options)))
+    scheme = 'http'
+    if options.certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(options.certfile, options.keyfile)
+        if options.client_ca:
+            context.verify_mode = ssl.CERT_REQUIRED
+            context.load_verify_locations(options.client_ca)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+    _logger.info("VSDC simulator listening on %s://%s:%s%s", scheme, options.host, options.port, INVOICE_PATH)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    serve(parse_args())